@@ -0,0 +1,129 @@
+"""Side by side throughput of the sync and the async database paths
+
+Each mode runs in its own process (DATABASE_MODE is read on import), on a
+temporary copy of the schema filled with synthetic orders, driving the
+ASGI app in-process with many concurrent clients.
+
+    python benchmarks/async_vs_sync.py --clients 32 --seconds 10
+
+Failed requests (like pool timeouts) are counted as errors.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+def seed(orders: int):
+    """Method to fill the temporary database, returning a transport token
+
+    Every order belongs to the same user and transport company, so the
+    order list of the token has all of them
+    """
+    from core.authentication import generate_token
+    from seed import generate
+
+    generate(orders, users=1, transports=1, products=50)
+    return generate_token({"id": 2, "role": "TRANSPORT"})
+
+
+async def drive(app, token: str, clients: int, seconds: float):
+    """Method to run concurrent clients against the app for some seconds"""
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    urls = ["/api/v1/order?limit=20", "/api/v1/order/1"]
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(n: int, http):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await http.get(urls[n % len(urls)], headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        started = time.perf_counter()
+        await asyncio.gather(*[client(n, http) for n in range(clients)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def run_mode(args):
+    """Method executed inside the child process of a single mode"""
+    sys.path.insert(0, ROOT)
+    token = seed(args.orders)
+
+    import main
+
+    async def run():
+        async with main.lifespan(main.app):
+            return await drive(main.app, token, args.clients, args.seconds)
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def compare():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--mode", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args)
+
+    results = {}
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as workdir:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--mode", mode]
+                + ["--clients", str(args.clients), "--seconds", str(args.seconds)]
+                + ["--orders", str(args.orders)],
+                cwd=workdir,
+                # Every client shares the same account, past its admission budget
+                env={**os.environ, "DATABASE_MODE": mode, "RATE_LIMIT_ENABLED": "0"},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            results[mode] = json.loads(output.splitlines()[-1])
+
+    print(
+        f"{'mode':<8}{'requests':>10}{'errors':>8}"
+        f"{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for mode, result in results.items():
+        print(
+            f"{mode:<8}{result['requests']:>10}{result['errors']:>8}"
+            f"{result['rps']:>10.1f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    compare()
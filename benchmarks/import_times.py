@@ -0,0 +1,114 @@
+"""Import time of the app, per module and per package
+
+The 'import' phase of the worker startup (see core/startup.py) is the
+time to import main.py. This runs the import on a new interpreter with
+python -X importtime, and reports where it goes: the self time of each
+top level package, the cumulative time of each module of the app (with
+the dependencies it imports first), and the slowest modules.
+
+    python benchmarks/import_times.py
+    python benchmarks/import_times.py --top 40
+    python benchmarks/import_times.py --module core.jobs
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages of this repository, the others are dependencies
+APP_PACKAGES = ("main", "core", "routers")
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(module: str = "main"):
+    """Method to measure the import of a module and of everything it imports,
+    on a new interpreter, so nothing is imported beforehand
+
+    Args:
+        module (str, optional): module to import, main.py by default
+
+    Raises:
+        RuntimeError: the module failed to import
+
+    Returns:
+        list: name, self seconds, cumulative seconds and depth of each module
+            imported, in the order their imports finished
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = [
+        (name, int(own) / 1e6, int(cumulative) / 1e6, len(indent) // 2)
+        for own, cumulative, indent, name in IMPORT_TIME.findall(result.stderr)
+    ]
+    # A module is listed after everything it imported, and the interpreter
+    # startup (site, encodings) is listed before the module
+    end = max(
+        index
+        for index, (name, _, _, depth) in enumerate(modules)
+        if name == module and depth == 0
+    )
+    start = end
+    while start > 0 and modules[start - 1][3] > 0:
+        start -= 1
+    return modules[start : end + 1]
+
+
+def package_times(modules: list):
+    """Method to sum the self time of the modules of each top level package
+
+    Args:
+        modules (list): result of import_times
+
+    Returns:
+        list: package, seconds and number of modules, slowest first
+    """
+    packages = defaultdict(lambda: [0.0, 0])
+    for name, own, _, _ in modules:
+        package = packages[name.split(".")[0]]
+        package[0] += own
+        package[1] += 1
+    return sorted(
+        ((name, seconds, count) for name, (seconds, count) in packages.items()),
+        key=lambda package: -package[1],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--top", type=int, default=20, help="rows of each table")
+    args = parser.parse_args()
+
+    modules = import_times(args.module)
+    total = modules[-1][2]
+    print(f"{args.module} imported in {total * 1000:.0f}ms, {len(modules)} modules\n")
+
+    print(f"{'package':32} {'self ms':>9} {'share':>6} {'modules':>8}")
+    for name, seconds, count in package_times(modules)[: args.top]:
+        print(f"{name:32} {seconds * 1000:9.1f} {seconds / total:6.1%} {count:8}")
+
+    print(f"\n{'app module':32} {'self ms':>9} {'cumulative ms':>14}")
+    app = [module for module in modules if module[0].split(".")[0] in APP_PACKAGES]
+    for name, own, cumulative, _ in sorted(app, key=lambda module: -module[2])[: args.top]:
+        print(f"{name:32} {own * 1000:9.1f} {cumulative * 1000:14.1f}")
+
+    print(f"\n{'slowest module':48} {'self ms':>9}")
+    for name, own, _, _ in sorted(modules, key=lambda module: -module[1])[: args.top]:
+        print(f"{name:48} {own * 1000:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
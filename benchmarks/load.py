@@ -0,0 +1,410 @@
+"""Load test of every router of routers/v1
+
+Fills a temporary database with benchmarks/seed.py, then drives each
+endpoint in turn through the ASGI app, in-process, with concurrent
+clients, reporting the latency percentiles, the throughput and the SQL
+statements per request of each scenario.
+
+    python benchmarks/load.py                                  # report only
+    python benchmarks/load.py --save-baseline benchmarks/baseline.json
+    python benchmarks/load.py --baseline benchmarks/baseline.json
+
+With --baseline, exits with code 1 when any scenario regressed: more
+errors, more SQL statements per request, or latency/throughput worse
+than the tolerance. The statements per request do not depend on the
+machine, the timings do: benchmarks/baseline.json was measured on a
+single CPU, save a new one on the machine running the comparisons.
+Baselines are only comparable with the same options, stored with them.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from seed import generate, SEED_PASSWORD  # noqa: E402
+
+# name, method, request builder, accepted statuses, share of --requests,
+# and if it runs bcrypt, limiting the clients to what the hashing pool accepts
+Scenario = namedtuple(
+    "Scenario", "name method build accepted share bcrypt", defaults=[False]
+)
+
+# Options that must match with the baseline to compare
+COMPARABLE = (
+    "orders", "users", "transports", "products", "requests", "concurrency", "seed", "only",
+    "archive_days",
+)
+# Statements per request allowed above the baseline, the caches add some
+# noise, while a N+1 adds at least one statement per request
+QUERIES_MARGIN = 0.5
+
+
+class State:
+    """Data of the seeded database, shared by the request builders"""
+
+    def __init__(self, args):
+        from core.authentication import generate_token
+
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.deleted = 0
+        self._tokens = {}
+        self._generate_token = generate_token
+
+    def user_id(self):
+        return self.rng.randint(1, self.args.users)
+
+    def transport_id(self):
+        return self.args.users + self.rng.randint(1, self.args.transports)
+
+    def headers(self, id: int, role: str):
+        """Method to get the auth header of an account, without the login"""
+        if id not in self._tokens:
+            self._tokens[id] = self._generate_token({"id": id, "role": role})
+        return {"Authorization": f"Bearer {self._tokens[id]}"}
+
+    def user(self):
+        return self.headers(self.user_id(), "USER")
+
+    def transport(self):
+        return self.headers(self.transport_id(), "TRANSPORT")
+
+    def product(self):
+        return self.rng.randint(1, self.args.products)
+
+    def order(self):
+        return self.rng.randint(1, self.args.orders)
+
+
+def product_body(state: State):
+    return {"name": "load", "description": "load test", "price": state.rng.randint(1, 100)}
+
+
+ADDRESS = dict(
+    complement="", street="Rua 1", house_number="1", neighborhood="Centro",
+    city="Sao Paulo", state="SP", CEP="01001-000",
+)
+
+
+def new_account(state: State):
+    body = dict(
+        name="load",
+        email=f"load{state.rng.getrandbits(48)}@example.com",
+        password=SEED_PASSWORD,
+        **ADDRESS,
+    )
+    return "/api/v1/account/user", {"json": body}
+
+
+def delete_product(state: State):
+    # Runs after product_create, deleting the products created by it
+    state.deleted += 1
+    return f"/api/v1/product/{state.args.products + state.deleted}", {"headers": state.user()}
+
+
+def bulk_products(state: State):
+    lines = "".join(json.dumps(product_body(state)) + "\n" for _ in range(100))
+    headers = {**state.user(), "Content-Type": "application/x-ndjson"}
+    return "/api/v1/product/bulk", {"content": lines, "headers": headers}
+
+
+def poll_order(state: State):
+    from routers.v1.order import order_etag
+
+    id = state.order()
+    headers = {**state.user(), "If-None-Match": order_etag(id, 1)}
+    return f"/api/v1/order/{id}", {"headers": headers}
+
+
+SCENARIOS = [
+    Scenario(
+        "login", "POST",
+        lambda s: ("/api/v1/login", {"json": {
+            "email": f"user{s.user_id()}@example.com", "password": SEED_PASSWORD,
+        }}),
+        {200}, 0.1, True,
+    ),
+    Scenario("account_create", "POST", new_account, {201}, 0.1, True),
+    Scenario("account_me", "GET", lambda s: ("/api/v1/account", {"headers": s.user()}), {200}, 1),
+    Scenario(
+        "product_list", "GET",
+        lambda s: (f"/api/v1/product?sort=price&min_price={s.rng.randint(1, 150)}",
+                   {"headers": s.user()}),
+        {200}, 1,
+    ),
+    Scenario(
+        "product_detail", "GET",
+        lambda s: (f"/api/v1/product/{s.product()}", {"headers": s.user()}), {200}, 1,
+    ),
+    Scenario(
+        "product_search", "GET",
+        lambda s: (f"/api/v1/product/search?q=product {s.rng.randint(1, 99)}",
+                   {"headers": s.user()}),
+        {200}, 1,
+    ),
+    Scenario(
+        "product_create", "POST",
+        lambda s: ("/api/v1/product", {"json": product_body(s), "headers": s.user()}),
+        {201}, 0.5,
+    ),
+    Scenario(
+        "product_update", "PUT",
+        lambda s: (f"/api/v1/product/{s.product()}",
+                   {"json": product_body(s), "headers": s.user()}),
+        {200}, 0.5,
+    ),
+    Scenario("product_delete", "DELETE", delete_product, {204}, 0.5),
+    Scenario("product_bulk", "POST", bulk_products, {200}, 0.1),
+    Scenario(
+        "product_export", "GET",
+        lambda s: ("/api/v1/product/export", {"headers": s.user()}), {200}, 0.1,
+    ),
+    Scenario(
+        "order_list_user", "GET",
+        lambda s: ("/api/v1/order?limit=20", {"headers": s.user()}), {200}, 1,
+    ),
+    Scenario(
+        "order_list_transport", "GET",
+        lambda s: ("/api/v1/order?limit=50&sort=recent", {"headers": s.transport()}),
+        {200}, 1,
+    ),
+    Scenario(
+        "order_history", "GET",
+        lambda s: ("/api/v1/order?limit=20&sort=recent&include_archived=true",
+                   {"headers": s.user()}),
+        {200}, 1,
+    ),
+    Scenario(
+        "order_detail", "GET",
+        lambda s: (f"/api/v1/order/{s.order()}", {"headers": s.user()}), {200}, 1,
+    ),
+    Scenario(
+        "order_available", "GET",
+        lambda s: ("/api/v1/order/available?limit=10", {"headers": s.transport()}),
+        {200}, 1,
+    ),
+    # Clients polling an order they already have, most of them never changed
+    Scenario(
+        "order_poll", "GET", poll_order, {200, 304}, 1,
+    ),
+    Scenario(
+        "order_summary", "GET",
+        lambda s: ("/api/v1/order/summary", {"headers": s.transport()}), {200}, 1,
+    ),
+    Scenario(
+        "order_create", "POST",
+        lambda s: ("/api/v1/order", {
+            "json": {
+                "items": [{"product_id": s.product(), "quantity": 2}, s.product()],
+                "transport_id": s.transport_id(),
+            },
+            "headers": s.user(),
+        }),
+        {200}, 0.5,
+    ),
+    # A random order mostly belongs to another transport company (404), or
+    # cannot take the transition anymore (409)
+    Scenario(
+        "order_advance", "PATCH",
+        lambda s: (f"/api/v1/order/{s.order()}/advance", {"headers": s.transport()}),
+        {200, 404, 409}, 0.5,
+    ),
+    Scenario(
+        "order_cancel", "PATCH",
+        lambda s: (f"/api/v1/order/{s.order()}/cancel", {"headers": s.transport()}),
+        {200, 404, 409}, 0.5,
+    ),
+    Scenario(
+        "order_batch", "PATCH",
+        lambda s: ("/api/v1/order/batch", {
+            "json": {"ids": [s.order() for _ in range(100)], "status": 3},
+            "headers": s.transport(),
+        }),
+        {200}, 0.1,
+    ),
+]
+
+
+def percentile(values: list, percent: float):
+    """Method to get a percentile (nearest rank) of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def total_queries():
+    """Method to get the SQL statements counted by the metrics so far"""
+    from core.metrics import registry
+
+    return sum(metrics.queries.sum for metrics in registry.routes.values())
+
+
+async def run_scenario(http, scenario: Scenario, state: State, args):
+    """Method to send the requests of a scenario with concurrent clients
+
+    Returns:
+        dict: requests, errors, rps, p50/p95/p99 in ms and queries per request
+    """
+    from core.passwords import password_hasher
+
+    concurrency = args.concurrency
+    if scenario.bcrypt:
+        concurrency = min(concurrency, password_hasher.capacity)
+    total = max(int(args.requests * scenario.share), concurrency)
+    pending = total
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal pending, errors
+        while pending > 0:
+            pending -= 1
+            path, kwargs = scenario.build(state)
+            started = time.perf_counter()
+            response = await http.request(scenario.method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code not in scenario.accepted:
+                errors += 1
+
+    queries = total_queries()
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries": (total_queries() - queries) / total,
+    }
+
+
+async def run(args):
+    """Method to run every scenario, in order, against the app"""
+    import httpx
+    import main
+
+    state = State(args)
+    results = {}
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as http:
+            for scenario in SCENARIOS:
+                if args.only and scenario.name not in args.only:
+                    continue
+                results[scenario.name] = await run_scenario(http, scenario, state, args)
+                print_result(scenario.name, results[scenario.name])
+    return results
+
+
+def print_result(name: str, result: dict):
+    print(
+        f"{name:<22}{result['requests']:>7}{result['errors']:>7}{result['rps']:>9.1f}"
+        f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+        f"{result['queries']:>9.2f}"
+    )
+
+
+def regressions(results: dict, baseline: dict, tolerance: float):
+    """Method to compare the results with a baseline
+
+    Args:
+        results (dict): results of this run, per scenario
+        baseline (dict): results stored by --save-baseline, per scenario
+        tolerance (float): allowed relative loss of the median latency and
+            the throughput, the p95 latency is allowed twice of it
+
+    Returns:
+        list: description of each regression
+    """
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["errors"] > before["errors"]:
+            found.append(f"{name}: {result['errors']} errors, was {before['errors']}")
+        # statements per request do not depend on the machine
+        if result["queries"] > before["queries"] + QUERIES_MARGIN:
+            found.append(
+                f"{name}: {result['queries']:.2f} queries/request, was {before['queries']:.2f}"
+            )
+        if result["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            found.append(f"{name}: p50 {result['p50_ms']:.1f}ms, was {before['p50_ms']:.1f}ms")
+        # the tail is noisier than the median, allowing twice the tolerance
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance * 2):
+            found.append(f"{name}: p95 {result['p95_ms']:.1f}ms, was {before['p95_ms']:.1f}ms")
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            found.append(f"{name}: {result['rps']:.1f} req/s, was {before['rps']:.1f}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--transports", type=int, default=10)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=400, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="*", help="names of the scenarios to run")
+    parser.add_argument("--baseline", help="json to compare with")
+    parser.add_argument("--save-baseline", help="json to store the results")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument(
+        "--archive-days", type=int,
+        help="archive the finished orders older than these days before the load",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_PATH"] = os.path.join(directory, "load.db")
+        # Every client shares one ip and a few accounts, the admission
+        # budgets would refuse most of the load
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+        sys.path.insert(0, ROOT)
+        generate(args.orders, args.users, args.transports, args.products, seed=args.seed)
+        if args.archive_days is not None:
+            from core.archive import archive_orders
+            from core.database import engine
+
+            archive_orders(engine, args.archive_days, pause=0)
+
+        print(
+            f"{'scenario':<22}{'reqs':>7}{'errors':>7}{'req/s':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>9}"
+        )
+        results = asyncio.run(run(args))
+
+    options = {name: getattr(args, name) for name in COMPARABLE}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({"options": options, "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["options"] != options:
+            sys.exit(f"options differ from the baseline: {baseline['options']}")
+
+        found = regressions(results, baseline["results"], args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
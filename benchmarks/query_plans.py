@@ -0,0 +1,255 @@
+"""Query plan regression check of the endpoints
+
+Every endpoint is called in-process against a temporary database, built
+by the migrations, while all the SQL sent to sqlite is recorded. Each
+statement is then explained with EXPLAIN QUERY PLAN, and the check fails
+when any of them reads a whole table (SCAN without an index) or sorts
+the rows on a temporary b-tree, instead of following an index.
+
+    python benchmarks/query_plans.py            # exit code 1 on regressions
+    python benchmarks/query_plans.py --verbose  # print every plan
+
+Every call must answer its expected status, and tests/test_query_plans.py
+runs the check with the rest of the tests.
+
+Scans and sorts that are expected (ALLOWED) need a reason.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (endpoint, statement pattern, plan pattern): reason
+ALLOWED = {
+    ("GET /api/v1/product", r"ORDER BY product\.id", r"SCAN product$|USE TEMP B-TREE"): (
+        "id order with a price range: walks the rowid or sorts only the range"
+    ),
+    ("GET /api/v1/product/export", r"", r"SCAN product$"): "exports the whole catalog",
+    ("GET /api/v1/product/search", r"MATCH", r"USE TEMP B-TREE"): (
+        "ranking sorts only the products matching the search"
+    ),
+    ("GET /api/v1/order/available", r"cep_prefix", r"USE TEMP B-TREE"): (
+        "groups only the payed orders of the transport company, by their address"
+    ),
+}
+
+SKIPPED = re.compile(r"^\s*(PRAGMA|CREATE|DROP|ALTER|BEGIN|COMMIT|ROLLBACK)", re.I)
+
+
+def record(engines: list):
+    """Method to record the statements sent by the engines
+
+    Args:
+        engines (list): engines to listen
+
+    Returns:
+        dict: state, with the current endpoint and the recorded statements
+    """
+    from sqlalchemy import event
+
+    state = {"endpoint": None, "statements": []}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if many:
+            parameters = parameters[0] if parameters else ()
+        if state["endpoint"] and not SKIPPED.match(statement):
+            state["statements"].append((state["endpoint"], statement, parameters))
+
+    for bind in engines:
+        event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    return state
+
+
+def drive(client, state: dict):
+    """Method to call every endpoint, with enough data to reach every query"""
+
+    def call(method: str, path: str, expected: int = 200, **kwargs):
+        # An endpoint failing before its queries would record nothing and pass
+        state["endpoint"] = f"{method} {path.split('?')[0]}"
+        response = client.request(method, path, **kwargs)
+        state["endpoint"] = None
+        assert response.status_code == expected, (
+            f"{method} {path}: HTTP {response.status_code}, expected {expected}\n"
+            f"{response.text[:500]}"
+        )
+        return response
+
+    address = dict(
+        complement="", street="s", house_number="1", neighborhood="Centro",
+        city="SP", state="SP", CEP="01001-000",
+    )
+    tokens = {}
+    for kind in ("user", "transport"):
+        email = f"{kind}@example.com"
+        body = dict(name=kind, email=email, password="secret1", **address)
+        call("POST", f"/api/v1/account/{kind}", 201, json=body)
+        response = call(
+            "POST", "/api/v1/login", json=dict(email=email, password="secret1")
+        )
+        tokens[kind] = {"Authorization": "Bearer " + response.json()["access_token"]}
+    user, transport = tokens["user"], tokens["transport"]
+    transport_id = call("GET", "/api/v1/account", headers=transport).json()["id"]
+
+    # Catalog
+    for price in (10, 20, 30):
+        product = dict(name=f"p{price}", description="-", price=price)
+        call("POST", "/api/v1/product", 201, json=product, headers=user)
+    call(
+        "POST", "/api/v1/product/bulk",
+        content='{"name": "bulk", "description": "-", "price": 1}\n'
+        '{"id": 1, "name": "p10", "description": "-", "price": 10}\n',
+        headers={**user, "Content-Type": "application/x-ndjson"},
+    )
+    call("PUT", "/api/v1/product/3", json=dict(name="p", description="-", price=3), headers=user)
+    call("GET", "/api/v1/product/1", headers=user)
+    call("GET", "/api/v1/product/export", headers=user)
+    cursor = call("GET", "/api/v1/product/search?q=p&limit=1", headers=user).headers.get(
+        "X-Next-Cursor"
+    )
+    call("GET", f"/api/v1/product/search?q=p&limit=1&after={cursor}", headers=user)
+    for sort in ("id", "price"):
+        path = f"/api/v1/product?limit=1&sort={sort}&min_price=1&max_price=100"
+        cursor = call("GET", path, headers=user).headers.get("X-Next-Cursor")
+        call("GET", f"{path}&after={cursor}", headers=user)
+        call("GET", f"{path}&stream=true", headers=user)
+    call("DELETE", "/api/v1/product/4", 204, headers=user)
+
+    # Orders
+    for items in ([1, 2], [{"product_id": 2, "quantity": 3}], [3]):
+        order = dict(items=items, transport_id=transport_id)
+        call("POST", "/api/v1/order", json=order, headers=user)
+    for headers in (user, transport):
+        for sort in ("status", "recent"):
+            for filters in ("", "&status=0&created_from=2000-01-01T00:00:00"):
+                path = f"/api/v1/order?limit=1&sort={sort}{filters}"
+                cursor = call("GET", path, headers=headers).headers.get("X-Next-Cursor")
+                call("GET", f"{path}&after={cursor}", headers=headers)
+                call("GET", f"{path}&stream=true", headers=headers)
+                path += "&include_archived=true"
+                cursor = call("GET", path, headers=headers).headers.get("X-Next-Cursor")
+                call("GET", f"{path}&after={cursor}", headers=headers)
+                call("GET", f"{path}&stream=true", headers=headers)
+    call("GET", "/api/v1/order/1", headers=user)
+    call("GET", "/api/v1/order/999", 404, headers=user)
+    for archived in ("false", "true"):
+        path = f"/api/v1/order?limit=1&include_archived={archived}"
+        etag = call("GET", path, headers=user).headers["ETag"]
+        call("GET", path, 304, headers={**user, "If-None-Match": etag})
+    call("GET", "/api/v1/order/1", headers={**user, "If-None-Match": '"none"'})
+    call("GET", "/api/v1/order/999", 404, headers={**user, "If-None-Match": '"none"'})
+    call("GET", "/api/v1/order/summary?from_month=2000-01", headers=transport)
+    call("PATCH", "/api/v1/order/1/advance", headers=transport)
+    call("PATCH", "/api/v1/order/2/cancel", headers=transport)
+    call("PATCH", "/api/v1/order/batch", json={"ids": [1, 2, 3], "status": 2}, headers=transport)
+    for filters in ("", "&cep=01001"):
+        path = f"/api/v1/order/available?limit=1&digits=3{filters}"
+        call("GET", path, headers=transport)
+        call("GET", f"{path}&after=WyIwMDAiLCIiXQ", headers=transport)
+
+    # Jobs enqueued by the writes above, run here instead of on the workers
+    from core.jobs import job_workers, load_handlers
+
+    load_handlers()
+    state["endpoint"] = "jobs"
+    job_workers.next_run_at()
+    job_workers.run_once()
+    job_workers.lines()
+    state["endpoint"] = None
+
+
+def problems(plan: list):
+    """Method to find the full scans and temporary sorts of a query plan
+
+    Args:
+        plan (list): rows of EXPLAIN QUERY PLAN
+
+    Returns:
+        list: detail of each problem
+    """
+    return [
+        row[3]
+        for row in plan
+        if row[3].startswith("USE TEMP B-TREE")
+        or re.match(r"SCAN (?!CONSTANT ROW)\S+$", row[3])
+    ]
+
+
+def is_allowed(endpoint: str, statement: str, detail: str):
+    """Method to check if a problem is expected, on ALLOWED"""
+    return any(
+        endpoint == allowed and re.search(query, statement) and re.search(plan, detail)
+        for allowed, query, plan in ALLOWED
+    )
+
+
+def check(path: str, statements: list, verbose: bool):
+    """Method to explain every recorded statement
+
+    Args:
+        path (str): database file
+        statements (list): (endpoint, statement, parameters)
+        verbose (bool): print every plan
+
+    Returns:
+        int: number of regressions found
+    """
+    connection = sqlite3.connect(path)
+    seen, failures = set(), 0
+    for endpoint, statement, parameters in statements:
+        if (endpoint, statement) in seen:
+            continue
+        seen.add((endpoint, statement))
+        plan = connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+
+        found = [
+            detail
+            for detail in problems(plan)
+            if not is_allowed(endpoint, statement, detail)
+        ]
+        failures += len(found)
+        if verbose or found:
+            print(f"{'FAIL' if found else 'ok  '} {endpoint}")
+            print("     " + " ".join(statement.split()))
+            for row in plan:
+                print(f"       {row[3]}")
+    connection.close()
+    print(f"{len(seen)} statements explained, {failures} regressions")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "plans.db")
+        os.environ["DATABASE_PATH"] = path
+        os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+        os.environ["JOBS_WORKERS"] = "0"
+        sys.path.insert(0, ROOT)
+
+        from fastapi.testclient import TestClient
+        from core.database import engine, read_engine
+        from core.migrations import migrate
+        import main as app
+
+        migrate()
+
+        state = record([engine, read_engine])
+        with TestClient(app.app) as client:
+            drive(client, state)
+        failures = check(path, state["statements"], args.verbose)
+        engine.dispose()
+        read_engine.dispose()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Synthetic data generator
+
+Fills an empty database with accounts, addresses, products, orders and
+order items. The same seed always generates the same data.
+
+    python benchmarks/seed.py --database /tmp/load.db --orders 100000
+
+Every account has the password SEED_PASSWORD, the users are
+user<n>@example.com and the transport companies transport<n>@example.com.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED_PASSWORD = "secret123"
+BATCH_SIZE = 10000
+
+NEIGHBORHOODS = ["Centro", "Jardins", "Mooca", "Pinheiros", "Lapa", "Tatuape", "Butanta"]
+CITIES = [("Sao Paulo", "SP"), ("Campinas", "SP"), ("Santos", "SP"), ("Curitiba", "PR")]
+STATUSES = [-1, 0, 1, 2, 3, 4]
+STATUS_WEIGHTS = [1, 3, 2, 2, 2, 5]
+# Orders are created on the year before this date, fixed to keep the data reproducible
+LAST_ORDER_DATE = datetime(2024, 12, 31)
+
+
+def batches(rows, size: int = BATCH_SIZE):
+    """Method to split a generator of rows into lists of up to size rows"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(
+    orders: int = 100000,
+    users: int = 1000,
+    transports: int = 20,
+    products: int = 2000,
+    max_items: int = 5,
+    seed: int = 42,
+):
+    """Method to fill the database of DATABASE_PATH with synthetic data
+
+    Args:
+        orders (int, optional): number of orders
+        users (int, optional): number of customer accounts
+        transports (int, optional): number of transport companies
+        products (int, optional): number of products
+        max_items (int, optional): max items of an order, at least 1
+        seed (int, optional): seed of the random generator
+
+    Raises:
+        RuntimeError: the database already has accounts
+
+    Returns:
+        dict: number of rows generated on each table
+    """
+    from sqlalchemy import insert
+
+    from core.database import SessionLocal
+    from core.migrations import migrate
+    from core.models import Account, Address, Product, Order, OrderItem
+    from core.security import password_context
+    from core.summary import rebuild
+
+    migrate()
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        if db.query(Account.id).first():
+            raise RuntimeError("the database is not empty")
+
+        # A single hash for every account, bcrypt is too slow to run per row
+        password = password_context().hash(SEED_PASSWORD)
+        accounts = [
+            dict(id=id, name=f"user {id}", email=f"user{id}@example.com", role="USER")
+            for id in range(1, users + 1)
+        ] + [
+            dict(
+                id=users + n,
+                name=f"transport {n}",
+                email=f"transport{n}@example.com",
+                role="TRANSPORT",
+            )
+            for n in range(1, transports + 1)
+        ]
+        for batch in batches(accounts):
+            db.execute(insert(Account), [{**row, "password": password} for row in batch])
+
+        def addresses():
+            for account in accounts:
+                city, state = rng.choice(CITIES)
+                yield dict(
+                    account_id=account["id"],
+                    complement="",
+                    street=f"Rua {rng.randint(1, 500)}",
+                    house_number=str(rng.randint(1, 3000)),
+                    neighborhood=rng.choice(NEIGHBORHOODS),
+                    city=city,
+                    state=state,
+                    CEP=f"{rng.randint(1000, 99999):05d}-{rng.randint(0, 999):03d}",
+                )
+
+        for batch in batches(addresses()):
+            db.execute(insert(Address), batch)
+
+        prices = [round(rng.uniform(1, 200), 2) for _ in range(products)]
+        for batch in batches(
+            dict(id=id, name=f"product {id}", description=f"description {id}", price=price)
+            for id, price in enumerate(prices, start=1)
+        ):
+            db.execute(insert(Product), batch)
+        names = {account["id"]: account["name"] for account in accounts}
+
+        # Orders and their items, spread over a year
+        items = 0
+        for batch in batches(range(1, orders + 1)):
+            order_rows, item_rows = [], []
+            for id in batch:
+                chosen = rng.sample(range(1, products + 1), rng.randint(1, max_items))
+                quantities = [rng.randint(1, 3) for _ in chosen]
+                user_id = rng.randint(1, users)
+                transport_id = users + rng.randint(1, transports)
+                order_rows.append(
+                    dict(
+                        id=id,
+                        user_id=user_id,
+                        transport_id=transport_id,
+                        customer_name=names[user_id],
+                        transport_name=names[transport_id],
+                        status=rng.choices(STATUSES, STATUS_WEIGHTS)[0],
+                        total_price=round(
+                            sum(prices[p - 1] * q for p, q in zip(chosen, quantities)), 2
+                        ),
+                        created_at=LAST_ORDER_DATE
+                        - timedelta(seconds=rng.randint(0, 365 * 86400)),
+                    )
+                )
+                item_rows += [
+                    dict(
+                        order_id=id,
+                        product_id=p,
+                        quantity=q,
+                        product_name=f"product {p}",
+                        product_description=f"description {p}",
+                        unit_price=prices[p - 1],
+                    )
+                    for p, q in zip(chosen, quantities)
+                ]
+            db.execute(insert(Order), order_rows)
+            db.execute(insert(OrderItem), item_rows)
+            items += len(item_rows)
+
+        rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "accounts": len(accounts),
+        "products": products,
+        "orders": orders,
+        "items": items,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="sqlite file to fill")
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transports", type=int, default=20)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--max-items", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.abspath(args.database)
+    sys.path.insert(0, ROOT)
+
+    started = time.perf_counter()
+    counts = generate(
+        args.orders, args.users, args.transports, args.products, args.max_items, args.seed
+    )
+    print(
+        ", ".join(f"{count} {table}" for table, count in counts.items())
+        + f" generated in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
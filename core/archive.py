@@ -0,0 +1,217 @@
+"""Archive of the finished orders
+
+Delivered (4) and refused (-1) orders never change again, but while they
+stay on the order table every order list walks over them. The archive
+moves the ones older than ARCHIVE_AFTER_DAYS to the order_archive and
+orderItem_archive tables, on the same database file, in batches: each
+batch copies and deletes its orders on a single transaction, so an order
+is always on exactly one of the tables. The order lists read only the
+order table, unless include_archived is asked for. The summary counts
+the archived orders too, it is not changed.
+
+    python -m core.archive                # orders older than ARCHIVE_AFTER_DAYS
+    python -m core.archive --days 30
+    python -m core.archive status         # orders on each table
+    python -m core.jobs enqueue archive_orders '{"days": 30}'   # on the job workers
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Engine, delete, func, insert, literal, or_, select
+
+from core.jobs import job
+from core.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# Age of the finished orders moved to the archive
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+# Orders moved per transaction, the write lock is held for one batch only
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# Pause between the batches, so the requests waiting to write go first
+ARCHIVE_PAUSE_SECONDS = float(os.getenv("ARCHIVE_PAUSE_SECONDS", "0.05"))
+
+# Statuses that never change again
+ARCHIVED_STATUSES = (4, -1)
+
+# Columns copied from the hot tables
+ORDER_COLUMNS = [
+    "id",
+    "user_id",
+    "transport_id",
+    "total_price",
+    "created_at",
+    "customer_name",
+    "transport_name",
+    "status",
+    "version",
+]
+ITEM_COLUMNS = [
+    "order_id",
+    "product_id",
+    "quantity",
+    "product_name",
+    "product_description",
+    "unit_price",
+]
+
+
+def order_models(archived: bool = False):
+    """Method to get the models of the hot or the archived orders
+
+    Args:
+        archived (bool, optional): the archive tables
+
+    Returns:
+        tuple: order and order item models
+    """
+    return (ArchivedOrder, ArchivedOrderItem) if archived else (Order, OrderItem)
+
+
+def may_be_archived(order_status):
+    """Method to check if the orders of a status filter can be on the archive
+
+    Args:
+        order_status (int): status filter, None for every status
+
+    Returns:
+        bool: True if the archive must be read too
+    """
+    return order_status is None or order_status in ARCHIVED_STATUSES
+
+
+def archive_batch(connection, cutoff: datetime, after: int, last_id: int, size: int):
+    """Method to move one batch of finished orders, and their items, to the archive,
+    inside the current transaction
+
+    Args:
+        connection: connection of the writer engine, inside a transaction
+        cutoff (datetime): only orders created before this date
+        after (int): only orders with a greater id, the last of the previous batch
+        last_id (int): only orders with a lower id
+        size (int): max number of orders
+
+    Returns:
+        list: ids of the orders moved
+    """
+    ids = connection.scalars(
+        select(Order.id)
+        .where(
+            Order.id > after,
+            Order.id < last_id,
+            Order.status.in_(ARCHIVED_STATUSES),
+            # orders created before the created_at column existed are the oldest
+            or_(Order.created_at < cutoff, Order.created_at.is_(None)),
+        )
+        .order_by(Order.id)
+        .limit(size)
+    ).all()
+    if not ids:
+        return ids
+
+    connection.execute(
+        insert(ArchivedOrder).from_select(
+            ORDER_COLUMNS + ["archived_at"],
+            select(
+                *(getattr(Order, column) for column in ORDER_COLUMNS),
+                literal(datetime.utcnow()),
+            ).where(Order.id.in_(ids)),
+        )
+    )
+    # The items get new ids, the ones of the hot table may be reused by sqlite
+    connection.execute(
+        insert(ArchivedOrderItem).from_select(
+            ITEM_COLUMNS,
+            select(*(getattr(OrderItem, column) for column in ITEM_COLUMNS)).where(
+                OrderItem.order_id.in_(ids)
+            ),
+        )
+    )
+    connection.execute(delete(OrderItem).where(OrderItem.order_id.in_(ids)))
+    connection.execute(delete(Order).where(Order.id.in_(ids)))
+    return ids
+
+
+def archive_orders(
+    bind: Engine,
+    days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pause: float = ARCHIVE_PAUSE_SECONDS,
+):
+    """Method to move every finished order older than some days to the archive
+
+    The order with the greatest id is never moved: sqlite gives the next
+    order the greatest id plus one, and an archived id must not come back.
+
+    Args:
+        bind (Engine): writer engine of the database
+        days (int, optional): age of the orders moved
+        batch_size (int, optional): orders moved per transaction
+        pause (float, optional): seconds between the batches
+
+    Returns:
+        int: number of orders moved
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    with bind.connect() as connection:
+        last_id = connection.scalar(select(func.max(Order.id)))
+    if last_id is None:
+        return 0
+
+    moved, after = 0, 0
+    while True:
+        with bind.begin() as connection:
+            ids = archive_batch(connection, cutoff, after, last_id, batch_size)
+        if not ids:
+            return moved
+        moved += len(ids)
+        after = ids[-1]
+        time.sleep(pause)
+
+
+@job("archive_orders", max_attempts=3)
+def archive_job(payload: dict):
+    # Run by the workers of core/jobs.py, the batches already keep the write lock short
+    from core.database import engine
+
+    archive_orders(engine, payload.get("days", ARCHIVE_AFTER_DAYS))
+
+
+def count_orders(bind: Engine):
+    """Method to count the orders on the hot and on the archive tables
+
+    Args:
+        bind (Engine): engine of the database
+
+    Returns:
+        dict: number of orders of each table
+    """
+    with bind.connect() as connection:
+        return {
+            model.__tablename__: connection.scalar(select(func.count()).select_from(model))
+            for model in (Order, ArchivedOrder)
+        }
+
+
+if __name__ == "__main__":
+    from core.database import engine
+    from core.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Archive of the finished orders")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "status"])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    migrate()
+    if args.command == "status":
+        for table, orders in count_orders(engine).items():
+            print(f"{table}: {orders} orders")
+    else:
+        started = time.perf_counter()
+        moved = archive_orders(engine, args.days, args.batch_size)
+        print(
+            f"{moved} orders older than {args.days} days archived "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
@@ -1,11 +1,15 @@
+import os
+import time
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 
-from core.database import get_db
-from core.schemas import TokenData, AccountSchema
+from core.cache import LRUCache
+from core.database import get_read_db, get_async_db
+from core.schemas import TokenData, AccountSchema, PrincipalSchema
 from core.models import Account
 
 
@@ -13,8 +17,16 @@ SECRET_KEY = "uvSSJExH1P2IdF3sL4xId3O7jB_vFM9sIHxCDe_1uVw"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# token -> decoded claims, never kept after the token expires
+token_cache = LRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+# account id -> PrincipalSchema, dropped by invalidate_account
+principal_cache = LRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
 
 def generate_token(
     data: dict,
@@ -30,18 +42,121 @@ def generate_token(
     return encoded_jwt
 
 
+def decode_token(token: str):
+    """Method to get the claims of a token, decoding it only once
+
+    Args:
+        token (str): jwt access token
+
+    Raises:
+        JWTError: Invalid or expired token
+
+    Returns:
+        dict: claims of the token ('id' and 'role')
+    """
+    claims = token_cache.get(token)
+    if claims is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        claims = {"id": payload.get("id"), "role": payload.get("role")}
+
+        # The cached claims must not outlive the token itself
+        ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+        if ttl > 0:
+            token_cache.set(token, claims, ttl=ttl)
+    return claims
+
+
+def invalidate_account(account_id: int):
+    """Method to drop the cached principal, must be called when an account changes
+
+    Args:
+        account_id (int): id of the changed account
+    """
+    principal_cache.pop(account_id)
+
+
+def get_claims(token: str):
+    """Method to get the claims of the token received on the header
+
+    Args:
+        token (str): jwt access token
+
+    Raises:
+        HTTPException: Invalid token - HTTP 401
+
+    Returns:
+        dict: claims of the token ('id' and 'role')
+    """
+    try:
+        return decode_token(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid auth credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def cache_principal(account: Account):
+    """Method to keep the principal of an account found on the database
+
+    Args:
+        account (Account): account of the token, or None
+
+    Returns:
+        PrincipalSchema: logged account, or None if it does not exist anymore
+    """
+    if not account:
+        return None
+    user = PrincipalSchema.model_validate(account, from_attributes=True)
+    principal_cache.set(account.id, user)
+    return user
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid auth credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user = db.query(Account).filter(Account.id == payload.get("id")).first()
-        return user
-    except JWTError:
-        raise credentials_exception
+    """Method to get the logged account from the token,
+    the account table is read only when the principal is not cached yet
+
+    Args:
+        token (str, optional): jwt access token on the header
+        db (Session, optional): database session
+
+    Raises:
+        HTTPException: Invalid token - HTTP 401
+
+    Returns:
+        PrincipalSchema: logged account, or None if it does not exist anymore
+    """
+    claims = get_claims(token)
+    user = principal_cache.get(claims["id"])
+    if user is None:
+        account = db.query(Account).filter(Account.id == claims["id"]).first()
+        user = cache_principal(account)
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Async version of get_current_user, for the routers on the async engine
+
+    Args:
+        token (str, optional): jwt access token on the header
+        db (AsyncSession, optional): async database session
+
+    Raises:
+        HTTPException: Invalid token - HTTP 401
+
+    Returns:
+        PrincipalSchema: logged account, or None if it does not exist anymore
+    """
+    claims = get_claims(token)
+    user = principal_cache.get(claims["id"])
+    if user is None:
+        account = await db.get(Account, claims["id"])
+        user = cache_principal(account)
+    return user
@@ -3,6 +3,10 @@ from fastapi import HTTPException, status
 from core.schemas import AccountSchema
 
 
+# Both checks read only the role, so they run on the cached principal
+# returned by get_current_user, without touching the database
+
+
 def is_user(user: AccountSchema):
     if not user:
         raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT)
@@ -0,0 +1,318 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from core.models import CatalogVersion
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+# How long a worker trusts its own catalog version before reading the
+# version stamp again, this is the max staleness between workers
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "1"))
+
+
+class LRUCache:
+    """Thread safe LRU cache with a size bound and an optional TTL"""
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Method to get a value, counting hits and misses
+
+        Args:
+            key: key of the entry
+
+        Returns:
+            the cached value, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl: float = None):
+        """Method to store a value, evicting the least recently used entry
+
+        Args:
+            key: key of the entry
+            value: value to store
+            ttl (float, optional): seconds to keep this entry, overriding the default
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Method to remove a single entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Method to remove all the entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Method to get the counters of the cache
+
+        Returns:
+            dict: size, max size, hits and misses
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class CachedResponse:
+    """Serialized response body, with its strong ETag and extra headers"""
+
+    def __init__(self, body: bytes, headers: dict = None):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.headers = headers or {}
+
+    def to_response(self, request: Request, cache_status: str):
+        """Method to build the http response, answering 304 if the client has it
+
+        Args:
+            request (Request): request, to read the If-None-Match header
+            cache_status (str): HIT or MISS, sent on the X-Cache header
+
+        Returns:
+            Response: 304 without body, or 200 with the cached body
+        """
+        headers = {**self.headers, "ETag": self.etag, "X-Cache": cache_status}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(
+            content=self.body, media_type="application/json", headers=headers
+        )
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """Method to check if an If-None-Match header matches with an ETag
+
+    Args:
+        if_none_match (str): value of the header, may have many tags or '*'
+        etag (str): current ETag of the resource
+
+    Returns:
+        bool: True if the client already has the current version
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def version_etag(kind: str, versions):
+    """Method to build a strong ETag from the version stamps of the records
+    of a response, known before the response is built
+
+    Args:
+        kind (str): name of the resource, like 'order'
+        versions: (id, version) of each record of the response
+
+    Returns:
+        str: ETag of the response
+    """
+    raw = ",".join(f"{id}.{version}" for id, version in versions).encode()
+    return f'"{kind}-' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+
+
+def not_modified(etag: str, headers: dict = None):
+    """Method to answer that the client already has the current version
+
+    Args:
+        etag (str): current ETag of the resource
+        headers (dict, optional): other headers of the full response
+
+    Returns:
+        Response: HTTP 304 without body
+    """
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers={**(headers or {}), "ETag": etag}
+    )
+
+
+class CatalogCache:
+    """Cache of serialized product responses, tied to the catalog version
+
+    Every write to the catalog bumps the version stamp stored in the
+    database (in the same transaction) and clears the local entries.
+    Other workers notice the new stamp within CATALOG_VERSION_CHECK_SECONDS,
+    so between checks a cache hit costs no query at all.
+    """
+
+    def __init__(self, maxsize: int, check_interval: float):
+        self.entries = LRUCache(maxsize)
+        self.check_interval = check_interval
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def check_due(self):
+        """Method to know if the version stamp must be read again"""
+        return (
+            self.version is None
+            or time.monotonic() - self._checked_at >= self.check_interval
+        )
+
+    def refresh(self, version: int):
+        """Method to apply the version stamp just read, dropping old entries
+
+        Args:
+            version (int): version read from the database
+        """
+        with self._lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            self._checked_at = time.monotonic()
+
+    def current_version(self, db: Session):
+        """Method to get the catalog version, reading the stamp if it is too old
+
+        Args:
+            db (Session): database session, used only when the check is due
+
+        Returns:
+            int: current catalog version
+        """
+        if self.check_due():
+            self.refresh(read_catalog_version(db))
+        return self.version
+
+    def get(self, db: Session, key):
+        """Method to get a cached response of the current catalog version
+
+        Args:
+            db (Session): database session
+            key: key of the response
+
+        Returns:
+            tuple: cached response (or None) and the version it refers to
+        """
+        version = self.current_version(db)
+        return self.entries.get(key), version
+
+    async def get_async(self, db: AsyncSession, key):
+        """Async version of get, for the routers on the async engine
+
+        Args:
+            db (AsyncSession): async database session
+            key: key of the response
+
+        Returns:
+            tuple: cached response (or None) and the version it refers to
+        """
+        if self.check_due():
+            self.refresh(await read_catalog_version_async(db))
+        return self.entries.get(key), self.version
+
+    def set(self, key, value: CachedResponse, version: int):
+        """Method to store a response, unless the catalog changed meanwhile
+
+        Args:
+            key: key of the response
+            value (CachedResponse): serialized response
+            version (int): catalog version read before building the response
+        """
+        if version == self.version:
+            self.entries.set(key, value)
+
+    def invalidate(self, version: int):
+        """Method to drop every entry after a write on the catalog
+
+        Args:
+            version (int): new catalog version, already committed
+        """
+        with self._lock:
+            self.entries.clear()
+            self.version = version
+            self._checked_at = time.monotonic()
+
+    def stats(self):
+        """Method to get the counters of the cache"""
+        return {**self.entries.stats(), "version": self.version}
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE, CATALOG_VERSION_CHECK_SECONDS)
+
+
+def read_catalog_version(db: Session):
+    """Method to read the catalog version stamp
+
+    Args:
+        db (Session): database session
+
+    Returns:
+        int: current version, 0 if the catalog was never changed
+    """
+    version = (
+        db.query(CatalogVersion.version).filter(CatalogVersion.id == 1).scalar()
+    )
+    return version or 0
+
+
+async def read_catalog_version_async(db: AsyncSession):
+    """Async version of read_catalog_version
+
+    Args:
+        db (AsyncSession): async database session
+
+    Returns:
+        int: current version, 0 if the catalog was never changed
+    """
+    version = await db.scalar(
+        select(CatalogVersion.version).filter(CatalogVersion.id == 1)
+    )
+    return version or 0
+
+
+def bump_catalog_version(db: Session):
+    """Method to increase the catalog version stamp, inside the current transaction
+
+    Must be called by every write on the product table before the commit,
+    and followed by catalog_cache.invalidate after it.
+
+    Args:
+        db (Session): database session
+
+    Returns:
+        int: new catalog version
+    """
+    stamp = db.query(CatalogVersion).filter(CatalogVersion.id == 1)
+    if not stamp.update({CatalogVersion.version: CatalogVersion.version + 1}):
+        db.add(CatalogVersion(id=1, version=1))
+        db.flush()
+    return read_catalog_version(db)
@@ -1,22 +1,170 @@
-from sqlalchemy import create_engine, engine
+import os
+from sqlalchemy import create_engine, engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./delivery.db"  # path to the database
+DATABASE_PATH = os.getenv("DATABASE_PATH", "./delivery.db")  # path to the database
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
 
+# "sync" serves every endpoint on the threadpool, "async" serves the hot
+# endpoints of routers/aio on the async engine (needs aiosqlite)
+DATABASE_MODE = os.getenv("DATABASE_MODE", "sync")
 
-# SQLALCHEMY default code
+# Engine profiles ==========
+# pragmas applied on every new connection, each one can be overridden
+# by an environment variable named SQLITE_<PRAGMA>, like SQLITE_BUSY_TIMEOUT
+SQLITE_PROFILES = {
+    # sqlite defaults, rollback journal
+    "default": {},
+    # WAL lets readers run while the writer commits, NORMAL sync is
+    # durable on WAL except on power loss, 64MB page cache, 256MB mmap,
+    # and waiting up to 5s for a lock instead of "database is locked"
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": "-64000",
+        "mmap_size": "268435456",
+        "busy_timeout": "5000",
+    },
+}
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "production")
+SQLITE_PRAGMAS = {
+    name: os.getenv(f"SQLITE_{name.upper()}", value)
+    for name, value in SQLITE_PROFILES[DATABASE_PROFILE].items()
+}
+
+# Readers keep one connection per threadpool thread (AnyIO default: 40)
+# and open extra ones instead of waiting: a sync endpoint still holds its
+# connection while it waits for a thread to serialize the response, so a
+# bounded reader pool can deadlock under load. Writes go through a single
+# connection, the only one allowed to hold the sqlite write lock.
+READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "40"))
+POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+# Reader connections opened on the startup of a worker, before any request
+WARM_READ_CONNECTIONS = int(os.getenv("SQLITE_WARM_READ_CONNECTIONS", "4"))
+
+
+def set_sqlite_pragmas(connection, read_only=False):
+    """Method to apply the pragmas of the engine profile on a new connection
+
+    Args:
+        connection: dbapi connection just opened
+        read_only (bool, optional): refuse writes on this connection
+    """
+    cursor = connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+# Writer engine, used by every endpoint that changes data
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=POOL_TIMEOUT,
+)
+event.listen(engine, "connect", lambda connection, _: set_sqlite_pragmas(connection))
+
+# Reader engine, used by the read only endpoints
+read_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=READ_POOL_SIZE,
+    max_overflow=-1,
+    pool_timeout=POOL_TIMEOUT,
+)
+event.listen(
+    read_engine,
+    "connect",
+    lambda connection, _: set_sqlite_pragmas(connection, read_only=True),
 )
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
 
+class LazySession:
+    """Session created only on its first use, so an endpoint answered
+    from a cache never builds a session nor checks out a connection"""
+
+    def __init__(self, factory: sessionmaker):
+        self._factory = factory
+        self._session = None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
 def get_db():
-    db = SessionLocal()
+    db = LazySession(SessionLocal)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db():
+    db = LazySession(ReadSessionLocal)
     try:
         yield db
     finally:
         db.close()
+
+
+# Async engine, created only when enabled
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_MODE == "async":
+    async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+    event.listen(
+        async_engine.sync_engine,
+        "connect",
+        lambda connection, _: set_sqlite_pragmas(connection),
+    )
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+
+def warm_up(readers: int = WARM_READ_CONNECTIONS):
+    """Method to open the pool connections before the first request, so
+    it does not pay for opening the file, the pragmas and parsing the schema
+
+    Args:
+        readers (int, optional): reader connections to open
+    """
+    connections = [engine.connect()]
+    try:
+        for _ in range(min(readers, READ_POOL_SIZE)):
+            connections.append(read_engine.connect())
+        for connection in connections:
+            # Any statement reads the schema into the connection
+            connection.exec_driver_sql("SELECT count(*) FROM sqlite_master").scalar()
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def warm_up_async():
+    """Method to open the connection of the async engine before the first request"""
+    if async_engine is not None:
+        async with async_engine.connect() as connection:
+            await connection.exec_driver_sql("SELECT count(*) FROM sqlite_master")
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
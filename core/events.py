@@ -0,0 +1,298 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, insert, select, func
+from sqlalchemy.orm import Session
+
+from core.database import engine, read_engine
+from core.jobs import enqueue, job
+from core.models import OrderEvent
+
+# 'memory' only reaches the clients of this process, 'sqlite' shares the
+# events between every worker process through the order_event table
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+# How often the sqlite backend looks for events of the other workers
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "0.5"))
+# How long the sqlite backend keeps the events on the table
+EVENTS_RETENTION_SECONDS = int(os.getenv("EVENTS_RETENTION_SECONDS", "300"))
+# Events kept for a slow client, the oldest ones are dropped after that
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+
+
+class Subscription:
+    """Queue of the events of one account, fed from any thread and read
+    on the event loop of the client connection"""
+
+    def __init__(self, broker, account_id: int):
+        self.broker = broker
+        self.account_id = account_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self.dropped = 0
+
+    def put(self, event: dict):
+        """Method to deliver an event, safe to call from any thread
+
+        Args:
+            event (dict): event published on the bus
+        """
+        if self.account_id in event["accounts"]:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict):
+        # A client too slow to read loses the oldest events, never blocks the bus
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float):
+        """Method to wait for the next event
+
+        Args:
+            timeout (float): seconds to wait
+
+        Returns:
+            dict: the next event, or None on timeout
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    """In-process pub/sub bus, every subscriber of this process gets the
+    events published by this process"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.published = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, accounts: list, data: dict):
+        """Method to publish an event, to be called after the commit
+
+        Args:
+            accounts (list): ids of the accounts allowed to receive the event
+            data (dict): content of the event
+        """
+        self.published += 1
+        self.deliver({"id": next(self._ids), "accounts": accounts, "data": data})
+
+    def publish_many(self, events: list):
+        """Method to publish many events at once, to be called after the commit
+
+        Args:
+            events (list): accounts and data of each event
+        """
+        for accounts, data in events:
+            self.publish(accounts, data)
+
+    def deliver(self, event: dict):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def subscribe(self, account_id: int):
+        """Method to start receiving the events of an account,
+        must be called from the event loop
+
+        Args:
+            account_id (int): id of the logged account
+
+        Returns:
+            Subscription: queue of events, to be used as a context manager
+        """
+        subscription = Subscription(self, account_id)
+        with self._lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+        }
+
+    def close(self):
+        pass
+
+
+class SQLiteBroker(MemoryBroker):
+    """Pub/sub bus shared by the worker processes: events are written to
+    the order_event table, and a thread of each process polls the new
+    rows and delivers them to its own subscribers"""
+
+    def __init__(self, poll_seconds: float, retention_seconds: int):
+        super().__init__()
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self.last_id = None
+        self._poller = None
+        self._stop = threading.Event()
+
+    def publish(self, accounts: list, data: dict):
+        self.publish_many([(accounts, data)])
+
+    def publish_many(self, events: list):
+        # A single transaction for every event
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            connection.execute(
+                insert(OrderEvent),
+                [
+                    {
+                        "created_at": now,
+                        "accounts": ",".join(str(id) for id in accounts),
+                        "payload": json.dumps(data),
+                    }
+                    for accounts, data in events
+                ],
+            )
+            connection.execute(
+                delete(OrderEvent).where(
+                    OrderEvent.created_at
+                    < now - timedelta(seconds=self.retention_seconds)
+                )
+            )
+        self.published += len(events)
+
+    def subscribe(self, account_id: int):
+        # The poller starts with the first subscriber of the process
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(
+                    target=self._poll, name="events-poller", daemon=True
+                )
+                self._poller.start()
+        return super().subscribe(account_id)
+
+    def _poll(self):
+        # Starting from the last event, the older ones are not replayed
+        with read_engine.connect() as connection:
+            self.last_id = connection.execute(select(func.max(OrderEvent.id))).scalar() or 0
+
+        while not self._stop.wait(self.poll_seconds):
+            if not self.subscribers:
+                continue
+            try:
+                with read_engine.connect() as connection:
+                    rows = connection.execute(
+                        select(OrderEvent)
+                        .where(OrderEvent.id > self.last_id)
+                        .order_by(OrderEvent.id)
+                    ).all()
+            except Exception:
+                # the database is busy or gone, trying again on the next poll
+                continue
+
+            for row in rows:
+                self.last_id = row.id
+                self.deliver(
+                    {
+                        "id": row.id,
+                        "accounts": [int(id) for id in row.accounts.split(",")],
+                        "data": json.loads(row.payload),
+                    }
+                )
+
+    def stats(self):
+        return {**super().stats(), "backend": "sqlite", "last_id": self.last_id}
+
+    def close(self):
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join(timeout=self.poll_seconds * 2)
+
+
+def create_broker(backend: str):
+    """Method to create the event bus of the configured backend
+
+    Args:
+        backend (str): 'memory' or 'sqlite'
+
+    Returns:
+        MemoryBroker: the event bus
+    """
+    if backend == "sqlite":
+        return SQLiteBroker(EVENTS_POLL_SECONDS, EVENTS_RETENTION_SECONDS)
+    return MemoryBroker()
+
+
+bus = create_broker(EVENTS_BACKEND)
+
+
+def format_sse(event: dict):
+    """Method to format an event as a Server-Sent Event
+
+    Args:
+        event (dict): event received from the bus
+
+    Returns:
+        str: 'id', 'event' and 'data' lines of the event
+    """
+    data = json.dumps(event["data"], separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['data']['type']}\ndata: {data}\n\n"
+
+
+@job("publish_events")
+def publish_events(payload: dict):
+    # Run after the commit of the change, by the workers of core/jobs.py
+    bus.publish_many([(accounts, data) for accounts, data in payload["events"]])
+
+
+def publish_after_commit(db: Session, events: list):
+    """Method to publish events after the commit of the current transaction,
+    they are never published if it is rolled back
+
+    With the sqlite backend they go through the job queue, so they are
+    published even if the process stops right after the commit, by any
+    process running the jobs. The memory backend only reaches the clients
+    of this process, so this process publishes them right after the commit,
+    a job worker on another process would publish them to nobody.
+
+    Args:
+        db (Session): database session of the change
+        events (list): accounts and data of each event
+    """
+    if not events:
+        return
+    if isinstance(bus, SQLiteBroker):
+        enqueue(db, "publish_events", {"events": events})
+    else:
+        if not db.in_transaction():
+            # Otherwise a rollback before any query would keep the events
+            db.begin()
+        db.info.setdefault("events", []).extend(events)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_committed(session: Session):
+    # Events of the memory backend, see publish_after_commit
+    events = session.info.pop("events", None)
+    if events:
+        bus.publish_many(events)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def forget_events(session: Session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("events", None)
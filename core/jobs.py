@@ -0,0 +1,444 @@
+"""Durable background jobs
+
+Side effects that do not need to hold the response, like publishing the
+order events on the sqlite event bus, are enqueued as rows of the job table on the same
+transaction of the change that needs them: a job exists only if the
+change was committed, and is not lost after that. Worker threads claim
+the due jobs in batches, run their handlers and delete them. A job that
+fails runs again after an exponential backoff, up to its max attempts,
+and is then kept as failed.
+
+    enqueue(db, "publish_events", {"events": [...]})
+    db.commit()  # the workers of this process are woken up
+
+The workers of a process start with its first job (or on the startup of
+the app). JOBS_WORKERS=0 leaves every job to a separate process:
+
+    python -m core.jobs worker --threads 2
+    python -m core.jobs status
+    python -m core.jobs retry                         # failed jobs run again
+    python -m core.jobs enqueue archive_orders '{"days": 90}'
+
+Jobs run at least once: a worker that dies while running a job leaves it
+to be claimed again after JOBS_LEASE_SECONDS, handlers must be idempotent.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import signal
+import threading
+import time
+
+from sqlalchemy import Engine, bindparam, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from core.database import engine, read_engine
+from core.metrics import Histogram
+from core.models import Job
+
+# Worker threads of each app process, 0 to run the jobs only on `python -m core.jobs worker`
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+# Jobs claimed at once by a worker, finished on a single transaction
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", "50"))
+# Max seconds an idle worker waits before looking for jobs of other processes
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+# Seconds a claimed job belongs to its worker, claimed again after that
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+# Attempts of a job before it is kept as failed, and the backoff between them
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_BACKOFF_SECONDS = float(os.getenv("JOBS_BACKOFF_SECONDS", "1"))
+JOBS_MAX_BACKOFF_SECONDS = float(os.getenv("JOBS_MAX_BACKOFF_SECONDS", "300"))
+
+# Modules registering handlers, imported before the workers start
+JOB_MODULES = ("core.events", "core.archive")
+
+PENDING = "pending"
+FAILED = "failed"
+
+# Seconds from the enqueue to the end of a job, and running it
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, 300, 3600)
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class JobHandler:
+    """Function running the jobs of a name"""
+
+    def __init__(self, name: str, function, max_attempts: int):
+        self.name = name
+        self.function = function
+        self.max_attempts = max_attempts
+
+
+handlers = {}
+
+
+def job(name: str, max_attempts: int = JOBS_MAX_ATTEMPTS):
+    """Method to register the handler of a job, used as a decorator
+
+        @job("publish_events")
+        def publish_events(payload: dict): ...
+
+    Args:
+        name (str): name of the job, used on enqueue
+        max_attempts (int, optional): attempts before the job is kept as failed
+
+    Returns:
+        the decorator, returning the function unchanged
+    """
+
+    def register(function):
+        handlers[name] = JobHandler(name, function, max_attempts)
+        return function
+
+    return register
+
+
+def load_handlers():
+    """Method to import every module of JOB_MODULES, registering their handlers"""
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+
+
+def enqueue(db: Session, name: str, payload: dict, delay: float = 0):
+    """Method to add a job, inside the current transaction: it is visible
+    to the workers only after the commit, and never if it is rolled back
+
+    Args:
+        db (Session): database session of the change
+        name (str): name of the job, registered with @job
+        payload (dict): json arguments of the handler
+        delay (float, optional): seconds before the job can run
+    """
+    now = time.time()
+    db.execute(
+        insert(Job).values(
+            name=name,
+            payload=json.dumps(payload, separators=(",", ":")),
+            status=PENDING,
+            attempts=0,
+            run_at=now + delay,
+            created_at=now,
+        )
+    )
+    db.info["jobs_enqueued"] = True
+
+
+def backoff(attempts: int):
+    """Method to get the seconds before the next attempt of a failed job
+
+    Args:
+        attempts (int): attempts already made
+
+    Returns:
+        float: exponential delay, with a jitter so many jobs failing together
+            do not come back together
+    """
+    delay = min(JOBS_BACKOFF_SECONDS * 2 ** (attempts - 1), JOBS_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.9, 1.1)
+
+
+class JobWorkers:
+    """Worker threads running the due jobs, and the counters of this process"""
+
+    def __init__(self, threads: int, batch_size: int, poll_seconds: float, lease_seconds: float):
+        self.size = threads
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.results = {}
+        self.latency = {}
+        self.duration = {}
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Method to start the worker threads, if they are not running"""
+        with self._lock:
+            if self._threads or self.size <= 0:
+                return
+            load_handlers()
+            self._stop = threading.Event()
+            for number in range(self.size):
+                thread = threading.Thread(
+                    target=self._run, args=(self._stop,), name=f"jobs-{number}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        """Method to tell the workers there are new jobs, starting them if needed"""
+        if not self._threads:
+            self.start()
+        self._wake.set()
+
+    def stop(self, timeout: float = 5):
+        """Method to stop the worker threads, after the batch they are running
+
+        Args:
+            timeout (float, optional): seconds to wait for each thread
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._stop.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def claim(self):
+        """Method to take a batch of due jobs, in a single statement, so two
+        workers (of any process) never take the same job
+
+        Returns:
+            list: id, name, payload, attempts and created_at of each job
+        """
+        now = time.time()
+        due = (
+            select(Job.id)
+            .where(Job.status == PENDING, Job.run_at <= now)
+            .order_by(Job.run_at)
+            .limit(self.batch_size)
+        )
+        with engine.begin() as connection:
+            return connection.execute(
+                update(Job)
+                .where(Job.id.in_(due.scalar_subquery()))
+                .values(attempts=Job.attempts + 1, run_at=now + self.lease_seconds)
+                .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.created_at)
+            ).all()
+
+    def next_run_at(self):
+        """Method to get when the next pending job is due, on the read engine
+
+        Returns:
+            float: epoch seconds, None without pending jobs
+        """
+        with read_engine.connect() as connection:
+            return connection.scalar(select(func.min(Job.run_at)).where(Job.status == PENDING))
+
+    def run_once(self):
+        """Method to claim and run a batch of jobs
+
+        Returns:
+            int: number of jobs claimed
+        """
+        jobs = self.claim()
+        done, retry, failed = [], [], []
+        for claimed in jobs:
+            handler = handlers.get(claimed.name)
+            started = time.perf_counter()
+            try:
+                if handler is None:
+                    raise LookupError(f"no handler registered for the job {claimed.name!r}")
+                handler.function(json.loads(claimed.payload))
+            except Exception as error:
+                logger.exception("job %d (%s) failed", claimed.id, claimed.name)
+                error = f"{type(error).__name__}: {error}"
+                max_attempts = handler.max_attempts if handler else 1
+                if claimed.attempts >= max_attempts:
+                    failed.append({"job_id": claimed.id, "error": error})
+                    self.count(claimed.name, "failed")
+                else:
+                    retry.append(
+                        {
+                            "job_id": claimed.id,
+                            "error": error,
+                            "retry_at": time.time() + backoff(claimed.attempts),
+                        }
+                    )
+                    self.count(claimed.name, "retry")
+            else:
+                done.append(claimed.id)
+                self.count(claimed.name, "done")
+                self.observe(
+                    claimed.name,
+                    time.time() - claimed.created_at,
+                    time.perf_counter() - started,
+                )
+        if jobs:
+            self.finish(done, retry, failed)
+        return len(jobs)
+
+    def finish(self, done: list, retry: list, failed: list):
+        """Method to delete the jobs done and reschedule the failed ones,
+        on a single transaction
+
+        Args:
+            done (list): ids of the jobs done
+            retry (list): job_id, error and retry_at of the jobs to try again
+            failed (list): job_id and error of the jobs out of attempts
+        """
+        with engine.begin() as connection:
+            if done:
+                connection.execute(delete(Job).where(Job.id.in_(done)))
+            if retry:
+                connection.execute(
+                    update(Job)
+                    .where(Job.id == bindparam("job_id"))
+                    .values(last_error=bindparam("error"), run_at=bindparam("retry_at")),
+                    retry,
+                )
+            if failed:
+                connection.execute(
+                    update(Job)
+                    .where(Job.id == bindparam("job_id"))
+                    .values(status=FAILED, last_error=bindparam("error")),
+                    failed,
+                )
+
+    def _run(self, stop: threading.Event):
+        while not stop.is_set():
+            wait = self.poll_seconds
+            try:
+                run_at = self.next_run_at()
+                if run_at is not None and run_at <= time.time():
+                    if self.run_once():
+                        continue
+                if run_at is not None:
+                    # a job claimed by another worker, or due soon
+                    wait = min(wait, max(run_at - time.time(), 0.05))
+            except Exception:
+                logger.exception("job worker failed, trying again")
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def count(self, name: str, result: str):
+        with self._lock:
+            self.results[(name, result)] = self.results.get((name, result), 0) + 1
+
+    def observe(self, name: str, latency: float, duration: float):
+        with self._lock:
+            if name not in self.latency:
+                self.latency[name] = Histogram(JOB_BUCKETS)
+                self.duration[name] = Histogram(JOB_BUCKETS)
+            self.latency[name].observe(latency)
+            self.duration[name].observe(duration)
+
+    def lines(self):
+        """Method to render the queue depth and the job counters on the
+        Prometheus text format, the depth is read from the database
+
+        Returns:
+            list: lines of the exposition format
+        """
+        now = time.time()
+        with read_engine.connect() as connection:
+            depth = dict(
+                connection.execute(select(Job.status, func.count()).group_by(Job.status)).all()
+            )
+            oldest = connection.scalar(
+                select(func.min(Job.run_at)).where(Job.status == PENDING, Job.run_at <= now)
+            )
+
+        lines = [
+            "# HELP jobs_queued Jobs on the queue, pending or failed",
+            "# TYPE jobs_queued gauge",
+        ]
+        for status in (PENDING, FAILED):
+            lines.append(f'jobs_queued{{status="{status}"}} {depth.get(status, 0)}')
+        lines += [
+            "# HELP jobs_lag_seconds Time the oldest due job is waiting for a worker",
+            "# TYPE jobs_lag_seconds gauge",
+            f"jobs_lag_seconds {max(now - oldest, 0) if oldest else 0}",
+            "# HELP jobs_total Jobs run by this process, per job and result",
+            "# TYPE jobs_total counter",
+        ]
+        latency = [
+            "# HELP job_latency_seconds Time from the enqueue to the end of the jobs done",
+            "# TYPE job_latency_seconds histogram",
+        ]
+        duration = [
+            "# HELP job_run_seconds Time running the handler of the jobs done",
+            "# TYPE job_run_seconds histogram",
+        ]
+        with self._lock:
+            for (name, result), count in sorted(self.results.items()):
+                lines.append(f'jobs_total{{job="{name}",result="{result}"}} {count}')
+            for name in sorted(self.latency):
+                latency += self.latency[name].lines("job_latency_seconds", f'job="{name}"')
+                duration += self.duration[name].lines("job_run_seconds", f'job="{name}"')
+        return lines + latency + duration
+
+
+job_workers = JobWorkers(JOBS_WORKERS, JOBS_BATCH_SIZE, JOBS_POLL_SECONDS, JOBS_LEASE_SECONDS)
+
+
+@event.listens_for(Session, "after_commit")
+def wake_workers(session: Session):
+    # The jobs of the transaction are visible now
+    if session.info.pop("jobs_enqueued", False):
+        job_workers.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_jobs(session: Session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def retry_failed(bind: Engine):
+    """Method to make every failed job pending again, with new attempts
+
+    Args:
+        bind (Engine): writer engine of the database
+
+    Returns:
+        int: number of jobs rescheduled
+    """
+    with bind.begin() as connection:
+        return connection.execute(
+            update(Job)
+            .where(Job.status == FAILED)
+            .values(status=PENDING, attempts=0, run_at=time.time())
+        ).rowcount
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal
+    from core.migrations import check_version
+
+    # The handlers register on the core.jobs module, not on this __main__ copy
+    from core.jobs import JobWorkers, enqueue, handlers, job_workers, load_handlers, retry_failed
+
+    parser = argparse.ArgumentParser(description="Background jobs")
+    parser.add_argument("command", choices=["worker", "status", "retry", "enqueue"])
+    parser.add_argument("name", nargs="?", help="job to enqueue")
+    parser.add_argument("payload", nargs="?", default="{}", help="json payload of the job")
+    parser.add_argument("--threads", type=int, default=max(JOBS_WORKERS, 1))
+    args = parser.parse_args()
+
+    check_version()
+    if args.command == "worker":
+        workers = JobWorkers(
+            args.threads, JOBS_BATCH_SIZE, JOBS_POLL_SECONDS, JOBS_LEASE_SECONDS
+        )
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+        logging.basicConfig(level=logging.INFO)
+        workers.start()
+        print(f"running jobs with {args.threads} threads: {', '.join(sorted(handlers))}")
+        stopping.wait()
+        workers.stop()
+    elif args.command == "status":
+        for line in job_workers.lines():
+            if line.startswith("jobs_"):
+                print(line)
+    elif args.command == "retry":
+        print(f"{retry_failed(engine)} failed jobs pending again")
+    else:
+        load_handlers()
+        if args.name not in handlers:
+            parser.error(f"unknown job {args.name!r}, one of: {', '.join(sorted(handlers))}")
+        db = SessionLocal()
+        try:
+            enqueue(db, args.name, json.loads(args.payload))
+            db.commit()
+        finally:
+            db.close()
+        print(f"job {args.name} enqueued")
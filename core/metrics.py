@@ -0,0 +1,218 @@
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import Engine, event
+
+# Sends the 'X-Query-Count' header on every response, for debugging
+METRICS_QUERY_COUNT_HEADER = os.getenv("METRICS_QUERY_COUNT_HEADER", "0") == "1"
+QUERY_COUNT_HEADER = b"x-query-count"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Work done by a single request, filled from any thread it runs on"""
+
+    __slots__ = ("queries", "sql_seconds", "bcrypt_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+
+
+current_request: ContextVar[RequestStats] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    """Cumulative histogram, on the Prometheus format"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str):
+        """Method to render the histogram
+
+        Args:
+            name (str): name of the metric
+            labels (str): labels of the series, already formatted
+
+        Returns:
+            list: lines of the exposition format
+        """
+        lines, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteMetrics:
+    """Latency, queries, sql time and bcrypt time of the requests of a route"""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+        self.responses = {}
+
+
+class MetricsRegistry:
+    """Metrics of every route of this process"""
+
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        """Method to record a finished request
+
+        Args:
+            method (str): http method
+            route (str): path template of the route
+            status (int): http status code
+            seconds (float): time until the response was sent
+            stats (RequestStats): work done by the request
+        """
+        with self._lock:
+            metrics = self.routes.get((method, route))
+            if metrics is None:
+                metrics = self.routes[(method, route)] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(stats.queries)
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.bcrypt_seconds += stats.bcrypt_seconds
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+
+    def render(self):
+        """Method to render the route metrics on the Prometheus text format
+
+        Returns:
+            list: lines of the exposition format
+        """
+        lines = [
+            "# HELP http_requests_total Requests answered, per route and status",
+            "# TYPE http_requests_total counter",
+        ]
+        latency = [
+            "# HELP http_request_duration_seconds Time until the response is sent",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        queries = [
+            "# HELP http_request_sql_queries SQL statements run per request",
+            "# TYPE http_request_sql_queries histogram",
+        ]
+        sql_seconds = [
+            "# HELP http_request_sql_seconds_total Time spent running SQL statements",
+            "# TYPE http_request_sql_seconds_total counter",
+        ]
+        bcrypt_seconds = [
+            "# HELP http_request_bcrypt_seconds_total Time spent hashing passwords",
+            "# TYPE http_request_bcrypt_seconds_total counter",
+        ]
+        with self._lock:
+            for (method, route), metrics in sorted(self.routes.items()):
+                labels = f'method="{method}",route="{route}"'
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+                latency += metrics.latency.lines("http_request_duration_seconds", labels)
+                queries += metrics.queries.lines("http_request_sql_queries", labels)
+                sql_seconds.append(
+                    f"http_request_sql_seconds_total{{{labels}}} {metrics.sql_seconds}"
+                )
+                bcrypt_seconds.append(
+                    f"http_request_bcrypt_seconds_total{{{labels}}} {metrics.bcrypt_seconds}"
+                )
+        return lines + latency + queries + sql_seconds + bcrypt_seconds
+
+
+registry = MetricsRegistry()
+
+
+def instrument(bind: Engine):
+    """Method to count the statements and the sql time of the requests on an engine
+
+    Args:
+        bind (Engine): sync engine, or the sync_engine of an async one
+    """
+
+    @event.listens_for(bind, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info["query_started"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += time.perf_counter() - started
+
+
+def record_bcrypt(seconds: float):
+    """Method to add the time of a password hash to the current request
+
+    Args:
+        seconds (float): time spent on bcrypt
+    """
+    stats = current_request.get()
+    if stats is not None:
+        stats.bcrypt_seconds += seconds
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the metrics of every http request,
+    under the path template of the route, so '/order/1' and '/order/2'
+    are the same series"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        response_status = 500
+
+        async def send_with_metrics(message):
+            nonlocal response_status
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                if METRICS_QUERY_COUNT_HEADER:
+                    # Only the statements run before the response starts
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (QUERY_COUNT_HEADER, str(stats.queries).encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            registry.record(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                response_status,
+                time.perf_counter() - started,
+                stats,
+            )
@@ -0,0 +1,408 @@
+"""Versioned schema migrations
+
+The version of the database is kept on PRAGMA user_version. The tables
+that do not exist yet are created from the models, then every migration
+newer than the version runs, in order, each one on its own transaction
+together with the new version number. On a new database the migrations
+find their columns and indexes already created by the models, so they
+must be idempotent, and only add what the models cannot express (like
+the full-text index).
+
+    python -m core.migrations            # upgrade to the last version
+    python -m core.migrations status     # current and last versions
+"""
+
+import argparse
+
+from sqlalchemy import Engine
+
+from core.database import engine
+from core.models import Base
+
+
+def add_column(cursor, table: str, column: str, ddl: str):
+    """Method to add a column, unless the table already has it
+
+    Args:
+        cursor: sqlite cursor of the migration
+        table (str): table name
+        column (str): column name
+        ddl (str): type and constraints of the column
+    """
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}')
+
+
+def has_foreign_key(cursor, table: str, column: str):
+    """Method to check if a column has a foreign key constraint
+
+    Args:
+        cursor: sqlite cursor of the migration
+        table (str): table name
+        column (str): column name
+
+    Returns:
+        bool: True if the constraint exists
+    """
+    rows = cursor.execute(f'PRAGMA foreign_key_list("{table}")').fetchall()
+    return any(row[3] == column for row in rows)
+
+
+# Migrations ===============
+# Never change a migration already released, add a new one instead
+
+
+def add_order_history_columns(cursor):
+    add_column(cursor, "order", "created_at", "DATETIME")
+    add_column(cursor, "orderItem", "quantity", "INTEGER DEFAULT 1")
+
+
+def add_pagination_indexes(cursor):
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_product_price_id" ON "product" (price, id)'
+    )
+    for column in ("user_id", "transport_id"):
+        prefix = column.removesuffix("_id")
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_order_{prefix}_status_id" '
+            f'ON "order" ({column}, status, id)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_order_{prefix}_id" ON "order" ({column}, id)'
+        )
+
+
+def link_order_items(cursor):
+    # sqlite cannot add a constraint to a column, so the table is rebuilt
+    if not has_foreign_key(cursor, "orderItem", "order_id"):
+        cursor.execute(
+            """
+            CREATE TABLE "orderItem_new" (
+                id INTEGER NOT NULL,
+                product_id INTEGER,
+                order_id INTEGER,
+                quantity INTEGER DEFAULT 1,
+                PRIMARY KEY (id),
+                FOREIGN KEY(product_id) REFERENCES product (id),
+                FOREIGN KEY(order_id) REFERENCES "order" (id)
+            )
+            """
+        )
+        cursor.execute(
+            'INSERT INTO "orderItem_new" (id, product_id, order_id, quantity) '
+            'SELECT id, product_id, order_id, quantity FROM "orderItem"'
+        )
+        cursor.execute('DROP TABLE "orderItem"')
+        cursor.execute('ALTER TABLE "orderItem_new" RENAME TO "orderItem"')
+        cursor.execute('CREATE INDEX "ix_orderItem_id" ON "orderItem" (id)')
+
+    # items are always read by order, and joined with their products
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_orderItem_order_id" '
+        'ON "orderItem" (order_id, product_id)'
+    )
+
+
+def create_product_search(cursor):
+    # External content table: only the index is stored, the text stays on product
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+            name, description,
+            content='product', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """
+    )
+    # Triggers keep the index in sync on every write path, ORM or bulk
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN
+            INSERT INTO product_fts (rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN
+            INSERT INTO product_fts (product_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS product_fts_update
+        AFTER UPDATE OF name, description ON product BEGIN
+            INSERT INTO product_fts (product_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO product_fts (rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+        """
+    )
+    # Words found on the name are worth more than on the description
+    cursor.execute(
+        "INSERT INTO product_fts (product_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+    )
+    cursor.execute("INSERT INTO product_fts (product_fts) VALUES ('rebuild')")
+
+
+def snapshot_order_names(cursor):
+    for column, ddl in (
+        ("product_name", "VARCHAR"),
+        ("product_description", "VARCHAR"),
+        ("unit_price", "DOUBLE"),
+    ):
+        add_column(cursor, "orderItem", column, ddl)
+    for column in ("customer_name", "transport_name"):
+        add_column(cursor, "order", column, "VARCHAR")
+
+    # Triggers fill the snapshots left empty by a write path that does not set them
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS order_item_snapshot AFTER INSERT ON "orderItem"
+        WHEN new.product_name IS NULL BEGIN
+            UPDATE "orderItem"
+            SET (product_name, product_description, unit_price) = (
+                SELECT name, description, price FROM product WHERE product.id = new.product_id
+            )
+            WHERE id = new.id;
+        END
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS order_names_snapshot AFTER INSERT ON "order"
+        WHEN new.customer_name IS NULL OR new.transport_name IS NULL BEGIN
+            UPDATE "order"
+            SET customer_name = coalesce(
+                    new.customer_name, (SELECT name FROM account WHERE id = new.user_id)
+                ),
+                transport_name = coalesce(
+                    new.transport_name, (SELECT name FROM account WHERE id = new.transport_id)
+                )
+            WHERE id = new.id;
+        END
+        """
+    )
+
+    # The price paid by the old orders is unknown, the current one is the best guess.
+    # Items of products already deleted keep no snapshot, and are not shown
+    cursor.execute(
+        """
+        UPDATE "orderItem"
+        SET (product_name, product_description, unit_price) = (
+            SELECT name, description, price FROM product
+            WHERE product.id = "orderItem".product_id
+        )
+        WHERE product_name IS NULL
+        """
+    )
+    for column, account in (("customer_name", "user_id"), ("transport_name", "transport_id")):
+        cursor.execute(
+            f"""
+            UPDATE "order"
+            SET {column} = (SELECT name FROM account WHERE account.id = "order".{account})
+            WHERE {column} IS NULL
+            """
+        )
+
+
+def create_order_archive(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS order_archive (
+            id INTEGER NOT NULL,
+            user_id INTEGER,
+            transport_id INTEGER,
+            total_price DOUBLE,
+            created_at DATETIME,
+            customer_name VARCHAR,
+            transport_name VARCHAR,
+            status INTEGER,
+            archived_at DATETIME,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "orderItem_archive" (
+            id INTEGER NOT NULL,
+            product_id INTEGER,
+            order_id INTEGER,
+            quantity INTEGER,
+            product_name VARCHAR,
+            product_description VARCHAR,
+            unit_price DOUBLE,
+            PRIMARY KEY (id),
+            FOREIGN KEY(order_id) REFERENCES order_archive (id)
+        )
+        """
+    )
+    # The same keyset indexes of the order table
+    for column in ("user_id", "transport_id"):
+        prefix = column.removesuffix("_id")
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_order_archive_{prefix}_status_id" '
+            f"ON order_archive ({column}, status, id)"
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_order_archive_{prefix}_id" '
+            f"ON order_archive ({column}, id)"
+        )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_orderItem_archive_order_id" '
+        'ON "orderItem_archive" (order_id)'
+    )
+
+
+def add_order_version(cursor):
+    for table in ("order", "order_archive"):
+        add_column(cursor, table, "version", "INTEGER NOT NULL DEFAULT 1")
+    # A change of the items is a change of the order, on any write path
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS order_item_version
+        AFTER UPDATE OF product_id, order_id, quantity ON "orderItem" BEGIN
+            UPDATE "order" SET version = version + 1
+            WHERE id IN (old.order_id, new.order_id);
+        END
+        """
+    )
+
+
+def add_address_indexes(cursor):
+    # the address of an order is found by its customer
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_address_account_id" ON address (account_id)'
+    )
+    # the same expression of core.models.cep_digits
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_address_cep" ON address (replace("CEP", \'-\', \'\'))'
+    )
+
+
+def create_job_queue(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job (
+            id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            payload VARCHAR NOT NULL,
+            status VARCHAR NOT NULL,
+            attempts INTEGER NOT NULL,
+            run_at DOUBLE NOT NULL,
+            created_at DOUBLE NOT NULL,
+            last_error VARCHAR,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS "ix_job_status_run_at" ON job (status, run_at)'
+    )
+
+
+MIGRATIONS = [
+    # (version, description, migration)
+    (1, "order created_at and item quantity", add_order_history_columns),
+    (2, "indexes of the keyset pagination", add_pagination_indexes),
+    (3, "orderItem.order_id foreign key and index", link_order_items),
+    (4, "full-text index of the products", create_product_search),
+    (5, "product and account names kept on the orders", snapshot_order_names),
+    (6, "archive tables of the finished orders", create_order_archive),
+    (7, "order version, the ETag of the order responses", add_order_version),
+    (8, "indexes of the addresses, by account and CEP", add_address_indexes),
+    (9, "queue of the background jobs", create_job_queue),
+]
+LAST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(bind: Engine = engine):
+    """Method to read the schema version of the database
+
+    Args:
+        bind (Engine, optional): engine of the database
+
+    Returns:
+        int: current version, 0 for a database never migrated
+    """
+    with bind.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def check_version(bind: Engine = engine):
+    """Method to refuse serving a database older than the models, the
+    migrations run once per deploy, never on the startup of a worker
+
+    Args:
+        bind (Engine, optional): engine of the database
+
+    Raises:
+        RuntimeError: the database has pending migrations
+    """
+    version = get_version(bind)
+    if version < LAST_VERSION:
+        raise RuntimeError(
+            f"database schema is at version {version} of {LAST_VERSION}, "
+            "run 'python -m core.migrations upgrade' first"
+        )
+
+
+def migrate(bind: Engine = engine):
+    """Method to bring the database to the last schema version
+
+    Args:
+        bind (Engine, optional): engine of the database
+
+    Returns:
+        tuple: version before and after the upgrade
+    """
+    # a single connection, the writer pool has only one
+    with bind.connect() as connection:
+        driver = connection.connection.driver_connection
+        current = connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+        # Creating the tables that do not exist yet, from the models
+        Base.metadata.create_all(connection)
+        connection.commit()
+
+        # Taking control of the transactions, so the DDL is transactional
+        isolation_level = driver.isolation_level
+        driver.isolation_level = None
+        try:
+            cursor = driver.cursor()
+            for version, description, migration in MIGRATIONS:
+                if version <= current:
+                    continue
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    migration(cursor)
+                    cursor.execute(f"PRAGMA user_version = {version}")
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+        finally:
+            driver.isolation_level = isolation_level
+        return current, max(current, LAST_VERSION)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    args = parser.parse_args()
+
+    if args.command == "status":
+        version = get_version()
+        print(f"schema version {version}, last version {LAST_VERSION}")
+        for number, description, _ in MIGRATIONS:
+            if number > version:
+                print(f"  pending {number}: {description}")
+    else:
+        before, after = migrate()
+        print(f"schema upgraded from version {before} to {after}")
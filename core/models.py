@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Double, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Double, DateTime, ForeignKey, Index
+from sqlalchemy import text, func, literal_column
+from sqlalchemy.orm import relationship
 from core.database import Base
 
 
@@ -10,6 +13,13 @@ class Account(Base):
     password = Column(String)
     role = Column(String)
 
+    orders = relationship(
+        "Order", foreign_keys="Order.user_id", back_populates="customer"
+    )
+    deliveries = relationship(
+        "Order", foreign_keys="Order.transport_id", back_populates="transport_company"
+    )
+
 
 class Product(Base):
     __tablename__ = "product"
@@ -18,11 +28,33 @@ class Product(Base):
     description = Column(String)
     price = Column(Double)
 
+    __table_args__ = (Index("ix_product_price_id", "price", "id"),)
+
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+
+
+def cep_digits(cep):
+    """Method to get the digits of a CEP, without the hyphen
+
+    The queries must use this same expression to follow ix_address_cep
+
+    Args:
+        cep: CEP column
+
+    Returns:
+        the sql expression
+    """
+    return func.replace(cep, literal_column("'-'"), literal_column("''"))
+
 
 class Address(Base):
     __tablename__ = "address"
     id = Column(Integer, primary_key=True, index=True)
-    account_id = Column(ForeignKey("account.id"))
+    account_id = Column(ForeignKey("account.id"), index=True)
     complement = Column(String)
     street = Column(String)
     house_number = Column(String)
@@ -31,12 +63,27 @@ class Address(Base):
     state = Column(String(2))
     CEP = Column(String)
 
+    # Any CEP prefix is a range of this index, typed with or without the hyphen
+    __table_args__ = (Index("ix_address_cep", cep_digits(CEP)),)
+
 
 class OrderItem(Base):
     __tablename__ = "orderItem"
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(ForeignKey("product.id"))
-    order_id = Column(Integer)
+    order_id = Column(ForeignKey("order.id"))
+    quantity = Column(Integer, default=1, server_default=text("1"))
+
+    # Product as it was bought, the order keeps it when the product
+    # is later edited or deleted
+    product_name = Column(String)
+    product_description = Column(String)
+    unit_price = Column(Double)
+
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product")
+
+    __table_args__ = (Index("ix_orderItem_order_id", "order_id", "product_id"),)
 
 
 class Order(Base):
@@ -45,6 +92,15 @@ class Order(Base):
     user_id = Column(ForeignKey("account.id"))
     transport_id = Column(ForeignKey("account.id"))
     total_price = Column(Double)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Names of the accounts when the order was created, so the order
+    # is read without joining the account table
+    customer_name = Column(String)
+    transport_name = Column(String)
+
+    # Increased by every change of the order, the ETag of its responses
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Status ===================
     status = Column(Integer)
@@ -54,3 +110,97 @@ class Order(Base):
     # 2 - order payed
     # 3 - order in the way
     # 4 - order finished
+
+    # Relationships ============
+    items = relationship("OrderItem", back_populates="order")
+    customer = relationship("Account", foreign_keys=[user_id], back_populates="orders")
+    transport_company = relationship(
+        "Account", foreign_keys=[transport_id], back_populates="deliveries"
+    )
+
+    # Indexes backing the keyset pagination of the order list,
+    # changes here need a migration on core/migrations.py
+    __table_args__ = (
+        Index("ix_order_user_status_id", "user_id", "status", "id"),
+        Index("ix_order_transport_status_id", "transport_id", "status", "id"),
+        Index("ix_order_user_id", "user_id", "id"),
+        Index("ix_order_transport_id", "transport_id", "id"),
+    )
+
+
+class ArchivedOrder(Base):
+    # delivered and refused orders moved out of the order table by
+    # core/archive.py, read only by the lists with include_archived
+    __tablename__ = "order_archive"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    transport_id = Column(Integer)
+    total_price = Column(Double)
+    created_at = Column(DateTime)
+    customer_name = Column(String)
+    transport_name = Column(String)
+    status = Column(Integer)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    archived_at = Column(DateTime)
+
+    items = relationship("ArchivedOrderItem", back_populates="order")
+
+    # The same keyset indexes of the order table
+    __table_args__ = (
+        Index("ix_order_archive_user_status_id", "user_id", "status", "id"),
+        Index("ix_order_archive_transport_status_id", "transport_id", "status", "id"),
+        Index("ix_order_archive_user_id", "user_id", "id"),
+        Index("ix_order_archive_transport_id", "transport_id", "id"),
+    )
+
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "orderItem_archive"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer)
+    order_id = Column(ForeignKey("order_archive.id"))
+    quantity = Column(Integer)
+    product_name = Column(String)
+    product_description = Column(String)
+    unit_price = Column(Double)
+
+    order = relationship("ArchivedOrder", back_populates="items")
+
+    __table_args__ = (Index("ix_orderItem_archive_order_id", "order_id"),)
+
+
+class OrderSummary(Base):
+    # orders of each transport company, per month and status, kept up to
+    # date on the same transaction of every order change (core/summary.py)
+    __tablename__ = "order_summary"
+    transport_id = Column(ForeignKey("account.id"), primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    status = Column(Integer, primary_key=True)
+    orders = Column(Integer, default=0)
+    revenue = Column(Double, default=0)
+
+
+class OrderEvent(Base):
+    # status changes shared between the worker processes by the sqlite
+    # backend of the event bus (core/events.py), kept for a few minutes
+    __tablename__ = "order_event"
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, index=True)
+    accounts = Column(String)  # ids allowed to receive, comma separated
+    payload = Column(String)  # json
+
+
+class Job(Base):
+    # background jobs of core/jobs.py, committed with the change that needs them
+    __tablename__ = "job"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    payload = Column(String, nullable=False)  # json
+    status = Column(String, nullable=False, default="pending")  # pending or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # epoch seconds, a running job has its lease expiration as run_at
+    run_at = Column(Double, nullable=False)
+    created_at = Column(Double, nullable=False)
+    last_error = Column(String)
+
+    __table_args__ = (Index("ix_job_status_run_at", "status", "run_at"),)
@@ -0,0 +1,144 @@
+import base64
+import heapq
+import json
+from itertools import groupby, islice
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Types of the values of a cursor, the values of the sort columns
+CURSOR_TYPES = (str, int, float, bool, type(None))
+
+
+def encode_cursor(values: list):
+    """Method to encode the sort key of the last row into an opaque cursor
+
+    Args:
+        values (list): values of the sort columns of the last row of the page
+
+    Returns:
+        str: url safe cursor
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int):
+    """Method to decode a cursor generated by encode_cursor
+
+    Args:
+        cursor (str): cursor received on the 'after' parameter
+        size (int): number of sort columns expected on the cursor
+
+    Raises:
+        HTTPException: Invalid cursor - HTTP 400
+
+    Returns:
+        list: values of the sort columns
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError:
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or not all(isinstance(value, CURSOR_TYPES) for value in values)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return values
+
+
+def keyset_page(query, columns: list, after: str, limit: int, descending=False):
+    """Method to restrict a query (or select statement) to a single page
+
+    Rows are ordered by the given columns (the last one must be unique,
+    normally the primary key) and the page starts right after the row
+    encoded on the cursor, so every page costs the same as the first one
+    as long as an index matches the columns.   \n
+    One extra row is fetched, so split_page knows if there is a next page.
+
+    Args:
+        query (Query | Select): query already filtered
+        columns (list): model attributes used as sort key
+        after (str): cursor of the last row of the previous page
+        limit (int): max number of rows on the page
+        descending (bool, optional): sort from the greatest to the lowest key
+
+    Returns:
+        Query | Select: query of the page
+    """
+    if after:
+        key = tuple_(*columns)
+        values = tuple_(*decode_cursor(after, len(columns)))
+        query = query.filter(key < values if descending else key > values)
+
+    query = query.order_by(*[c.desc() if descending else c for c in columns])
+    return query.limit(limit + 1)
+
+
+def split_page(rows: list, columns: list, limit: int):
+    """Method to split the rows fetched by keyset_page into the page and the next cursor
+
+    Args:
+        rows (list): rows returned by the query of the page
+        columns (list): model attributes used as sort key
+        limit (int): max number of rows on the page
+
+    Returns:
+        tuple: rows of the page and the cursor of the next page (or None)
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns])
+    return rows, next_cursor
+
+
+def merge_sorted(sources: list, columns: list, descending=False, get=getattr):
+    """Method to merge rows of the same keyset read from many tables, like
+    the hot and the archived orders, without sorting them again
+
+    A row moved from one table to the other between the reads is found on
+    both with the same key, and is kept once.
+
+    Args:
+        sources (list): iterables of rows, each one sorted by the columns
+        columns (list): model attributes used as sort key
+        descending (bool, optional): sort from the greatest to the lowest key
+        get (function, optional): reads a column of a row, getattr or operator.getitem
+
+    Yields:
+        rows of every source, in the sort order
+    """
+    names = [c.key for c in columns]
+
+    def key(row):
+        return [get(row, name) for name in names]
+
+    merged = heapq.merge(*sources, key=key, reverse=descending)
+    for _, rows in groupby(merged, key=key):
+        yield next(rows)
+
+
+def merge_pages(pages: list, columns: list, limit: int, descending=False):
+    """Method to merge the pages fetched by keyset_page from many tables into one
+
+    Args:
+        pages (list): rows returned by the query of the page on each table
+        columns (list): model attributes used as sort key
+        limit (int): max number of rows on the page
+        descending (bool, optional): sort from the greatest to the lowest key
+
+    Returns:
+        list: up to limit + 1 rows, to be used on split_page
+    """
+    return list(islice(merge_sorted(pages, columns, descending), limit + 1))
+
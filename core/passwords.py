@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+import time
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from core.metrics import record_bcrypt
+from core.security import load_password_context, timed_hash, timed_verify
+
+# Processes running bcrypt, 0 runs it on the request threadpool instead,
+# divided between the workers by serve.py
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# Hashes allowed to wait for a free worker before answering HTTP 503
+PASSWORD_HASH_QUEUE = int(
+    os.getenv("PASSWORD_HASH_QUEUE", max(PASSWORD_HASH_WORKERS, 1) * 4)
+)
+
+
+class PasswordHasher:
+    """Bounded executor for bcrypt, so a burst of logins cannot starve
+    the threadpool that serves every other endpoint"""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.capacity = max(workers, 1) + queue_size
+        self.in_flight = 0
+        self.rejected = 0
+        self.count = 0
+        self.hash_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        """Method to get the process pool, starting it on the first use"""
+        with self._lock:
+            if self._executor is None:
+                # Only needed with hashing processes
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def warm_up(self):
+        """Method to build the password context in the background, on each
+        worker process or on this process without them, so the first login
+        does not wait for it, nor delays the startup"""
+        if self.workers:
+            executor = self.executor()
+            for _ in range(self.workers):
+                executor.submit(load_password_context)
+        else:
+            threading.Thread(
+                target=load_password_context, name="password-context", daemon=True
+            ).start()
+
+    async def run(self, function, *args):
+        """Method to run a hashing function on the pool
+
+        Args:
+            function: timed_hash or timed_verify of core/security.py
+            *args: arguments of the function
+
+        Raises:
+            HTTPException: Too many hashes waiting - HTTP 503
+
+        Returns:
+            result of the function
+        """
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many logins right now, try again",
+                    headers={"Retry-After": "1"},
+                )
+            self.in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            if self.workers:
+                future = self.executor().submit(function, *args)
+                result, elapsed = await asyncio.wrap_future(future)
+            else:
+                result, elapsed = await run_in_threadpool(function, *args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        with self._lock:
+            self.count += 1
+            self.hash_seconds += elapsed
+            self.wait_seconds += time.perf_counter() - started - elapsed
+        record_bcrypt(elapsed)
+        return result
+
+    def shutdown(self):
+        """Method to stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        """Method to get the queue depth and latency counters
+
+        Returns:
+            dict: workers, hashes in flight and queued, rejections and timings
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - max(self.workers, 1), 0),
+                "rejected": self.rejected,
+                "count": self.count,
+                "hash_seconds_total": self.hash_seconds,
+                "wait_seconds_total": self.wait_seconds,
+            }
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
+
+
+async def hash_password(password: str):
+    """Method to hash a password with bcrypt, outside of the request threadpool
+
+    Args:
+        password (str): plain password
+
+    Returns:
+        str: hashed password
+    """
+    return await password_hasher.run(timed_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str):
+    """Method to check a password against its bcrypt hash, outside of the request threadpool
+
+    Args:
+        password (str): plain password
+        hashed_password (str): hash stored on the account
+
+    Returns:
+        bool: True if the password is correct
+    """
+    return await password_hasher.run(timed_verify, password, hashed_password)
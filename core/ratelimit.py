@@ -0,0 +1,344 @@
+"""Admission control of the expensive endpoints
+
+Each budget has a token bucket (rate and burst) and a concurrency limit,
+counted per account (from the token) or per client ip on the routes
+without authentication. The check runs as the first dependency of the
+route, before the session, the account lookup or bcrypt: a rejected
+request costs no query and no hash.
+
+    @router.post("/login", dependencies=[Depends(rate_limit("login", by="ip"))])
+
+Rejections answer HTTP 429 when the bucket is empty, and HTTP 503 when the
+key has too many requests running, both with a Retry-After header.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError
+from sqlalchemy import create_engine, event, text
+from starlette.concurrency import run_in_threadpool
+
+from core.authentication import decode_token
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# 'memory' keeps the buckets on each worker, 'sqlite' shares them between
+# the workers of a host on the file RATE_LIMIT_DATABASE_PATH
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DATABASE_PATH = os.getenv("RATE_LIMIT_DATABASE_PATH", "./ratelimit.db")
+# Buckets kept by the memory backend, the least recently used are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Budgets ==========
+# rate: requests per second refilled on the bucket
+# burst: requests allowed at once, after being idle
+# concurrency: requests of the same key running at the same time, on each worker
+# each one can be overridden by an environment variable named RATE_LIMIT_<BUDGET>,
+# like RATE_LIMIT_LOGIN="rate=1,burst=20,concurrency=4"
+BUDGETS = {
+    # bcrypt, by ip
+    "login": {"rate": 0.2, "burst": 10, "concurrency": 2},
+    "signup": {"rate": 0.05, "burst": 5, "concurrency": 2},
+    # by account
+    "order_list": {"rate": 5, "burst": 20, "concurrency": 4},
+    "order_write": {"rate": 5, "burst": 20, "concurrency": 2},
+    "product_search": {"rate": 10, "burst": 40, "concurrency": 4},
+    "product_bulk": {"rate": 0.1, "burst": 3, "concurrency": 1},
+}
+
+
+class Budget:
+    """Token bucket and concurrency limit of a group of routes"""
+
+    def __init__(self, name: str, rate: float, burst: int, concurrency: int):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.concurrency = int(concurrency)
+
+
+def load_budgets():
+    """Method to read the budgets, applying the environment overrides
+
+    Raises:
+        ValueError: invalid override
+
+    Returns:
+        dict: Budget of each name
+    """
+    budgets = {}
+    for name, values in BUDGETS.items():
+        values = dict(values)
+        override = os.getenv(f"RATE_LIMIT_{name.upper()}", "")
+        for item in filter(None, override.split(",")):
+            key, _, value = item.partition("=")
+            if key.strip() not in values:
+                raise ValueError(f"RATE_LIMIT_{name.upper()}: unknown setting {key!r}")
+            values[key.strip()] = float(value)
+        budgets[name] = Budget(name, **values)
+    return budgets
+
+
+class MemoryBuckets:
+    """Token buckets of this process"""
+
+    blocking = False
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, budget: Budget):
+        """Method to take a token from the bucket of a key
+
+        Args:
+            key (str): budget and client of the request
+            budget (Budget): rate and burst of the bucket
+
+        Returns:
+            float: 0 if admitted, otherwise seconds until a token is available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (budget.burst, now))
+            tokens = min(budget.burst, tokens + (now - updated) * budget.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / budget.rate
+            self._buckets[key] = (tokens, now)
+            # A dropped bucket starts full again, only lenient
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def size(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """Token buckets shared by every worker, on a sqlite file of their own,
+    so they never wait for the write lock of the application database"""
+
+    blocking = True
+
+    TAKE = text(
+        "INSERT INTO rate_limit (key, tokens, updated) VALUES (:key, :burst - 1, :now) "
+        "ON CONFLICT (key) DO UPDATE SET "
+        "tokens = min(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now "
+        "WHERE min(:burst, tokens + (:now - updated) * :rate) >= 1 "
+        "RETURNING tokens"
+    )
+    AVAILABLE = text(
+        "SELECT min(:burst, tokens + (:now - updated) * :rate) FROM rate_limit WHERE key = :key"
+    )
+
+    def __init__(self, path: str, idle_seconds: float):
+        self.idle_seconds = idle_seconds
+        self._pruned_at = 0.0
+        self.engine = create_engine(
+            f"sqlite:///{path}", connect_args={"check_same_thread": False}
+        )
+        event.listen(self.engine, "connect", self._setup)
+
+    @staticmethod
+    def _setup(connection, _):
+        cursor = connection.cursor()
+        # Losing the buckets on a crash only resets them
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA busy_timeout=1000")
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        cursor.close()
+
+    def take(self, key: str, budget: Budget):
+        """Method to take a token from the shared bucket of a key, in a single statement
+
+        Args:
+            key (str): budget and client of the request
+            budget (Budget): rate and burst of the bucket
+
+        Returns:
+            float: 0 if admitted, otherwise seconds until a token is available
+        """
+        # Wall clock, the same on every worker
+        now = time.time()
+        params = {"key": key, "burst": budget.burst, "rate": budget.rate, "now": now}
+        with self.engine.begin() as connection:
+            if connection.execute(self.TAKE, params).first() is not None:
+                wait = 0.0
+            else:
+                tokens = connection.execute(self.AVAILABLE, params).scalar() or 0
+                wait = max((1 - tokens) / budget.rate, 0.0)
+
+            # Dropping the buckets idle long enough to be full again
+            if now - self._pruned_at > self.idle_seconds:
+                self._pruned_at = now
+                connection.execute(
+                    text("DELETE FROM rate_limit WHERE updated < :before"),
+                    {"before": now - self.idle_seconds},
+                )
+        return wait
+
+    def size(self):
+        with self.engine.connect() as connection:
+            return connection.execute(text("SELECT count(*) FROM rate_limit")).scalar()
+
+
+class RateLimiter:
+    """Token buckets of the configured backend, concurrency counters of
+    this process and the rejection counters"""
+
+    def __init__(self, budgets: dict, buckets):
+        self.budgets = budgets
+        self.buckets = buckets
+        self.rejected = {}
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def reject(self, budget: Budget, reason: str, status_code: int, detail: str, wait: float):
+        with self._lock:
+            counter = (budget.name, reason)
+            self.rejected[counter] = self.rejected.get(counter, 0) + 1
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(math.ceil(wait), 1))},
+        )
+
+    async def acquire(self, budget: Budget, key: str):
+        """Method to admit a request, taking a token and a concurrency slot
+
+        Args:
+            budget (Budget): budget of the route
+            key (str): budget and client of the request
+
+        Raises:
+            HTTPException: Empty token bucket - HTTP 429
+            HTTPException: Too many requests running for the key - HTTP 503
+        """
+        if self.buckets.blocking:
+            wait = await run_in_threadpool(self.buckets.take, key, budget)
+        else:
+            wait = self.buckets.take(key, budget)
+        if wait:
+            self.reject(
+                budget, "rate", status.HTTP_429_TOO_MANY_REQUESTS,
+                "Too many requests, slow down", wait,
+            )
+
+        with self._lock:
+            running = self._running.get(key, 0)
+            if running < budget.concurrency:
+                self._running[key] = running + 1
+                return
+        self.reject(
+            budget, "concurrency", status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Too many requests running, try again", 1,
+        )
+
+    def release(self, key: str):
+        """Method to free the concurrency slot of a finished request
+
+        Args:
+            key (str): budget and client of the request
+        """
+        with self._lock:
+            running = self._running.pop(key) - 1
+            if running:
+                self._running[key] = running
+
+    def stats(self):
+        """Method to get the rejection counters and the number of keys tracked
+
+        Returns:
+            dict: rejected per (budget, reason), keys with requests running and buckets
+        """
+        with self._lock:
+            rejected = dict(self.rejected)
+            running = len(self._running)
+        return {"rejected": rejected, "running_keys": running, "buckets": self.buckets.size()}
+
+
+def create_limiter(backend: str):
+    """Method to create the limiter of the configured backend
+
+    Args:
+        backend (str): 'memory' or 'sqlite'
+
+    Raises:
+        ValueError: unknown backend
+
+    Returns:
+        RateLimiter: limiter with every budget
+    """
+    budgets = load_budgets()
+    if backend == "memory":
+        buckets = MemoryBuckets(RATE_LIMIT_MAX_KEYS)
+    elif backend == "sqlite":
+        # A bucket idle for burst / rate seconds is full, the same as a missing one
+        idle = max(budget.burst / budget.rate for budget in budgets.values())
+        buckets = SQLiteBuckets(RATE_LIMIT_DATABASE_PATH, idle)
+    else:
+        raise ValueError(f"unknown RATE_LIMIT_BACKEND {backend!r}")
+    return RateLimiter(budgets, buckets)
+
+
+limiter = create_limiter(RATE_LIMIT_BACKEND)
+
+
+def client_key(request: Request, by: str):
+    """Method to identify the client of a request without touching the database
+
+    Args:
+        request (Request): incoming request
+        by (str): 'account' uses the id on the token, falling back to the ip
+            when the token is missing or invalid, 'ip' always uses the ip
+
+    Returns:
+        str: key of the client
+    """
+    if by == "account":
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                # decode_token caches the claims, get_current_user reuses them
+                return f"account:{decode_token(token)['id']}"
+            except JWTError:
+                pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(name: str, by: str = "account"):
+    """Method to build the admission dependency of a budget
+
+    Args:
+        name (str): name of the budget, a key of BUDGETS
+        by (str, optional): 'account' or 'ip'
+
+    Returns:
+        the dependency, to be used on the 'dependencies' of the route
+    """
+    budget = limiter.budgets[name]
+
+    async def admit(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            yield
+            return
+        key = f"{name}:{client_key(request, by)}"
+        await limiter.acquire(budget, key)
+        try:
+            yield
+        finally:
+            limiter.release(key)
+
+    return admit
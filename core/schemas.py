@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Union
+
+from core.transitions import MAX_BATCH_ORDERS
 
 
 class AccountSchema(BaseModel):
@@ -23,6 +25,13 @@ class AccountResponseSchema(BaseModel):
     email: str
 
 
+class PrincipalSchema(BaseModel):
+    id: int
+    name: str
+    email: str
+    role: str
+
+
 class TokenData(BaseModel):
     email: Optional[str] = None
     role: Optional[str] = None
@@ -39,8 +48,28 @@ class ProductSchema(BaseModel):
     price: float
 
 
+class ProductSearchSchema(ProductSchema):
+    # the id, so a product found can be ordered
+    id: int
+
+
+class BulkProductSchema(ProductSchema):
+    # rows with an existing id update the product, the others are inserted
+    id: Optional[int] = None
+
+
+class OrderProductSchema(ProductSchema):
+    quantity: int = 1
+
+
+class OrderItemSchema(BaseModel):
+    product_id: int
+    quantity: int = Field(default=1, ge=1)
+
+
 class OrderSchema(BaseModel):
-    items: List[int]
+    # product ids (repeated ids are bought many times) or ids with quantity
+    items: List[Union[int, OrderItemSchema]]
     transport_id: int
 
 
@@ -48,7 +77,69 @@ class OrderResponseSchema(BaseModel):
     total_price: float
     id: int
     status: int
+    version: int
     user: str
     transport: str
     status_msg: str
-    products: List[ProductSchema]
+    products: List[OrderProductSchema]
+
+
+class OrderStatusSchema(BaseModel):
+    msg: str
+    id: int
+    status: int
+    status_msg: str
+
+
+class OrderBatchSchema(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_ORDERS)
+    # status every order must move to
+    status: int = Field(ge=-1, le=4)
+
+
+class OrderBatchFailureSchema(BaseModel):
+    id: int
+    # None when the order was not found, or changed meanwhile
+    status: Optional[int]
+    detail: str
+
+
+class OrderBatchResultSchema(BaseModel):
+    status: int
+    status_msg: str
+    moved: List[int]
+    failed: List[OrderBatchFailureSchema]
+
+
+class DeliverySchema(BaseModel):
+    id: int
+    version: int
+    total_price: float
+    user: str
+    # address of the customer, None when the customer has none
+    street: Optional[str]
+    house_number: Optional[str]
+    complement: Optional[str]
+    CEP: Optional[str]
+
+
+class DeliveryGroupSchema(BaseModel):
+    cep_prefix: str
+    neighborhood: str
+    city: Optional[str]
+    state: Optional[str]
+    orders: List[DeliverySchema]
+
+
+class SummaryStatusSchema(BaseModel):
+    status: int
+    status_msg: str
+    orders: int
+    revenue: float
+
+
+class MonthSummarySchema(BaseModel):
+    month: str
+    orders: int
+    revenue: float
+    statuses: List[SummaryStatusSchema]
@@ -0,0 +1,39 @@
+import re
+
+from sqlalchemy import Double, Integer, column, literal_column, table
+
+# Full-text index of the product name and description, an FTS5 table kept
+# in sync with the product table by triggers (core/migrations.py)
+product_fts = table("product_fts", column("rowid", Integer), column("rank", Double))
+
+# Words of the search used on the index, the others are ignored
+MAX_SEARCH_TERMS = 8
+
+WORD = re.compile(r"\w+")
+
+
+def match_expression(search: str):
+    """Method to convert the text typed by the user into an FTS5 query:
+    every word must match, as a prefix of a word of the product,
+    and any FTS5 syntax on the text is taken as plain words
+
+    Args:
+        search (str): text typed by the user
+
+    Returns:
+        str: FTS5 query, empty when the text has no words
+    """
+    words = WORD.findall(search.lower())[:MAX_SEARCH_TERMS]
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matches(expression: str):
+    """Method to build the MATCH condition of a search
+
+    Args:
+        expression (str): query built by match_expression
+
+    Returns:
+        condition to be used on filter
+    """
+    return literal_column("product_fts").op("MATCH")(expression)
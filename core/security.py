@@ -0,0 +1,68 @@
+"""Password context shared by the app and the hashing processes
+
+The only CryptContext of the app, built on first use. This module imports
+nothing but passlib (and only when the context is built), so a hashing
+process spawned by core/passwords.py starts in a fraction of the time it
+would take to import the web stack, and the first logins after scaling
+out do not wait for it.
+"""
+
+import threading
+import time
+
+_context = None
+_lock = threading.Lock()
+
+
+def password_context():
+    """Method to get the bcrypt context, building it on the first call
+
+    Returns:
+        CryptContext: context with the bcrypt backend already loaded
+    """
+    global _context
+    if _context is None:
+        with _lock:
+            if _context is None:
+                from passlib.context import CryptContext
+
+                context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+                # Loading the bcrypt backend, otherwise loaded by the first hash
+                context.handler("bcrypt").get_backend()
+                _context = context
+    return _context
+
+
+def load_password_context():
+    """Method to build the context ahead of the first hash, on any process"""
+    password_context()
+
+
+def timed_hash(password: str):
+    """Method to hash a password with bcrypt
+
+    Args:
+        password (str): plain password
+
+    Returns:
+        tuple: hashed password and the seconds spent
+    """
+    started = time.perf_counter()
+    return password_context().hash(password), time.perf_counter() - started
+
+
+def timed_verify(password: str, hashed_password: str):
+    """Method to check a password against its bcrypt hash
+
+    Args:
+        password (str): plain password
+        hashed_password (str): hash stored on the account
+
+    Returns:
+        tuple: True if the password is correct, and the seconds spent
+    """
+    started = time.perf_counter()
+    return (
+        password_context().verify(password, hashed_password),
+        time.perf_counter() - started,
+    )
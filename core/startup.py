@@ -0,0 +1,86 @@
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Time spent by this process before it can serve requests, per phase
+
+    Imported before anything else by main.py, so the 'import' phase covers
+    the imports of fastapi, sqlalchemy and every router, broken down per
+    module by benchmarks/import_times.py
+    """
+
+    def __init__(self):
+        self.began = time.perf_counter()
+        self.pid = os.getpid()
+        self.phases = {}
+        self.total = None
+
+    def restart(self):
+        """Method to start counting again, on a worker forked from a preloaded
+        process, which never pays for the imports"""
+        self.began = time.perf_counter()
+        self.pid = os.getpid()
+        self.phases = {}
+        self.total = None
+
+    def mark(self, name: str):
+        """Method to record a phase ending now, started when the previous one ended
+
+        Args:
+            name (str): name of the phase
+        """
+        self.phases[name] = time.perf_counter() - self.began - sum(self.phases.values())
+
+    @contextmanager
+    def phase(self, name: str):
+        """Method to time a block as a phase
+
+        Args:
+            name (str): name of the phase
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def ready(self):
+        """Method to record the end of the startup
+
+        Returns:
+            float: seconds since the process (or the fork) started
+        """
+        self.total = time.perf_counter() - self.began
+        return self.total
+
+    def report(self):
+        """Method to describe the startup on a single line
+
+        Returns:
+            str: total and time of each phase
+        """
+        phases = ", ".join(
+            f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items()
+        )
+        return f"worker {self.pid} ready in {(self.total or 0) * 1000:.0f}ms ({phases})"
+
+    def lines(self):
+        """Method to render the startup times on the Prometheus text format
+
+        Returns:
+            list: lines of the exposition format
+        """
+        lines = [
+            "# HELP process_startup_seconds Time spent before serving requests, per phase",
+            "# TYPE process_startup_seconds gauge",
+        ]
+        for name, seconds in self.phases.items():
+            lines.append(f'process_startup_seconds{{phase="{name}"}} {seconds}')
+        if self.total is not None:
+            lines.append(f'process_startup_seconds{{phase="total"}} {self.total}')
+        return lines
+
+
+startup = StartupTimer()
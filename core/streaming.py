@@ -0,0 +1,65 @@
+import os
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+from core.database import ReadSessionLocal
+
+# Rows read from sqlite, and documents encoded, per chunk of the response
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "500"))
+
+
+def stream_rows(query: Select):
+    """Method to read the rows of a column-only select in chunks,
+    so only one chunk of rows is in memory at a time
+
+    Uses its own session, as the response is streamed after the request
+    dependencies are closed
+
+    Args:
+        query (Select): select of plain columns, not of ORM objects
+
+    Yields:
+        Row: rows of the select
+    """
+    db = ReadSessionLocal()
+    try:
+        rows = db.execute(query.execution_options(yield_per=STREAM_CHUNK_ROWS))
+        for chunk in rows.partitions():
+            yield from chunk
+    finally:
+        db.close()
+
+
+def json_array_chunks(documents):
+    """Method to encode documents as a single JSON array, in chunks
+
+    Args:
+        documents: iterable of dicts
+
+    Yields:
+        bytes: a chunk of the array, with up to STREAM_CHUNK_ROWS documents
+    """
+    chunk = bytearray(b"[")
+    count = 0
+    for document in documents:
+        if count:
+            chunk += b","
+        chunk += orjson.dumps(document)
+        count += 1
+        if count % STREAM_CHUNK_ROWS == 0:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b"]"
+    yield bytes(chunk)
+
+
+class JSONStreamResponse(StreamingResponse):
+    """Chunked JSON array, encoded while the rows are read, skipping the
+    validation of the response model"""
+
+    media_type = "application/json"
+
+    def __init__(self, documents, **kwargs):
+        super().__init__(json_array_chunks(documents), **kwargs)
@@ -0,0 +1,165 @@
+"""Monthly summary of the orders of each transport company
+
+The order_summary table holds one row per transport, month and status,
+changed on the same transaction of the order itself, so reading the
+summary costs O(months) instead of O(orders).
+
+Rebuild it from the order history with:
+
+    python -m core.summary rebuild
+"""
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from core.models import ArchivedOrder, Order, OrderSummary
+
+# month of the orders created before the created_at column existed
+UNKNOWN_MONTH = "unknown"
+
+
+def month_of(created_at: datetime):
+    """Method to get the summary month of an order
+
+    Args:
+        created_at (datetime): creation date of the order
+
+    Returns:
+        str: month as YYYY-MM
+    """
+    if created_at is None:
+        return UNKNOWN_MONTH
+    return created_at.strftime("%Y-%m")
+
+
+def record_order(db: Session, order: Order, status: int, orders=1):
+    """Method to add (or remove, with orders=-1) an order on the summary,
+    inside the current transaction
+
+    Args:
+        db (Session): database session
+        order (Order): order being changed
+        status (int): status the order is entering (or leaving)
+        orders (int, optional): 1 to add the order, -1 to remove it
+    """
+    add_totals(
+        db,
+        order.transport_id,
+        month_of(order.created_at),
+        status,
+        orders,
+        (order.total_price or 0) * orders,
+    )
+
+
+def add_totals(
+    db: Session, transport_id: int, month: str, status: int, orders: int, revenue: float
+):
+    """Method to add orders and revenue (negative to remove) on a summary row,
+    inside the current transaction
+
+    Args:
+        db (Session): database session
+        transport_id (int): transport company of the orders
+        month (str): month of the orders, see month_of
+        status (int): status of the orders
+        orders (int): orders to add
+        revenue (float): revenue to add
+    """
+    stmt = sqlite_insert(OrderSummary).values(
+        transport_id=transport_id,
+        month=month,
+        status=status,
+        orders=orders,
+        revenue=revenue,
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[
+                OrderSummary.transport_id,
+                OrderSummary.month,
+                OrderSummary.status,
+            ],
+            set_={
+                "orders": OrderSummary.orders + stmt.excluded.orders,
+                "revenue": OrderSummary.revenue + stmt.excluded.revenue,
+            },
+        )
+    )
+
+
+def move_orders(db: Session, orders: list, next_status):
+    """Method to move many orders on the summary, inside the current transaction,
+    with one statement per summary row changed instead of two per order
+
+    Args:
+        db (Session): database session
+        orders (list): orders being changed, with the status before the change
+        next_status (function): status after the change of a status before it
+    """
+    totals = {}
+    for order in orders:
+        month = month_of(order.created_at)
+        revenue = order.total_price or 0
+        for status, count in ((order.status, -1), (next_status(order.status), 1)):
+            key = (order.transport_id, month, status)
+            orders_before, revenue_before = totals.get(key, (0, 0))
+            totals[key] = (orders_before + count, revenue_before + revenue * count)
+
+    for (transport_id, month, status), (count, revenue) in totals.items():
+        if count or revenue:
+            add_totals(db, transport_id, month, status, count, revenue)
+
+
+def rebuild(db: Session):
+    """Method to recalculate the whole summary from the orders, archived included
+
+    Args:
+        db (Session): database session
+
+    Returns:
+        int: number of summary rows
+    """
+    orders = union_all(
+        *(
+            select(model.transport_id, model.created_at, model.status, model.total_price)
+            for model in (Order, ArchivedOrder)
+        )
+    ).subquery()
+    month = func.coalesce(func.strftime("%Y-%m", orders.c.created_at), UNKNOWN_MONTH)
+    totals = select(
+        orders.c.transport_id,
+        month,
+        orders.c.status,
+        func.count(),
+        func.coalesce(func.sum(orders.c.total_price), 0),
+    ).group_by(orders.c.transport_id, month, orders.c.status)
+
+    db.execute(delete(OrderSummary))
+    db.execute(
+        insert(OrderSummary).from_select(
+            ["transport_id", "month", "status", "orders", "revenue"], totals
+        )
+    )
+    db.commit()
+    return db.scalar(select(func.count()).select_from(OrderSummary))
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal
+    from core.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Order summary maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    migrate()
+    db = SessionLocal()
+    try:
+        print(f"order summary rebuilt: {rebuild(db)} rows")
+    finally:
+        db.close()
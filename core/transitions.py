@@ -0,0 +1,121 @@
+"""Order state machine
+
+    waiting approval (0) -> approved (1) -> payed (2) -> in the way (3) -> delivered (4)
+
+An order can be refused (-1) until it is on the way, delivered and
+refused orders never change again.
+
+Every change is a single conditional UPDATE ... WHERE status = :expected,
+so when two requests race on the same order only one of them applies,
+the other finds no row to update and reports a conflict instead of
+silently overwriting the first one. The same UPDATE increases the
+version of the order, so the ETags of its responses change.
+"""
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from core.models import Order
+from core.summary import move_orders
+
+# Transition -> {current status: next status}
+TRANSITIONS = {
+    "advance": {0: 1, 1: 2, 2: 3, 3: 4},
+    "cancel": {0: -1, 1: -1, 2: -1},
+}
+# Orders payed, waiting for the transport company to take them on the way
+AVAILABLE_STATUS = 2
+# Orders changed by a single batch request
+MAX_BATCH_ORDERS = 1000
+
+NOT_FOUND = "Order not found"
+INVALID = "Invalid transition"
+CONFLICT = "Order changed by another request"
+
+
+def to_status(target: int):
+    """Method to build the next status function of a target status
+
+    Args:
+        target (int): status the orders must move to
+
+    Returns:
+        function: target, if some transition reaches it from the status, otherwise None
+    """
+    sources = {
+        current
+        for transition in TRANSITIONS.values()
+        for current, next_status in transition.items()
+        if next_status == target
+    }
+    return lambda current: target if current in sources else None
+
+
+def apply_transition(db: Session, ids: list, next_status, transport_id: int = None):
+    """Method to move orders to their next status, inside the current transaction
+
+    The orders are read once, grouped by their current status, and each
+    group is changed by one conditional UPDATE. The summary is updated
+    on the same transaction.
+
+    Args:
+        db (Session): database session
+        ids (list): ids of the orders
+        next_status (function): next status of a current status, or None if
+            the order cannot move, like TRANSITIONS['advance'].get
+        transport_id (int, optional): only orders of this transport company
+
+    Returns:
+        tuple: moved orders (rows with the status before the change) and
+            the failures, a dict of id -> (current status or None, reason)
+    """
+    ids = list(dict.fromkeys(ids))
+    filters = [Order.id.in_(ids)]
+    if transport_id is not None:
+        filters.append(Order.transport_id == transport_id)
+
+    # Getting every order at once, with what the summary and the events need
+    orders = {
+        order.id: order
+        for order in db.execute(
+            select(
+                Order.id,
+                Order.user_id,
+                Order.transport_id,
+                Order.status,
+                Order.total_price,
+                Order.created_at,
+            ).filter(*filters)
+        )
+    }
+
+    failures = {}
+    groups = {}
+    for id in ids:
+        order = orders.get(id)
+        if order is None:
+            failures[id] = (None, NOT_FOUND)
+        elif next_status(order.status) is None:
+            failures[id] = (order.status, INVALID)
+        else:
+            groups.setdefault(order.status, []).append(id)
+
+    moved = []
+    for current, group in groups.items():
+        changed = set(
+            db.scalars(
+                update(Order)
+                .where(Order.id.in_(group), Order.status == current)
+                .values(status=next_status(current), version=Order.version + 1)
+                .returning(Order.id)
+                .execution_options(synchronize_session=False)
+            )
+        )
+        for id in group:
+            if id in changed:
+                moved.append(orders[id])
+            else:
+                failures[id] = (None, CONFLICT)
+
+    move_orders(db, moved, next_status)
+    return moved, failures
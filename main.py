@@ -1,7 +1,15 @@
+# First import, so the startup time covers every other one
+from core.startup import startup
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from core.database import engine
-from core.models import Base
-from routers import v1
+from core.database import engine, read_engine, async_engine, DATABASE_MODE, warm_up, warm_up_async
+from core.migrations import check_version
+from core.passwords import password_hasher
+from core.events import bus
+from core.jobs import job_workers
+from core.metrics import MetricsMiddleware, instrument
+from routers import v1, metrics
 
 description = """
 
@@ -17,6 +25,7 @@ description = """
 * Get orders
 * Increase order status
 * Decrease order status
+* Follow order status (Server-Sent Events)
 
 #### Product
 * Create product
@@ -25,6 +34,32 @@ description = """
 * Delete products
 """
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup.phase("warm_up"):
+        # The schema is migrated once per deploy, see core/migrations.py
+        check_version()
+        # Opening the pool connections before the first request
+        warm_up()
+        await warm_up_async()
+        # Starting the password hashing workers in the background
+        password_hasher.warm_up()
+        # Starting the background job workers, see core/jobs.py
+        job_workers.start()
+    startup.ready()
+    logging.getLogger("uvicorn.error").info(startup.report())
+    yield
+    # Stopping the password hashing workers
+    password_hasher.shutdown()
+    # Stopping the job workers, after the batch they are running
+    job_workers.stop()
+    # Stopping the event bus poller
+    bus.close()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
 app = FastAPI(
     title="Delivery API",
     # description="api to serve a mobile delivery app",
@@ -37,16 +72,36 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url=None,
     description=description,
+    lifespan=lifespan,
 )
 
+# The async routers take precedence, v1 keeps serving the other routes
+if DATABASE_MODE == "async":
+    from routers import aio
+
+    app.include_router(aio.router, include_in_schema=False)
+
 app.include_router(v1.router)
+app.include_router(metrics.router)
+
+# Latency, SQL statements and bcrypt time of every route, on /metrics
+app.add_middleware(MetricsMiddleware)
+for bind in (engine, read_engine):
+    instrument(bind)
+if async_engine is not None:
+    instrument(async_engine.sync_engine)
 
-Base.metadata.create_all(engine)
+startup.mark("import")
 
-# uvicorn main:app --reload --port 8000
+# Development, a single process reloading on changes:
+#   python main.py
+# Production, N preloaded workers, see serve.py:
+#   python -m core.migrations upgrade
+#   python serve.py --workers 4
 
-# To do:
 if __name__ == "__main__":
     import uvicorn
+    from core.migrations import migrate
 
+    migrate()
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, status
+from fastapi.params import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+
+from core.database import get_async_db
+from core.schemas import AccountSchema, AccountResponseSchema
+from core.models import Account
+from core.authentication import get_current_user_async, invalidate_account
+from core.ratelimit import rate_limit
+from routers.v1.account import prepare_account, new_address, duplicated_account
+
+router = APIRouter(
+    tags=["Account"],
+    prefix="/account",
+)
+
+
+async def create_account(request: AccountSchema, role: str, db: AsyncSession):
+    """Async version of routers.v1.account.create_account
+
+    Args:
+        request (AccountSchema): json with account and address data
+        role (str): role of the new account
+        db (AsyncSession): async database session
+
+    Raises:
+        HTTPException: Invalid data, see prepare_account
+        IntegrityError: Email duplicated (already inserted on database)
+
+    Returns:
+        user_id (int): id of the new account
+    """
+    hashed_password = await prepare_account(request)
+
+    try:
+        # Adding user into the database
+        new_user = Account(
+            name=request.name,
+            email=request.email,
+            password=hashed_password,
+            role=role,
+        )
+        db.add(new_user)
+
+        # Getting the id of the new account
+        await db.flush()
+        user_id = new_user.id
+
+        # Adding address into the database
+        db.add(new_address(request, user_id))
+        await db.commit()
+        invalidate_account(user_id)
+        return user_id
+
+    except IntegrityError as e:
+        raise duplicated_account(e)
+
+
+@router.post(
+    "/user",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("signup", by="ip"))],
+)
+async def create_user(request: AccountSchema, db: AsyncSession = Depends(get_async_db)):
+    await create_account(request, "USER", db)
+    return request
+
+
+@router.post(
+    "/transport",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("signup", by="ip"))],
+)
+async def create_transport(
+    request: AccountSchema, db: AsyncSession = Depends(get_async_db)
+):
+    await create_account(request, "TRANSPORT", db)
+    return request
+
+
+@router.get("", response_model=AccountResponseSchema)
+async def get_me(user: AccountSchema = Depends(get_current_user_async)):
+    return user
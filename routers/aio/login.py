@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, status, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import get_async_db
+from core.models import Account
+from core.authentication import generate_token
+from core.schemas import LoginSchema
+from core.passwords import verify_password
+from core.ratelimit import rate_limit
+
+router = APIRouter(
+    tags=["Auth"],
+)
+
+
+@router.post("/login", dependencies=[Depends(rate_limit("login", by="ip"))])
+async def login(
+    request: LoginSchema,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Async version of routers.v1.login.login
+
+    Args:
+        request (LoginSchema): json with account and address data
+        db (AsyncSession, optional): async database session
+
+    Raises:
+        HTTPException: User not founded - HTTP 404
+        HTTPException: Invalid password - HTTP 401
+        HTTPException: Too many logins waiting for bcrypt - HTTP 503
+
+    Returns:
+        dict containing access token, users's id and role
+    """
+
+    # Getting the user by the email
+    user = await db.scalar(select(Account).filter(Account.email == request.email))
+
+    # Raising exception if user == null
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Email not found/invalid",
+        )
+
+    # Verifying if is the correct password
+    if not await verify_password(request.password, user.password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid password",
+        )
+
+    # Setting additional data to retrieve with the token
+    access_token = generate_token(
+        data={
+            "id": user.id,
+            "role": user.role,
+        }
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
@@ -0,0 +1,279 @@
+from fastapi import APIRouter, HTTPException, status, Request, Response, Query
+from fastapi.params import Depends
+from typing import List, Literal, Optional
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import Order, ArchivedOrder
+from core.database import get_async_db
+from core.authentication import get_current_user_async
+from core.ratelimit import rate_limit
+from core.cache import etag_matches, not_modified
+from core.schemas import (
+    OrderResponseSchema,
+    AccountSchema,
+    DeliveryGroupSchema,
+    MonthSummarySchema,
+)
+from core.authorization import is_transport
+from core.pagination import (
+    split_page,
+    merge_pages,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+)
+from core.streaming import JSONStreamResponse
+from routers.v1.order import (
+    order_select,
+    order_sort,
+    order_sources,
+    order_list_select,
+    order_version_select,
+    order_etag,
+    page_etag,
+    stream_orders,
+    serialize_order,
+    available_groups_select,
+    available_orders_select,
+    delivery_groups,
+    summary_select,
+    summary_months,
+)
+
+router = APIRouter(
+    tags=["Order"],
+    prefix="/order",
+)
+
+
+async def order_pages(
+    db: AsyncSession,
+    user: AccountSchema,
+    limit: int,
+    after: Optional[str],
+    sort: str,
+    order_status: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    include_archived: bool,
+    versions: bool = False,
+):
+    """Async version of routers.v1.order.order_pages
+
+    Args:
+        db (AsyncSession): async database session
+        user (AccountSchema): logged account
+        limit (int): max number of orders on the page
+        after (str): cursor of the last order of the previous page
+        sort (str): 'status' (lowest status first) or 'recent'
+        order_status (int): only orders with this status
+        created_from (datetime): only orders created since this date
+        created_to (datetime): only orders created until this date
+        include_archived (bool): read the archived orders too
+        versions (bool, optional): only the id, status and version of the orders
+
+    Returns:
+        tuple: up to limit + 1 orders and the sort columns, to be used on split_page
+    """
+    pages = []
+    for archived in order_sources(include_archived, order_status):
+        query, columns = order_list_select(
+            user, limit, after, sort, order_status, created_from, created_to, archived,
+            versions,
+        )
+        if versions:
+            pages.append((await db.execute(query)).all())
+        else:
+            pages.append((await db.scalars(query)).all())
+
+    _, descending = order_sort(sort, order_status)
+    return merge_pages(pages, columns, limit, descending), columns
+
+
+@router.get(
+    "", response_model=List[OrderResponseSchema], dependencies=[Depends(rate_limit("order_list"))]
+)
+async def get_orders(
+    request: Request,
+    response: Response,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: Literal["status", "recent"] = "status",
+    order_status: Optional[int] = Query(default=None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    stream: bool = False,
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.order.get_orders
+
+    Args:
+        request (Request): request, to read the If-None-Match header
+        response (Response): response used to send the next cursor and ETag headers
+        limit (int, optional): max number of orders on the page
+        after (str, optional): cursor of the last order of the previous page
+        sort (str, optional): 'status' (lowest status first) or 'recent'
+        order_status (int, optional): only orders with this status
+        created_from (datetime, optional): only orders created since this date
+        created_to (datetime, optional): only orders created until this date
+        stream (bool, optional): send every order on a streamed response
+        include_archived (bool, optional): list the archived orders too
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        List[OrderResponseSchema]: orders of the logged account
+    """
+
+    # Verifying if the user is logged in
+    if user:
+        if stream:
+            # streamed from the sync read engine, on the threadpool
+            return JSONStreamResponse(
+                stream_orders(
+                    user, sort, order_status, created_from, created_to, include_archived
+                )
+            )
+
+        page = (
+            user, limit, after, sort, order_status, created_from, created_to, include_archived
+        )
+
+        # Comparing the versions first, the client may have the page already
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            orders, columns = await order_pages(db, *page, versions=True)
+            etag = page_etag(orders)
+            if etag_matches(if_none_match, etag):
+                _, next_cursor = split_page(orders, columns, limit)
+                return not_modified(
+                    etag, {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+                )
+
+        orders, columns = await order_pages(db, *page)
+        response.headers["ETag"] = page_etag(orders)
+        orders, next_cursor = split_page(orders, columns, limit)
+
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return [serialize_order(order) for order in orders]
+
+
+@router.get("/summary", response_model=List[MonthSummarySchema])
+async def get_summary(
+    from_month: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}$"),
+    to_month: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}$"),
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.order.get_summary
+
+    Args:
+        from_month (str, optional): first month (YYYY-MM)
+        to_month (str, optional): last month (YYYY-MM)
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        List[MonthSummarySchema]: orders and revenue per month, and per status
+    """
+    if is_transport(user):
+        return summary_months(await db.scalars(summary_select(user, from_month, to_month)))
+
+
+@router.get(
+    "/available",
+    response_model=List[DeliveryGroupSchema],
+    dependencies=[Depends(rate_limit("order_list"))],
+)
+async def get_available_orders(
+    response: Response,
+    digits: int = Query(default=5, ge=1, le=8),
+    cep: Optional[str] = Query(default=None, pattern=r"^\d{1,5}(-?\d{1,3})?$"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.order.get_available_orders
+
+    Args:
+        response (Response): response used to send the next cursor header
+        digits (int, optional): digits of the CEP prefix of a group
+        cep (str, optional): only addresses whose CEP starts with these digits
+        limit (int, optional): max number of groups on the page
+        after (str, optional): cursor of the last group of the previous page
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        List[DeliveryGroupSchema]: groups of orders, by CEP prefix and neighborhood
+    """
+    if is_transport(user):
+        query, columns = available_groups_select(user, digits, cep, limit, after)
+        groups, next_cursor = split_page((await db.execute(query)).all(), columns, limit)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        if not groups:
+            return []
+
+        rows = await db.execute(
+            available_orders_select(user, digits, cep, groups[0], groups[-1])
+        )
+        return delivery_groups(rows)
+
+
+@router.get("/{id}", response_model=OrderResponseSchema)
+async def get_order(
+    id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.order.get_order
+
+    Args:
+        id (int): id of the order
+        request (Request): request, to read the If-None-Match header
+        response (Response): response used to send the ETag header
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Raises:
+        HTTPException: product to founded - HTTP 404
+
+    Returns:
+        order (OrderResponseSchema)
+    """
+
+    # Verifying if the user is logged
+    if user:
+
+        # Comparing the version first, the client may have the order already
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            version = await db.scalar(order_version_select(id))
+            if version is None:
+                version = await db.scalar(order_version_select(id, archived=True))
+            if version is not None and etag_matches(if_none_match, order_etag(id, version)):
+                return not_modified(order_etag(id, version))
+
+        # Searching for the order, with items, products and accounts
+        order = (await db.scalars(order_select().filter(Order.id == id))).first()
+        if order is None:
+            order = (
+                await db.scalars(order_select(archived=True).filter(ArchivedOrder.id == id))
+            ).first()
+        if order:
+            response.headers["ETag"] = order_etag(order.id, order.version)
+            return serialize_order(order)
+
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
+            )
@@ -0,0 +1,155 @@
+from fastapi import APIRouter, HTTPException, status, Request, Query
+from fastapi.params import Depends
+from typing import List, Literal, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.schemas import ProductSchema, ProductSearchSchema, AccountSchema
+from core.models import Product
+from core.database import get_async_db
+from core.authentication import get_current_user_async
+from core.authorization import is_user
+from core.ratelimit import rate_limit
+from core.cache import catalog_cache
+from core.pagination import split_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from core.streaming import JSONStreamResponse
+from routers.v1.product import (
+    product_list_select,
+    product_search_select,
+    search_adapter,
+    product_documents,
+    cache_products,
+    cache_product,
+)
+
+
+router = APIRouter(
+    tags=["Product"],
+    prefix="/product",
+)
+
+
+@router.get("", response_model=List[ProductSchema])
+async def get_products(
+    request: Request,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: Literal["id", "price"] = "id",
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.product.get_products
+
+    Args:
+        request (Request): request, to read the If-None-Match header
+        limit (int, optional): max number of products on the page
+        after (str, optional): cursor of the last product of the previous page
+        sort (str, optional): 'id' (oldest first) or 'price' (cheapest first)
+        min_price (float, optional): only products costing at least this
+        max_price (float, optional): only products costing at most this
+        stream (bool, optional): send every product on a streamed response
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        List[ProductSchema]: products of the page
+    """
+    if is_user(user):
+        if stream:
+            # streamed from the sync read engine, on the threadpool
+            return JSONStreamResponse(product_documents(sort, min_price, max_price))
+
+        key = ("list", limit, after, sort, min_price, max_price)
+        cached, version = await catalog_cache.get_async(db, key)
+        if cached:
+            return cached.to_response(request, "HIT")
+
+        query, columns = product_list_select(limit, after, sort, min_price, max_price)
+        products = (await db.scalars(query)).all()
+        products, next_cursor = split_page(products, columns, limit)
+
+        cached = cache_products(key, products, next_cursor, version)
+        return cached.to_response(request, "MISS")
+
+
+@router.get(
+    "/search",
+    response_model=List[ProductSearchSchema],
+    dependencies=[Depends(rate_limit("product_search"))],
+)
+async def search_products(
+    request: Request,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.product.search_products
+
+    Args:
+        request (Request): request, to read the If-None-Match header
+        q (str): words to search
+        limit (int, optional): max number of products on the page
+        after (str, optional): cursor of the last product of the previous page
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Raises:
+        HTTPException: Search without words - HTTP 400
+
+    Returns:
+        List[ProductSearchSchema]: products found, best matches first
+    """
+    if is_user(user):
+        key = ("search", q, limit, after)
+        cached, version = await catalog_cache.get_async(db, key)
+        if cached:
+            return cached.to_response(request, "HIT")
+
+        query, columns = product_search_select(q, limit, after)
+        products = (await db.execute(query)).all()
+        products, next_cursor = split_page(products, columns, limit)
+
+        cached = cache_products(key, products, next_cursor, version, search_adapter)
+        return cached.to_response(request, "MISS")
+
+
+@router.get("/{id}", response_model=ProductSchema)
+async def get_product(
+    id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user: AccountSchema = Depends(get_current_user_async),
+):
+    """Async version of routers.v1.product.get_product
+
+    Args:
+        id (int): id of the product
+        request (Request): request, to read the If-None-Match header
+        db (AsyncSession, optional): async database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Raises:
+        HTTPException: Product not founded
+
+    Returns:
+        ProductSchema: data from the specific product
+    """
+    if is_user(user):
+        key = ("item", id)
+        cached, version = await catalog_cache.get_async(db, key)
+        if cached:
+            return cached.to_response(request, "HIT")
+
+        product = await db.get(Product, id)
+        if product:
+            cached = cache_product(key, product, version)
+            return cached.to_response(request, "MISS")
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
+            )
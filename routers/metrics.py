@@ -0,0 +1,122 @@
+import os
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import registry
+from core.startup import startup
+from core.passwords import password_hasher
+from core.cache import catalog_cache
+from core.authentication import token_cache, principal_cache
+from core.events import bus
+from core.jobs import job_workers
+from core.ratelimit import limiter
+
+router = APIRouter(
+    tags=["Metrics"],
+)
+
+# When set, /metrics requires the header 'Authorization: Bearer <token>'
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+def gauge(name: str, help: str, value, kind: str = "gauge", labels: str = ""):
+    """Method to render a single value on the Prometheus text format
+
+    Args:
+        name (str): name of the metric
+        help (str): description of the metric
+        value: current value
+        kind (str, optional): 'gauge' or 'counter'
+        labels (str, optional): labels of the series, already formatted
+
+    Returns:
+        list: lines of the exposition format
+    """
+    labels = f"{{{labels}}}" if labels else ""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name}{labels} {value}"]
+
+
+def cache_lines(name: str, stats: dict):
+    """Method to render the counters of a cache"""
+    labels = f'cache="{name}"'
+    return [
+        f"cache_entries{{{labels}}} {stats['size']}",
+        f"cache_hits_total{{{labels}}} {stats['hits']}",
+        f"cache_misses_total{{{labels}}} {stats['misses']}",
+    ]
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Method to expose the metrics of this process on the Prometheus text format:
+    latency, SQL statements, SQL time and bcrypt time per route, and the
+    state of the password hashing pool, the caches, the event bus and the
+    rate limiter, and the startup time of the worker
+
+    Args:
+        request (Request): request, to read the Authorization header
+
+    Raises:
+        HTTPException: Invalid metrics token - HTTP 401
+
+    Returns:
+        PlainTextResponse: metrics on the text exposition format
+    """
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token"
+        )
+
+    lines = registry.render()
+
+    hasher = password_hasher.stats()
+    lines += gauge("password_hash_in_flight", "Hashes running or queued", hasher["in_flight"])
+    lines += gauge(
+        "password_hash_rejected_total", "Hashes refused with HTTP 503",
+        hasher["rejected"], "counter",
+    )
+    lines += gauge(
+        "password_hash_seconds_total", "Time spent on bcrypt",
+        hasher["hash_seconds_total"], "counter",
+    )
+    lines += gauge(
+        "password_hash_wait_seconds_total", "Time waiting for a hashing worker",
+        hasher["wait_seconds_total"], "counter",
+    )
+
+    lines += [
+        "# HELP cache_entries Entries on the cache",
+        "# TYPE cache_entries gauge",
+        "# HELP cache_hits_total Lookups found on the cache",
+        "# TYPE cache_hits_total counter",
+        "# HELP cache_misses_total Lookups not found on the cache",
+        "# TYPE cache_misses_total counter",
+    ]
+    lines += cache_lines("catalog", catalog_cache.stats())
+    lines += cache_lines("token", token_cache.stats())
+    lines += cache_lines("principal", principal_cache.stats())
+
+    events = bus.stats()
+    lines += gauge("events_subscribers", "Open order streams", events["subscribers"])
+    lines += gauge(
+        "events_published_total", "Events published by this process",
+        events["published"], "counter",
+    )
+
+    lines += job_workers.lines()
+
+    admission = limiter.stats()
+    lines += [
+        "# HELP ratelimit_rejected_total Requests refused before running, per budget and reason",
+        "# TYPE ratelimit_rejected_total counter",
+    ]
+    for (budget, reason), count in sorted(admission["rejected"].items()):
+        lines.append(f'ratelimit_rejected_total{{budget="{budget}",reason="{reason}"}} {count}')
+    lines += gauge("ratelimit_buckets", "Token buckets tracked", admission["buckets"])
+
+    lines += startup.lines()
+
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
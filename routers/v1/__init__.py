@@ -1,10 +1,14 @@
 from fastapi import APIRouter
-from . import account, login, order, product
+from . import account, login, order, order_stream, product, product_bulk
 
 
 router = APIRouter(prefix="/api/v1")
 
 router.include_router(account.router)
 router.include_router(login.router)
+# before order, so '/order/stream' is not taken as '/order/{id}'
+router.include_router(order_stream.router)
 router.include_router(order.router)
+# before product, so '/product/export' is not taken as '/product/{id}'
+router.include_router(product_bulk.router)
 router.include_router(product.router)
\ No newline at end of file
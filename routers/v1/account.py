@@ -1,54 +1,133 @@
 from fastapi import APIRouter, status, HTTPException
 from fastapi.params import Depends
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
 from email_validator import validate_email, EmailSyntaxError
 
 from core.database import get_db
 from core.schemas import AccountSchema, AccountResponseSchema
 from core.models import Account, Address
-from core.authentication import get_current_user
+from core.authentication import get_current_user, invalidate_account
+from core.passwords import hash_password
+from core.ratelimit import rate_limit
 
 router = APIRouter(
     tags=["Account"],
     prefix="/account",
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-
-def create_account(request: AccountSchema, role: str, db: Session):
-    """Method to create an account into de database
+async def prepare_account(request: AccountSchema):
+    """Method to validate the data of a new account and hash its password
 
     Args:
         request (AccountSchema): json with account and address data
-        role (str): role of the new account
-        db (Session): database session
 
     Raises:
         HTTPException: Password less than 6 characters
+        HTTPException: Too many passwords waiting for bcrypt - HTTP 503
         EmailSyntaxError: Invalid email
-        IntegrityError: Email duplicated (already inserted on database)
 
     Returns:
-        request (AccountSchema): all the data received
+        hashed_password (str): password ready to be saved
     """
 
     try:
         # Validating Email
         validate_email(request.email, check_deliverability=False)
 
-        # Validating Password
-        if len(request.password) < 6:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Password must be at least 6 characters",
-            )
+    except EmailSyntaxError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Email"
+        )
 
-        # Hashing password
-        hashed_password = pwd_context.hash(request.password)
+    # Validating Password
+    if len(request.password) < 6:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Password must be at least 6 characters",
+        )
+
+    # Hashing password, on the password hashing workers
+    return await hash_password(request.password)
+
+
+def new_address(request: AccountSchema, user_id: int):
+    """Method to build the address of a new account
+
+    Args:
+        request (AccountSchema): json with account and address data
+        user_id (int): id of the new account
 
+    Returns:
+        Address: address to be added on the session
+    """
+    return Address(
+        account_id=user_id,
+        complement=request.complement,
+        street=request.street,
+        house_number=request.house_number,
+        neighborhood=request.neighborhood,
+        city=request.city,
+        state=request.state,
+        CEP=request.CEP,
+    )
+
+
+def duplicated_account(error: IntegrityError):
+    """Method to convert a database integrity error into an http error
+
+    Args:
+        error (IntegrityError): error raised when saving the account
+
+    Returns:
+        HTTPException: http 400 with the constraint that failed
+    """
+    message = (
+        str(error.orig).split(":")[0]
+        + ": "
+        + str(error.orig).split(":")[1].split(".")[1]
+    )
+    return HTTPException(detail=message, status_code=status.HTTP_400_BAD_REQUEST)
+
+
+async def create_account(request: AccountSchema, role: str, db: Session):
+    """Method to create an account into de database
+
+    Args:
+        request (AccountSchema): json with account and address data
+        role (str): role of the new account
+        db (Session): database session
+
+    Raises:
+        HTTPException: Invalid data, see prepare_account
+        IntegrityError: Email duplicated (already inserted on database)
+
+    Returns:
+        user_id (int): id of the new account
+    """
+    hashed_password = await prepare_account(request)
+    return await run_in_threadpool(save_account, request, role, hashed_password, db)
+
+
+def save_account(request: AccountSchema, role: str, hashed_password: str, db: Session):
+    """Method to insert the account and its address into the database
+
+    Args:
+        request (AccountSchema): json with account and address data
+        role (str): role of the new account
+        hashed_password (str): password already hashed
+        db (Session): database session
+
+    Raises:
+        IntegrityError: Email duplicated (already inserted on database)
+
+    Returns:
+        user_id (int): id of the new account
+    """
+
+    try:
         # Adding user into the database
         new_user = Account(
             name=request.name,
@@ -58,46 +137,37 @@ def create_account(request: AccountSchema, role: str, db: Session):
         )
         db.add(new_user)
 
-        # Getting the id of the last acount
-        user_id = db.query(Account).order_by(Account.id.desc()).first().id
+        # Getting the id of the new account
+        db.flush()
+        user_id = new_user.id
 
         # Adding address into the database
-        address = Address(
-            account_id=user_id,
-            complement=request.complement,
-            street=request.street,
-            house_number=request.house_number,
-            neighborhood=request.neighborhood,
-            city=request.city,
-            state=request.state,
-            CEP=request.CEP,
-        )
-
-        db.add(address)
+        db.add(new_address(request, user_id))
         db.commit()
+        invalidate_account(user_id)
         return user_id
 
-    except EmailSyntaxError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Email"
-        )
-
     except IntegrityError as e:
-        message = (
-            str(e.orig).split(":")[0] + ": " + str(e.orig).split(":")[1].split(".")[1]
-        )
-        raise HTTPException(detail=message, status_code=status.HTTP_400_BAD_REQUEST)
+        raise duplicated_account(e)
 
 
-@router.post("/user", status_code=status.HTTP_201_CREATED)
-def create_user(request: AccountSchema, db: Session = Depends(get_db)):
-    create_account(request, "USER", db)
+@router.post(
+    "/user",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("signup", by="ip"))],
+)
+async def create_user(request: AccountSchema, db: Session = Depends(get_db)):
+    await create_account(request, "USER", db)
     return request
 
 
-@router.post("/transport", status_code=status.HTTP_201_CREATED)
-def create_transport(request: AccountSchema, db: Session = Depends(get_db)):
-    create_account(request, "TRANSPORT", db)
+@router.post(
+    "/transport",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("signup", by="ip"))],
+)
+async def create_transport(request: AccountSchema, db: Session = Depends(get_db)):
+    await create_account(request, "TRANSPORT", db)
     return request
 
 
@@ -1,23 +1,23 @@
 from fastapi import APIRouter, Depends, status, HTTPException
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from core.database import get_db
+from core.database import get_read_db
 from core.models import Account
 from core.authentication import generate_token
 from core.schemas import LoginSchema
+from core.passwords import verify_password
+from core.ratelimit import rate_limit
 
 router = APIRouter(
     tags=["Auth"],
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-
-@router.post("/login")
-def login(
+@router.post("/login", dependencies=[Depends(rate_limit("login", by="ip"))])
+async def login(
     request: LoginSchema,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Method to Login and retrieve jwt access token,
 
@@ -28,13 +28,16 @@ def login(
     Raises:
         HTTPException: User not founded - HTTP 404
         HTTPException: Invalid password - HTTP 401
+        HTTPException: Too many logins waiting for bcrypt - HTTP 503
 
     Returns:
         dict containing access token, users's id and role
     """
 
     # Getting the user by the email
-    user = db.query(Account).filter(Account.email == request.email).first()
+    user = await run_in_threadpool(
+        db.query(Account).filter(Account.email == request.email).first
+    )
 
     # Raising exception if user == null
     if not user:
@@ -44,7 +47,7 @@ def login(
         )
 
     # Verifying if is the correct password
-    if not pwd_context.verify(request.password, user.password):
+    if not await verify_password(request.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid password",
@@ -1,17 +1,59 @@
-from fastapi import APIRouter, HTTPException, status, Response
+from fastapi import APIRouter, HTTPException, status, Request, Response, Query
 from fastapi.params import Depends
-from typing import List
+from typing import List, Literal, Optional
+from datetime import datetime
+from collections import Counter
+from itertools import groupby
+from operator import getitem, itemgetter
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, func, tuple_
+from sqlalchemy.orm import Session, selectinload
 
-from core.models import Order, OrderItem, Product, Account
-from core.database import get_db
+from core.models import (
+    Order,
+    OrderItem,
+    ArchivedOrder,
+    Product,
+    Account,
+    Address,
+    OrderSummary,
+    cep_digits,
+)
+from core.archive import order_models, may_be_archived
+from core.database import get_db, get_read_db
 from core.authentication import get_current_user
 from core.authorization import is_user, is_transport
+from core.ratelimit import rate_limit
+from core.summary import record_order
+from core.transitions import (
+    TRANSITIONS,
+    AVAILABLE_STATUS,
+    NOT_FOUND,
+    INVALID,
+    apply_transition,
+    to_status,
+)
+from core.events import publish_after_commit
+from core.cache import etag_matches, version_etag, not_modified
+from core.streaming import stream_rows, JSONStreamResponse
+from core.pagination import (
+    keyset_page,
+    split_page,
+    merge_sorted,
+    merge_pages,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+)
 from core.schemas import (
     OrderSchema,
     OrderResponseSchema,
     AccountSchema,
+    MonthSummarySchema,
+    OrderStatusSchema,
+    OrderBatchSchema,
+    OrderBatchResultSchema,
+    DeliveryGroupSchema,
 )
 
 router = APIRouter(
@@ -44,75 +86,753 @@ def get_status_message(status: int):
             return "order delivered"
 
 
-@router.get("", response_model=List[OrderResponseSchema])
+def status_event(order: Order, new_status: int):
+    """Method to build the event of a new order or a status change, published
+    on the bus after the commit to the customer and the transport company
+
+    Args:
+        order (Order): order being changed
+        new_status (int): status after the change
+
+    Returns:
+        tuple: accounts allowed to receive the event, and its data
+    """
+    return [order.user_id, order.transport_id], {
+        "type": "status",
+        "order_id": order.id,
+        "status": new_status,
+        "status_msg": get_status_message(new_status),
+    }
+
+
+def order_select(archived: bool = False):
+    """Method to build the base statement used to read orders
+
+    The orders keep the names of their accounts, and the items a snapshot
+    of their products, so reading any number of orders costs two queries
+    without joins: one for the orders and one for all their items.   \n
+    It is shared by the sync and the async routers.
+
+    Args:
+        archived (bool, optional): read the archived orders instead
+
+    Returns:
+        Select: select over Order (or ArchivedOrder) with the eager loading options
+    """
+    model, _ = order_models(archived)
+    return select(model).options(selectinload(model.items))
+
+
+def order_filters(
+    user: AccountSchema,
+    order_status: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    archived: bool = False,
+):
+    """Method to build the conditions of the order list of an account
+
+    Args:
+        user (AccountSchema): logged account
+        order_status (int): only orders with this status
+        created_from (datetime): only orders created since this date
+        created_to (datetime): only orders created until this date
+        archived (bool, optional): conditions over the archived orders
+
+    Returns:
+        list: conditions to be used on filter
+    """
+    model, _ = order_models(archived)
+
+    # Defying query depending of user's role:
+    if user.role == "TRANSPORT":
+        query = model.transport_id
+    if user.role == "USER":
+        query = model.user_id
+    filters = [query == user.id]
+
+    # Applying the filters
+    if order_status is not None:
+        filters.append(model.status == order_status)
+    if created_from:
+        filters.append(model.created_at >= created_from)
+    if created_to:
+        filters.append(model.created_at <= created_to)
+    return filters
+
+
+def order_sort(sort: str, order_status: Optional[int], archived: bool = False):
+    """Method to get the columns that sort the order list
+
+    Args:
+        sort (str): 'status' (lowest status first) or 'recent'
+        order_status (int): status filter, if any
+        archived (bool, optional): columns of the archived orders
+
+    Returns:
+        tuple: sort columns and if they are descending
+    """
+    model, _ = order_models(archived)
+    if sort == "recent":
+        return [model.id], True
+    if order_status is not None:
+        # A single status, the id alone keeps the order and follows the index
+        return [model.id], False
+    return [model.status, model.id], False
+
+
+def order_sources(include_archived: bool, order_status: Optional[int]):
+    """Method to get the tables read by an order list
+
+    Args:
+        include_archived (bool): history asked for, with the archived orders
+        order_status (int): status filter, if any
+
+    Returns:
+        list: False for the hot orders, True for the archived ones
+    """
+    if include_archived and may_be_archived(order_status):
+        return [False, True]
+    return [False]
+
+
+def order_list_select(
+    user: AccountSchema,
+    limit: int,
+    after: Optional[str],
+    sort: str,
+    order_status: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    archived: bool = False,
+    versions: bool = False,
+):
+    """Method to build the statement of one page of the order list
+
+    Args:
+        user (AccountSchema): logged account
+        limit (int): max number of orders on the page
+        after (str): cursor of the last order of the previous page
+        sort (str): 'status' (lowest status first) or 'recent'
+        order_status (int): only orders with this status
+        created_from (datetime): only orders created since this date
+        created_to (datetime): only orders created until this date
+        archived (bool, optional): page of the archived orders
+        versions (bool, optional): only the id, status and version of the orders,
+            enough for the ETag of the page
+
+    Returns:
+        tuple: select of the page and the sort columns, to be used on split_page
+    """
+    model, _ = order_models(archived)
+    if versions:
+        orders = select(model.id, model.status, model.version)
+    else:
+        # Getting orders, with items, products and accounts already loaded
+        orders = order_select(archived)
+    orders = orders.filter(
+        *order_filters(user, order_status, created_from, created_to, archived)
+    )
+
+    # Getting only the requested page
+    columns, descending = order_sort(sort, order_status, archived)
+    return keyset_page(orders, columns, after, limit, descending=descending), columns
+
+
+def order_rows_select(
+    user: AccountSchema,
+    sort: str,
+    order_status: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    archived: bool = False,
+):
+    """Method to build a column-only statement of the whole order list,
+    one row per item, with the rows of each order next to each other.
+    It is read by order_documents, for the streamed responses
+
+    Args:
+        user (AccountSchema): logged account
+        sort (str): 'status' (lowest status first) or 'recent'
+        order_status (int): only orders with this status
+        created_from (datetime): only orders created since this date
+        created_to (datetime): only orders created until this date
+        archived (bool, optional): rows of the archived orders
+
+    Returns:
+        Select: select of plain columns
+    """
+    model, item = order_models(archived)
+    columns, descending = order_sort(sort, order_status, archived)
+    return (
+        select(
+            model.id,
+            model.total_price,
+            model.status,
+            model.customer_name,
+            model.transport_name,
+            model.version,
+            item.product_name,
+            item.product_description,
+            item.unit_price,
+            item.quantity,
+        )
+        .outerjoin(item, item.order_id == model.id)
+        .filter(*order_filters(user, order_status, created_from, created_to, archived))
+        .order_by(*(column.desc() if descending else column for column in columns))
+    )
+
+
+def order_documents(rows):
+    """Method to group the rows of order_rows_select into orders,
+    on the same format of serialize_order
+
+    Args:
+        rows: rows of order_rows_select, read one at a time
+
+    Yields:
+        dict: data matching with OrderResponseSchema
+    """
+    for _, items in groupby(rows, key=itemgetter(0)):
+        items = list(items)
+        id, total_price, order_status, user, transport, version = items[0][:6]
+        yield {
+            "id": id,
+            "total_price": total_price,
+            "status": order_status,
+            "version": version,
+            "user": user,
+            "transport": transport,
+            "status_msg": get_status_message(order_status),
+            "products": [
+                {
+                    "name": name,
+                    "description": description,
+                    "price": price,
+                    "quantity": quantity,
+                }
+                for *_, name, description, price, quantity in items
+                if name is not None
+            ],
+        }
+
+
+def stream_orders(
+    user: AccountSchema,
+    sort: str,
+    order_status: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    include_archived: bool,
+):
+    """Method to read the whole order list for a streamed response,
+    merging the archived orders when asked for
+
+    Args:
+        user (AccountSchema): logged account
+        sort (str): 'status' (lowest status first) or 'recent'
+        order_status (int): only orders with this status
+        created_from (datetime): only orders created since this date
+        created_to (datetime): only orders created until this date
+        include_archived (bool): read the archived orders too
+
+    Returns:
+        documents matching with OrderResponseSchema, in the sort order
+    """
+    documents = [
+        order_documents(
+            stream_rows(
+                order_rows_select(
+                    user, sort, order_status, created_from, created_to, archived
+                )
+            )
+        )
+        for archived in order_sources(include_archived, order_status)
+    ]
+    if len(documents) == 1:
+        return documents[0]
+    columns, descending = order_sort(sort, order_status)
+    return merge_sorted(documents, columns, descending, get=getitem)
+
+
+def order_pages(
+    db: Session,
+    user: AccountSchema,
+    limit: int,
+    after: Optional[str],
+    sort: str,
+    order_status: Optional[int],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    include_archived: bool,
+    versions: bool = False,
+):
+    """Method to read one page of the order list, merging the archived orders
+    when asked for
+
+    The same page is read from each table, the hot one first: an order
+    archived meanwhile is found on both, never on none.
+
+    Args:
+        db (Session): database session
+        user (AccountSchema): logged account
+        limit (int): max number of orders on the page
+        after (str): cursor of the last order of the previous page
+        sort (str): 'status' (lowest status first) or 'recent'
+        order_status (int): only orders with this status
+        created_from (datetime): only orders created since this date
+        created_to (datetime): only orders created until this date
+        include_archived (bool): read the archived orders too
+        versions (bool, optional): only the id, status and version of the orders
+
+    Returns:
+        tuple: up to limit + 1 orders and the sort columns, to be used on split_page
+    """
+    pages = []
+    for archived in order_sources(include_archived, order_status):
+        query, columns = order_list_select(
+            user, limit, after, sort, order_status, created_from, created_to, archived,
+            versions,
+        )
+        pages.append(db.execute(query).all() if versions else db.scalars(query).all())
+
+    _, descending = order_sort(sort, order_status)
+    return merge_pages(pages, columns, limit, descending), columns
+
+
+def page_etag(orders: list):
+    """Method to build the ETag of a page of orders, from the orders read by order_pages
+
+    Args:
+        orders (list): up to limit + 1 orders, so the next page changes it too
+
+    Returns:
+        str: ETag of the page
+    """
+    return version_etag("orders", ((order.id, order.version) for order in orders))
+
+
+def order_etag(id: int, version: int):
+    """Method to build the ETag of a single order
+
+    Args:
+        id (int): id of the order
+        version (int): version of the order
+
+    Returns:
+        str: ETag of the order
+    """
+    return version_etag("order", [(id, version)])
+
+
+def order_version_select(id: int, archived: bool = False):
+    """Method to build the statement that reads only the version of an order,
+    by its primary key
+
+    Args:
+        id (int): id of the order
+        archived (bool, optional): read the archived orders instead
+
+    Returns:
+        Select: select of the version
+    """
+    model, _ = order_models(archived)
+    return select(model.version).filter(model.id == id)
+
+
+def serialize_order(order: Order):
+    """Method to convert an order loaded by order_select into the response format
+
+    Args:
+        order (Order): order (or archived order) with the relationships already loaded
+
+    Returns:
+        dict: data matching with OrderResponseSchema
+    """
+    return {
+        "id": order.id,
+        "total_price": order.total_price,
+        "status": order.status,
+        "version": order.version,
+        "user": order.customer_name,
+        "transport": order.transport_name,
+        "status_msg": get_status_message(order.status),
+        "products": [
+            {
+                "name": item.product_name,
+                "description": item.product_description,
+                "price": item.unit_price,
+                "quantity": item.quantity,
+            }
+            for item in order.items
+            # items of products deleted before the snapshots existed
+            if item.product_name is not None
+        ],
+    }
+
+
+@router.get(
+    "", response_model=List[OrderResponseSchema], dependencies=[Depends(rate_limit("order_list"))]
+)
 def get_orders(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: Literal["status", "recent"] = "status",
+    order_status: Optional[int] = Query(default=None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    stream: bool = False,
+    include_archived: bool = False,
+    db: Session = Depends(get_read_db),
     user: AccountSchema = Depends(get_current_user),
 ):
     """Endpoint to get all orders, depending of the logged account role:    \n
     if the role is 'USER', can view only your orders    \n
-    if the role is 'TRANSPORT', can view only orders that it can transport
+    if the role is 'TRANSPORT', can view only orders that it can transport  \n
+    The list is paginated by cursor: when there are more orders, the cursor
+    of the next page is sent on the 'X-Next-Cursor' header, to be used as 'after'.  \n
+    With 'stream', every order is sent at once, on a chunked response
+    encoded while the orders are read, ignoring 'limit' and 'after'   \n
+    Delivered and refused orders moved to the archive are listed only
+    with 'include_archived'   \n
+    Pages carry an ETag built from the versions of their orders, and are
+    answered with HTTP 304 when the 'If-None-Match' header matches with it,
+    reading only the versions
 
     Args:
+        request (Request): request, to read the If-None-Match header
+        response (Response): response used to send the next cursor and ETag headers
+        limit (int, optional): max number of orders on the page
+        after (str, optional): cursor of the last order of the previous page
+        sort (str, optional): 'status' (lowest status first) or 'recent'
+        order_status (int, optional): only orders with this status
+        created_from (datetime, optional): only orders created since this date
+        created_to (datetime, optional): only orders created until this date
+        stream (bool, optional): send every order on a streamed response
+        include_archived (bool, optional): list the archived orders too
         db (Session, optional): database session
         user (AccountSchema, optional): jwt access token on the header
 
     Returns:
-        _type_: _description_
+        List[OrderResponseSchema]: orders of the logged account
     """
 
     # Verifying if the user is logged in
     if user:
+        if stream:
+            return JSONStreamResponse(
+                stream_orders(
+                    user, sort, order_status, created_from, created_to, include_archived
+                )
+            )
 
-        # Defying query depending of user's role:
-        if user.role == "TRANSPORT":
-            query = Order.transport_id
-        if user.role == "USER":
-            query = Order.user_id
-
-        # Getting orders
-        orders = db.query(Order).filter(query == user.id).order_by(Order.status).all()
-
-        # Verifying the there is at least one order
-        if orders:
-
-            # getting each products, of each order:
-            for order in orders:
-
-                items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
-                products = []
-                for item in items:
-                    product = (
-                        db.query(Product).filter(Product.id == item.product_id).first()
-                    )
-                    products.append(product)
-                order.products = products
-
-                user = db.query(Account).filter(Account.id == order.user_id).first()
-                transport = (
-                    db.query(Account).filter(Account.id == order.transport_id).first()
+        page = (
+            user, limit, after, sort, order_status, created_from, created_to, include_archived
+        )
+
+        # Comparing the versions first, the client may have the page already
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            orders, columns = order_pages(db, *page, versions=True)
+            etag = page_etag(orders)
+            if etag_matches(if_none_match, etag):
+                _, next_cursor = split_page(orders, columns, limit)
+                return not_modified(
+                    etag, {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
                 )
 
-                # setting product data into the orders:
-                order.user = user.name
-                order.transport = transport.name
-                order.status_msg = get_status_message(order.status)
+        orders, columns = order_pages(db, *page)
+        response.headers["ETag"] = page_etag(orders)
+        orders, next_cursor = split_page(orders, columns, limit)
 
-            return orders
-        else:
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return [serialize_order(order) for order in orders]
+
+
+def summary_select(user: AccountSchema, from_month: Optional[str], to_month: Optional[str]):
+    """Method to build the select of the summary rows of a transport company
+
+    Args:
+        user (AccountSchema): logged transport company
+        from_month (str): first month (YYYY-MM)
+        to_month (str): last month (YYYY-MM)
+
+    Returns:
+        Select: summary rows, by month and status
+    """
+    query = select(OrderSummary).filter(
+        OrderSummary.transport_id == user.id, OrderSummary.orders > 0
+    )
+    if from_month:
+        query = query.filter(OrderSummary.month >= from_month)
+    if to_month:
+        query = query.filter(OrderSummary.month <= to_month)
+    return query.order_by(OrderSummary.month, OrderSummary.status)
+
+
+def summary_months(rows):
+    """Method to group the statuses of each month of the summary
+
+    Args:
+        rows: summary rows, sorted by month
+
+    Returns:
+        list: orders and revenue per month, and per status
+    """
+    months = {}
+    for row in rows:
+        month = months.setdefault(
+            row.month,
+            {"month": row.month, "orders": 0, "revenue": 0, "statuses": []},
+        )
+        month["orders"] += row.orders
+        month["revenue"] += row.revenue
+        month["statuses"].append(
+            {
+                "status": row.status,
+                "status_msg": get_status_message(row.status),
+                "orders": row.orders,
+                "revenue": row.revenue,
+            }
+        )
+    return list(months.values())
+
+
+@router.get("/summary", response_model=List[MonthSummarySchema])
+def get_summary(
+    from_month: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}$"),
+    to_month: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}$"),
+    db: Session = Depends(get_read_db),
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Method to get the monthly summary of the orders of the logged transport company,
+    read from the summary table, without going through the orders
+
+    Args:
+        from_month (str, optional): first month (YYYY-MM)
+        to_month (str, optional): last month (YYYY-MM)
+        db (Session, optional): database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        List[MonthSummarySchema]: orders and revenue per month, and per status
+    """
+    if is_transport(user):
+        return summary_months(db.scalars(summary_select(user, from_month, to_month)))
+
+
+def delivery_group_key(digits: int):
+    """Method to get the columns that group the available orders
+
+    Args:
+        digits (int): digits of the CEP prefix of a group
+
+    Returns:
+        list: CEP prefix and neighborhood of the customer address
+    """
+    return [
+        func.substr(func.coalesce(cep_digits(Address.CEP), ""), 1, digits).label("cep_prefix"),
+        func.coalesce(Address.neighborhood, "").label("neighborhood"),
+    ]
+
+
+def available_select(columns: list, user: AccountSchema, cep: Optional[str]):
+    """Method to build a select over the available orders of the logged
+    transport company, joined to the address of their customers
+
+    Args:
+        columns (list): columns to select
+        user (AccountSchema): logged transport company, or an admin (every company)
+        cep (str): only addresses whose CEP starts with these digits
+
+    Returns:
+        Select: select already filtered
+    """
+    query = (
+        select(*columns)
+        .select_from(Order)
+        .outerjoin(Address, Address.account_id == Order.user_id)
+        .filter(Order.status == AVAILABLE_STATUS)
+    )
+    transport_id = transport_scope(user)
+    if transport_id is not None:
+        query = query.filter(Order.transport_id == transport_id)
+    if cep:
+        # every CEP starting with the digits, a range of ix_address_cep
+        digits = cep.replace("-", "")
+        query = query.filter(
+            cep_digits(Address.CEP) >= digits,
+            cep_digits(Address.CEP) < digits[:-1] + chr(ord(digits[-1]) + 1),
+        )
+    return query
+
+
+def available_groups_select(
+    user: AccountSchema, digits: int, cep: Optional[str], limit: int, after: Optional[str]
+):
+    """Method to build the statement of one page of delivery groups
+
+    Args:
+        user (AccountSchema): logged transport company
+        digits (int): digits of the CEP prefix of a group
+        cep (str): only addresses whose CEP starts with these digits
+        limit (int): max number of groups on the page
+        after (str): cursor of the last group of the previous page
+
+    Returns:
+        tuple: select of the page and the group columns, to be used on split_page
+    """
+    columns = delivery_group_key(digits)
+    groups = available_select(columns, user, cep).group_by(*columns)
+    return keyset_page(groups, columns, after, limit), columns
+
+
+def available_orders_select(
+    user: AccountSchema, digits: int, cep: Optional[str], first, last
+):
+    """Method to build the statement of the orders of a page of delivery groups,
+    the groups are next to each other on the sort order, so a single range
+
+    Args:
+        user (AccountSchema): logged transport company
+        digits (int): digits of the CEP prefix of a group
+        cep (str): only addresses whose CEP starts with these digits
+        first: first group of the page
+        last: last group of the page
+
+    Returns:
+        Select: select of plain columns, sorted by group and order
+    """
+    columns = delivery_group_key(digits)
+    key = tuple_(*columns)
+    return (
+        available_select(
+            columns
+            + [
+                Order.id,
+                Order.version,
+                Order.total_price,
+                Order.customer_name,
+                Address.city,
+                Address.state,
+                Address.street,
+                Address.house_number,
+                Address.complement,
+                Address.CEP,
+            ],
+            user,
+            cep,
+        )
+        .filter(key >= tuple_(*first), key <= tuple_(*last))
+        .order_by(*columns, Order.id)
+    )
+
+
+def delivery_groups(rows):
+    """Method to group the rows of available_orders_select
+
+    Args:
+        rows: rows of available_orders_select
+
+    Returns:
+        list: data matching with DeliveryGroupSchema
+    """
+    groups = []
+    for (prefix, neighborhood), orders in groupby(rows, key=itemgetter(0, 1)):
+        orders = list(orders)
+        groups.append(
+            {
+                "cep_prefix": prefix,
+                "neighborhood": neighborhood,
+                "city": orders[0].city,
+                "state": orders[0].state,
+                "orders": [
+                    {
+                        "id": order.id,
+                        "version": order.version,
+                        "total_price": order.total_price,
+                        "user": order.customer_name,
+                        "street": order.street,
+                        "house_number": order.house_number,
+                        "complement": order.complement,
+                        "CEP": order.CEP,
+                    }
+                    for order in orders
+                ],
+            }
+        )
+    return groups
+
+
+@router.get(
+    "/available",
+    response_model=List[DeliveryGroupSchema],
+    dependencies=[Depends(rate_limit("order_list"))],
+)
+def get_available_orders(
+    response: Response,
+    digits: int = Query(default=5, ge=1, le=8),
+    cep: Optional[str] = Query(default=None, pattern=r"^\d{1,5}(-?\d{1,3})?$"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Method to get the orders ready to be delivered by the logged transport
+    company (payed), with the address of the customer, grouped by the prefix
+    of the CEP and the neighborhood, so a whole cluster of nearby deliveries
+    comes in a single request.   \n
+    The list is paginated by group, a group is never split between pages:
+    when there are more groups, the cursor of the next page is sent on the
+    'X-Next-Cursor' header, to be used as 'after'
+
+    Args:
+        response (Response): response used to send the next cursor header
+        digits (int, optional): digits of the CEP prefix of a group
+        cep (str, optional): only addresses whose CEP starts with these digits
+        limit (int, optional): max number of groups on the page
+        after (str, optional): cursor of the last group of the previous page
+        db (Session, optional): database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        List[DeliveryGroupSchema]: groups of orders, by CEP prefix and neighborhood
+    """
+    if is_transport(user):
+        query, columns = available_groups_select(user, digits, cep, limit, after)
+        groups, next_cursor = split_page(db.execute(query).all(), columns, limit)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        if not groups:
             return []
 
+        rows = db.execute(
+            available_orders_select(user, digits, cep, groups[0], groups[-1])
+        )
+        return delivery_groups(rows)
+
 
 @router.get("/{id}", response_model=OrderResponseSchema)
 def get_order(
     id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
     user: AccountSchema = Depends(get_current_user),
 ):
-    """Method to detail a single order
+    """Method to detail a single order, looking on the archive when it is
+    not found on the order table.   \n
+    The response carries an ETag built from the version of the order, and
+    is answered with HTTP 304 when the 'If-None-Match' header matches with
+    it, reading only the version
 
     Args:
         id (int): id of the order
+        request (Request): request, to read the If-None-Match header
+        response (Response): response used to send the ETag header
         db (Session, optional): database session
         user (AccountSchema, optional): jwt access token on the header
 
@@ -126,30 +846,24 @@ def get_order(
     # Verifying if the user is logged
     if user:
 
-        # Searching for the order
-        order = db.query(Order).filter(Order.id == id).first()
-        if order:
-
-            # Getting all the items for this order
-            items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
-            products = []
-
-            for item in items:
-                product = (
-                    db.query(Product).filter(Product.id == item.product_id).first()
-                )
-                products.append(product)
-
-            user = db.query(Account).filter(Account.id == order.user_id).first()
-            transport = (
-                db.query(Account).filter(Account.id == order.transport_id).first()
-            )
+        # Comparing the version first, the client may have the order already
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            version = db.scalar(order_version_select(id))
+            if version is None:
+                version = db.scalar(order_version_select(id, archived=True))
+            if version is not None and etag_matches(if_none_match, order_etag(id, version)):
+                return not_modified(order_etag(id, version))
 
-            order.products = products
-            order.user = user.name
-            order.transport = transport.name
-            order.status_msg = get_status_message(order.status)
-            return order
+        # Searching for the order, with items, products and accounts
+        order = db.scalars(order_select().filter(Order.id == id)).first()
+        if order is None:
+            order = db.scalars(
+                order_select(archived=True).filter(ArchivedOrder.id == id)
+            ).first()
+        if order:
+            response.headers["ETag"] = order_etag(order.id, order.version)
+            return serialize_order(order)
 
         else:
             raise HTTPException(
@@ -157,13 +871,15 @@ def get_order(
             )
 
 
-@router.post("")
+@router.post("", dependencies=[Depends(rate_limit("order_write"))])
 def new_order(
     request: OrderSchema,
     db: Session = Depends(get_db),
     user: AccountSchema = Depends(get_current_user),
 ):
-    """Method to create new orders
+    """Method to create new orders, in a single transaction:
+    the products are read with one query and the items inserted at once,
+    so a big cart costs the same as a small one
 
     Args:
         request (OrderSchema): content of the body
@@ -175,7 +891,7 @@ def new_order(
         HTTPException: Product not founded
 
     Returns:
-        _type_: _description_
+        request (OrderSchema): all the data received
     """
     if is_user(user):
 
@@ -188,53 +904,163 @@ def new_order(
                 detail="Transport Company not founded",
             )
 
-        # Creating new order
+        # Grouping the items, a product bought many times is a single item
+        quantities = Counter()
+        for item in request.items:
+            if isinstance(item, int):
+                quantities[item] += 1
+            else:
+                quantities[item.product_id] += item.quantity
+
+        # Getting every product in a single query, kept as it is now on the order
+        products = {
+            product.id: product
+            for product in db.query(
+                Product.id, Product.name, Product.description, Product.price
+            ).filter(Product.id.in_(quantities.keys()))
+        }
+        if len(products) != len(quantities):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product not founded",
+            )
+
+        # Creating new order, with the final total price
         new_order = Order(
             user_id=user.id,
             transport_id=account.id,
+            customer_name=user.name,
+            transport_name=account.name,
             status=0,
+            total_price=round(
+                sum(products[id].price * quantity for id, quantity in quantities.items()),
+                2,
+            ),
         )
         db.add(new_order)
+        db.flush()
+
+        # Saving all the objects that link the products and the order at once
+        if quantities:
+            db.execute(
+                insert(OrderItem),
+                [
+                    {
+                        "order_id": new_order.id,
+                        "product_id": id,
+                        "quantity": quantity,
+                        "product_name": products[id].name,
+                        "product_description": products[id].description,
+                        "unit_price": products[id].price,
+                    }
+                    for id, quantity in quantities.items()
+                ],
+            )
+        record_order(db, new_order, new_order.status)
+        # Telling the transport company about the new order, after the commit
+        publish_after_commit(db, [status_event(new_order, new_order.status)])
         db.commit()
+        return request
 
-        total_price = 0
 
-        # for each item in list, create an item related to the order
-        for item_id in request.items_id:
+def transport_scope(user: AccountSchema):
+    """Method to get the transport company whose orders the account can move
 
-            prod = db.query(Product).filter(Product.id == item_id).first()
+    Args:
+        user (AccountSchema): logged account, a transport company or an admin
 
-            if not prod:
-                # if item not founded, the order needs to be canceled,
-                # so need to delete the newest order
+    Returns:
+        int: id of the transport company, None for an admin (every order)
+    """
+    return None if user.role == "ADMIN" else user.id
 
-                order = db.query(Order).filter(Order.id == id).first()
-                db.delete(order)
-                db.commit()
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Product not founded",
-                )
 
-            # Incrementing the price on each iteration
-            total_price += prod.price
+def transition_order(
+    db: Session, id: int, next_status, user: AccountSchema, msg: str, error: str
+):
+    """Method to apply a transition on a single order and publish its event
 
-            # Saving an object to link the product and the order
-            order_item = OrderItem(
-                product_id=prod.id,
-                order_id=new_order.id,
-            )
-            db.add(order_item)
+    Args:
+        db (Session): database session
+        id (int): id of the order
+        next_status (function): next status of a current status, see core/transitions.py
+        user (AccountSchema): logged transport company
+        msg (str): message of the success
+        error (str): message of an invalid transition
+
+    Raises:
+        HTTPException: Order not found - HTTP 404
+        HTTPException: Invalid transition, or the order changed meanwhile - HTTP 409
+
+    Returns:
+        dict: message, id, new status and status message of the order
+    """
+    moved, failures = apply_transition(db, [id], next_status, transport_scope(user))
+    if failures:
+        db.rollback()
+        current, reason = failures[id]
+        if reason == NOT_FOUND:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=error if reason == INVALID else reason,
+        )
+
+    order = moved[0]
+    new_status = next_status(order.status)
+    publish_after_commit(db, [status_event(order, new_status)])
+    db.commit()
+    return {
+        "msg": msg,
+        "id": order.id,
+        "status": new_status,
+        "status_msg": get_status_message(new_status),
+    }
+
+
+@router.patch(
+    "/batch",
+    response_model=OrderBatchResultSchema,
+    dependencies=[Depends(rate_limit("order_write"))],
+)
+def move_order_batch(
+    request: OrderBatchSchema,
+    db: Session = Depends(get_db),
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Method to move many orders to the same status, in a single transaction:
+    the orders are read at once and changed with one conditional UPDATE per
+    current status, the ones that cannot move are reported and left as they are
+
+    Args:
+        request (OrderBatchSchema): ids of the orders and the status to move them to
+        db (Session, optional): database session
+        user (AccountSchema, optional): jwt access token on the header
 
-        # Setting the final total price of the order
-        new_order.total_price = total_price
+    Returns:
+        dict: status, ids of the orders moved and the failures
+    """
+    if is_transport(user):
+        moved, failures = apply_transition(
+            db, request.ids, to_status(request.status), transport_scope(user)
+        )
+        publish_after_commit(db, [status_event(order, request.status) for order in moved])
         db.commit()
-        return request
+        return {
+            "status": request.status,
+            "status_msg": get_status_message(request.status),
+            "moved": [order.id for order in moved],
+            "failed": [
+                {"id": id, "status": current, "detail": reason}
+                for id, (current, reason) in failures.items()
+            ],
+        }
 
 
 @router.patch(
     "/{id}/advance",
-    # response_model=List[OrderSchema],
+    response_model=OrderStatusSchema,
+    dependencies=[Depends(rate_limit("order_write"))],
 )
 def advance_status(
     id: int,
@@ -248,65 +1074,46 @@ def advance_status(
         db (Session, optional): database session
         user (AccountSchema, optional): jwt access token on the header
 
+    Raises:
+        HTTPException: Order not found - HTTP 404
+        HTTPException: Order delivered or refused, or changed meanwhile - HTTP 409
+
     Returns:
-        Response: http response with the current status code, and status message of the order
+        dict: message, id, new status and status message of the order
     """
     if is_transport(user):
-        order = db.query(Order).filter(Order.id == id).first()
-
-        if order.status >= 4 and order.status != 0:
-            order.status += 1
-            db.commit()
-
-            response_msg = {
-                "msg": "Order updated",
-                "status": order.status,
-                "status_message": get_status_message(order.status),
-            }
-            response_status = status.HTTP_200_OK
-            return Response(content=response_msg, status_code=response_status)
-
-        response_msg = {
-            "msg": "Order status cannot be increased",
-            "status": order.status,
-            "status_message": get_status_message(order.status),
-        }
-        response_status = status.HTTP_403_FORBIDDEN
-        return Response(content=response_msg, status_code=response_status)
-
-    response_msg = {
-        "msg": "only transport companies can increase",
-    }
-    response_status = status.HTTP_403_FORBIDDEN
-    return Response(content=response_msg, status_code=response_status)
+        return transition_order(
+            db, id, TRANSITIONS["advance"].get, user,
+            "Order updated", "Order status cannot be increased",
+        )
 
 
 @router.patch(
     "/{id}/cancel",
-    response_model=OrderSchema,
+    response_model=OrderStatusSchema,
+    dependencies=[Depends(rate_limit("order_write"))],
 )
-def advance_status(
+def cancel_order(
     id: int,
     db: Session = Depends(get_db),
     user: AccountSchema = Depends(get_current_user),
 ):
-    """Method to refuse an order
+    """Method to refuse an order, until it is on the way
 
     Args:
         id (int): id of the order
         db (Session, optional): database session
         user (AccountSchema, optional): jwt access token on the header
 
+    Raises:
+        HTTPException: Order not found - HTTP 404
+        HTTPException: Order on the way, delivered or refused, or changed meanwhile - HTTP 409
+
     Returns:
-        str: cancellation confirmation
+        dict: message, id, new status and status message of the order
     """
     if is_transport(user):
-        order = db.query(Order).filter(Order.id == id).first()
-        order.status = 0
-        db.commit()
-        response_msg = {
-            "msg": "Order canceled",
-        }
-        response_status = status.HTTP_200_OK
-
-        return Response(content=response_msg, status_code=response_status)
+        return transition_order(
+            db, id, TRANSITIONS["cancel"].get, user,
+            "Order canceled", "Order cannot be canceled anymore",
+        )
@@ -0,0 +1,68 @@
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.params import Depends
+from fastapi.responses import StreamingResponse
+
+from core.schemas import AccountSchema
+from core.authentication import get_current_user
+from core.events import bus, format_sse
+
+router = APIRouter(
+    tags=["Order"],
+    prefix="/order",
+)
+
+# Seconds between comments sent on an idle stream, so proxies keep it open
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+async def order_events(request: Request, account_id: int, order_id: Optional[int]):
+    """Method to generate the Server-Sent Events of an account,
+    until the client disconnects
+
+    Args:
+        request (Request): request of the stream, to detect the disconnection
+        account_id (int): id of the logged account
+        order_id (int): only the events of this order, or all of them
+
+    Yields:
+        str: events formatted as SSE
+    """
+    with bus.subscribe(account_id) as subscription:
+        # Telling the client how long to wait before reconnecting
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(STREAM_KEEPALIVE_SECONDS)
+            if event is None:
+                yield ": keepalive\n\n"
+            elif order_id is None or event["data"]["order_id"] == order_id:
+                yield format_sse(event)
+
+
+@router.get("/stream")
+async def stream_orders(
+    request: Request,
+    order_id: Optional[int] = None,
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Endpoint to follow the status of the orders with Server-Sent Events,
+    instead of polling the order detail:    \n
+    each new order and each status change of an order of the logged account
+    (as the customer or as the transport company) is pushed as a 'status'
+    event, with the order id, the new status and its message
+
+    Args:
+        request (Request): request, to detect the disconnection
+        order_id (int, optional): only the events of this order
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        StreamingResponse: text/event-stream, open until the client disconnects
+    """
+    if user:
+        return StreamingResponse(
+            order_events(request, user.id, order_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -1,14 +1,31 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Request, Query
 from fastapi.params import Depends
-from typing import List
+from typing import List, Literal, Optional
 
+from pydantic import TypeAdapter
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from core.schemas import ProductSchema, AccountSchema
+from core.schemas import ProductSchema, ProductSearchSchema, AccountSchema
 from core.models import Product
-from core.database import get_db
+from core.database import get_db, get_read_db
 from core.authentication import get_current_user
 from core.authorization import is_user
+from core.ratelimit import rate_limit
+from core.cache import (
+    catalog_cache,
+    bump_catalog_version,
+    CachedResponse,
+)
+from core.streaming import stream_rows, JSONStreamResponse
+from core.search import product_fts, match_expression, matches
+from core.pagination import (
+    keyset_page,
+    split_page,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+)
 
 
 router = APIRouter(
@@ -16,39 +33,289 @@ router = APIRouter(
     prefix="/product",
 )
 
+products_adapter = TypeAdapter(List[ProductSchema])
+product_adapter = TypeAdapter(ProductSchema)
+search_adapter = TypeAdapter(List[ProductSearchSchema])
+
+
+def commit_catalog(db: Session):
+    """Method to commit a write on the catalog, invalidating the cached responses
+
+    Args:
+        db (Session): database session with the pending changes
+    """
+    version = bump_catalog_version(db)
+    db.commit()
+    catalog_cache.invalidate(version)
+
+
+def product_filters(min_price: Optional[float], max_price: Optional[float]):
+    """Method to build the conditions of the product list
+
+    Args:
+        min_price (float): only products costing at least this
+        max_price (float): only products costing at most this
+
+    Returns:
+        list: conditions to be used on filter
+    """
+    filters = []
+    if min_price is not None:
+        filters.append(Product.price >= min_price)
+    if max_price is not None:
+        filters.append(Product.price <= max_price)
+    return filters
+
+
+def product_sort(sort: str):
+    """Method to get the columns that sort the product list
+
+    Args:
+        sort (str): 'id' (oldest first) or 'price' (cheapest first)
+
+    Returns:
+        list: sort columns
+    """
+    if sort == "price":
+        return [Product.price, Product.id]
+    return [Product.id]
+
+
+def product_list_select(
+    limit: int,
+    after: Optional[str],
+    sort: str,
+    min_price: Optional[float],
+    max_price: Optional[float],
+):
+    """Method to build the statement of one page of the product list,
+    shared by the sync and the async routers
+
+    Args:
+        limit (int): max number of products on the page
+        after (str): cursor of the last product of the previous page
+        sort (str): 'id' (oldest first) or 'price' (cheapest first)
+        min_price (float): only products costing at least this
+        max_price (float): only products costing at most this
+
+    Returns:
+        tuple: select of the page and the sort columns, to be used on split_page
+    """
+    products = select(Product).filter(*product_filters(min_price, max_price))
+
+    # Getting only the requested page
+    columns = product_sort(sort)
+    return keyset_page(products, columns, after, limit), columns
+
+
+def product_search_select(search: str, limit: int, after: Optional[str]):
+    """Method to build the statement of one page of a product search on the
+    full-text index, best matches first, shared by the sync and the async routers
+
+    Args:
+        search (str): text typed by the user
+        limit (int): max number of products on the page
+        after (str): cursor of the last product of the previous page
+
+    Raises:
+        HTTPException: Search without words - HTTP 400
+
+    Returns:
+        tuple: select of the page and the sort columns, to be used on split_page
+    """
+    expression = match_expression(search)
+    if not expression:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Search without words"
+        )
+
+    products = (
+        select(
+            Product.id,
+            Product.name,
+            Product.description,
+            Product.price,
+            product_fts.c.rank,
+        )
+        .join(product_fts, product_fts.c.rowid == Product.id)
+        .filter(matches(expression))
+    )
+
+    # bm25 is lower for better matches, the id breaks the ties
+    columns = [product_fts.c.rank, Product.id]
+    return keyset_page(products, columns, after, limit), columns
+
+
+def product_documents(sort: str, min_price: Optional[float], max_price: Optional[float]):
+    """Method to read the whole product list from a column-only statement,
+    for the streamed responses
+
+    Args:
+        sort (str): 'id' (oldest first) or 'price' (cheapest first)
+        min_price (float): only products costing at least this
+        max_price (float): only products costing at most this
+
+    Yields:
+        dict: data matching with ProductSchema
+    """
+    query = (
+        select(Product.name, Product.description, Product.price)
+        .filter(*product_filters(min_price, max_price))
+        .order_by(*product_sort(sort))
+    )
+    for name, description, price in stream_rows(query):
+        yield {"name": name, "description": description, "price": price}
+
+
+def cache_products(
+    key, products: list, next_cursor: str, version: int, adapter=products_adapter
+):
+    """Method to serialize a page of products and keep it on the catalog cache
+
+    Args:
+        key: key of the response on the cache
+        products (list): products of the page
+        next_cursor (str): cursor of the next page, or None
+        version (int): catalog version read before the query
+        adapter (TypeAdapter, optional): schema of the page
+
+    Returns:
+        CachedResponse: serialized page
+    """
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    body = adapter.dump_json(adapter.validate_python(products, from_attributes=True))
+    cached = CachedResponse(body, headers)
+    catalog_cache.set(key, cached, version)
+    return cached
+
+
+def cache_product(key, product: Product, version: int):
+    """Method to serialize a single product and keep it on the catalog cache
+
+    Args:
+        key: key of the response on the cache
+        product (Product): product found
+        version (int): catalog version read before the query
+
+    Returns:
+        CachedResponse: serialized product
+    """
+    body = product_adapter.dump_json(
+        product_adapter.validate_python(product, from_attributes=True)
+    )
+    cached = CachedResponse(body)
+    catalog_cache.set(key, cached, version)
+    return cached
+
 
 @router.get("", response_model=List[ProductSchema])
 def get_products(
-    db: Session = Depends(get_db),
+    request: Request,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: Literal["id", "price"] = "id",
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    stream: bool = False,
+    db: Session = Depends(get_read_db),
     user: AccountSchema = Depends(get_current_user),
 ):
-    """Method to get all the products
+    """Method to get all the products, paginated by cursor:
+    when there are more products, the cursor of the next page is sent
+    on the 'X-Next-Cursor' header, to be used as 'after'.   \n
+    Responses are cached until the catalog changes, and answered with
+    HTTP 304 when the 'If-None-Match' header matches with the ETag.  \n
+    With 'stream', every product is sent at once, on a chunked response
+    encoded while the products are read, ignoring 'limit' and 'after'
 
     Args:
+        request (Request): request, to read the If-None-Match header
+        limit (int, optional): max number of products on the page
+        after (str, optional): cursor of the last product of the previous page
+        sort (str, optional): 'id' (oldest first) or 'price' (cheapest first)
+        min_price (float, optional): only products costing at least this
+        max_price (float, optional): only products costing at most this
+        stream (bool, optional): send every product on a streamed response
         db (Session, optional): database session
         user (AccountSchema, optional): jwt access token on the header
 
     Returns:
-        List[ProductSchema]: all products
+        List[ProductSchema]: products of the page
     """
     if is_user(user):
-        products = db.query(Product).all()
-        if products:
-            return products
-        else:
-            return []
+        if stream:
+            return JSONStreamResponse(product_documents(sort, min_price, max_price))
+
+        key = ("list", limit, after, sort, min_price, max_price)
+        cached, version = catalog_cache.get(db, key)
+        if cached:
+            return cached.to_response(request, "HIT")
+
+        query, columns = product_list_select(limit, after, sort, min_price, max_price)
+        products, next_cursor = split_page(db.scalars(query).all(), columns, limit)
+
+        # Serializing once, to be reused by the next requests
+        cached = cache_products(key, products, next_cursor, version)
+        return cached.to_response(request, "MISS")
+
+
+@router.get(
+    "/search",
+    response_model=List[ProductSearchSchema],
+    dependencies=[Depends(rate_limit("product_search"))],
+)
+def search_products(
+    request: Request,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Method to search products by name and description, on a full-text index:
+    every word must match the start of a word of the product (accents ignored),
+    and the products matching on the name come first.   \n
+    Paginated by cursor and cached like the product list
+
+    Args:
+        request (Request): request, to read the If-None-Match header
+        q (str): words to search
+        limit (int, optional): max number of products on the page
+        after (str, optional): cursor of the last product of the previous page
+        db (Session, optional): database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Raises:
+        HTTPException: Search without words - HTTP 400
+
+    Returns:
+        List[ProductSearchSchema]: products found, best matches first
+    """
+    if is_user(user):
+        key = ("search", q, limit, after)
+        cached, version = catalog_cache.get(db, key)
+        if cached:
+            return cached.to_response(request, "HIT")
+
+        query, columns = product_search_select(q, limit, after)
+        products, next_cursor = split_page(db.execute(query).all(), columns, limit)
+
+        cached = cache_products(key, products, next_cursor, version, search_adapter)
+        return cached.to_response(request, "MISS")
 
 
 @router.get("/{id}", response_model=ProductSchema)
 def get_product(
     id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     user: AccountSchema = Depends(get_current_user),
 ):
-    """Method to get a single product
+    """Method to get a single product, cached like the product list
 
     Args:
         id (int): id of the product
+        request (Request): request, to read the If-None-Match header
         db (Session, optional): database session
         user (AccountSchema, optional): jwt access token on the header
 
@@ -59,9 +326,15 @@ def get_product(
         ProductSchema: data from the specific product
     """
     if is_user(user):
+        key = ("item", id)
+        cached, version = catalog_cache.get(db, key)
+        if cached:
+            return cached.to_response(request, "HIT")
+
         product = db.query(Product).filter(Product.id == id).first()
         if product:
-            return product
+            cached = cache_product(key, product, version)
+            return cached.to_response(request, "MISS")
         else:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
@@ -92,7 +365,7 @@ def create_product(
             price=request.price,
         )
         db.add(new_product)
-        db.commit()
+        commit_catalog(db)
         return request
 
 
@@ -120,13 +393,12 @@ def update_product(
     if is_user(user):
         product = db.query(Product).filter(Product.id == id)
 
-        if not product:
+        if not product.update(request.model_dump()):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Product not found"
             )
 
-        product.update(request.model_dump())
-        db.commit()
+        commit_catalog(db)
         return request
 
 
@@ -157,5 +429,5 @@ def delete_product(
             )
 
         db.delete(product)
-        db.commit()
+        commit_catalog(db)
         return {"Product Removed"}
@@ -0,0 +1,236 @@
+import csv
+import io
+import json
+from fastapi import APIRouter, Request
+from fastapi.params import Depends
+from fastapi.responses import StreamingResponse
+from typing import Literal
+
+from pydantic import ValidationError
+from sqlalchemy import select, insert, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.schemas import BulkProductSchema, AccountSchema
+from core.models import Product
+from core.database import get_db, ReadSessionLocal
+from core.authentication import get_current_user
+from core.authorization import is_user
+from core.ratelimit import rate_limit
+from routers.v1.product import commit_catalog
+
+router = APIRouter(
+    tags=["Product"],
+    prefix="/product",
+)
+
+BULK_BATCH_SIZE = 1000  # rows saved on each transaction
+BULK_MAX_ERRORS = 1000  # errors detailed on the response, the others are only counted
+CSV_FIELDS = ["id", "name", "description", "price"]
+
+
+async def read_lines(request: Request):
+    """Method to split the streamed body into lines, as the chunks arrive
+
+    Args:
+        request (Request): request with the NDJSON or CSV body
+
+    Yields:
+        bytes: each line of the body, without the line break, decoded by
+            the caller so an invalid line fails alone
+    """
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+def save_batch(rows: dict, db: Session):
+    """Method to upsert a batch of products in a single transaction
+
+    Args:
+        rows (dict): line number -> validated product
+        db (Session): database session
+
+    Returns:
+        tuple: number of inserted and updated products, and the line numbers
+            of the rows replaced by a later row with the same id
+    """
+
+    # Keeping only the last row of each id, and finding which ids exist
+    by_id, lines, replaced = {}, {}, []
+    for line_number, row in rows.items():
+        if row.id is not None:
+            if row.id in lines:
+                replaced.append(lines[row.id])
+            by_id[row.id] = row
+            lines[row.id] = line_number
+    existing = set()
+    if by_id:
+        existing = set(db.scalars(select(Product.id).filter(Product.id.in_(by_id))))
+
+    updates = [row.model_dump() for id, row in by_id.items() if id in existing]
+    inserts = [
+        row.model_dump(exclude_none=True)
+        for row in rows.values()
+        if row.id is None
+    ] + [row.model_dump() for id, row in by_id.items() if id not in existing]
+
+    if inserts:
+        db.execute(insert(Product), inserts)
+    if updates:
+        db.execute(update(Product), updates)
+    commit_catalog(db)
+    return len(inserts), len(updates), replaced
+
+
+@router.post("/bulk", dependencies=[Depends(rate_limit("product_bulk"))])
+async def import_products(
+    request: Request,
+    db: Session = Depends(get_db),
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Method to create or update many products from a streamed body:   \n
+    NDJSON (one json object per line, 'application/x-ndjson') or
+    CSV with a header line ('text/csv'), with the fields
+    'id' (optional, updates the product when it exists), 'name', 'description' and 'price'.   \n
+    Rows are saved in batches of 1000, each one on its own transaction,
+    and invalid rows are reported without stopping the import
+
+    Args:
+        request (Request): request with the NDJSON or CSV body
+        db (Session, optional): database session
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        dict: number of inserted, updated and failed rows, with the errors per line
+    """
+    if is_user(user):
+        is_csv = request.headers.get("content-type", "").startswith("text/csv")
+        result = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+        header = None
+        batch = {}
+
+        def fail(line_number: int, error: str):
+            result["failed"] += 1
+            if len(result["errors"]) < BULK_MAX_ERRORS:
+                result["errors"].append({"line": line_number, "error": error})
+
+        async def flush():
+            try:
+                inserted, updated, replaced = await run_in_threadpool(save_batch, batch, db)
+                result["inserted"] += inserted
+                result["updated"] += updated
+                for line_number in replaced:
+                    fail(line_number, "duplicate id in batch, last row kept")
+            except Exception as e:
+                await run_in_threadpool(db.rollback)
+                for line_number in batch:
+                    fail(line_number, f"batch not saved: {e.__class__.__name__}")
+            batch.clear()
+
+        line_number = 0
+        async for line in read_lines(request):
+            line_number += 1
+            if not line.strip():
+                continue
+
+            try:
+                line = line.decode("utf-8")
+                # Reading the row, the first csv line has the field names
+                if is_csv:
+                    values = next(csv.reader([line]))
+                    if header is None:
+                        header = values
+                        continue
+                    data = {k: v for k, v in zip(header, values) if v != ""}
+                else:
+                    data = json.loads(line)
+
+                row = BulkProductSchema.model_validate(data)
+                row.price = round(row.price, 2)
+                batch[line_number] = row
+
+            except ValidationError as e:
+                fail(
+                    line_number,
+                    "; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                        for error in e.errors()
+                    ),
+                )
+                continue
+
+            except UnicodeDecodeError as e:
+                fail(line_number, f"invalid UTF-8: {e.reason} at byte {e.start}")
+                continue
+
+            except ValueError as e:
+                fail(line_number, str(e))
+                continue
+
+            if len(batch) >= BULK_BATCH_SIZE:
+                await flush()
+
+        if batch:
+            await flush()
+        return result
+
+
+def export_rows(export_format: str):
+    """Method to read the catalog in chunks, yielding the formatted rows
+
+    Uses its own session, as the response is streamed after the request
+    dependencies are closed
+
+    Args:
+        export_format (str): 'ndjson' or 'csv'
+
+    Yields:
+        str: a chunk of formatted rows
+    """
+    db = ReadSessionLocal()
+    try:
+        query = select(Product.id, Product.name, Product.description, Product.price)
+        rows = db.execute(query.order_by(Product.id).execution_options(yield_per=500))
+
+        if export_format == "csv":
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(CSV_FIELDS)
+            for chunk in rows.partitions():
+                writer.writerows(chunk)
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        else:
+            for chunk in rows.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(CSV_FIELDS, row))) + "\n" for row in chunk
+                )
+    finally:
+        db.close()
+
+
+@router.get("/export", dependencies=[Depends(rate_limit("product_bulk"))])
+def export_products(
+    export_format: Literal["ndjson", "csv"] = "ndjson",
+    user: AccountSchema = Depends(get_current_user),
+):
+    """Method to download the whole catalog, streamed while it is read,
+    on the same format accepted by the bulk import
+
+    Args:
+        export_format (str, optional): 'ndjson' or 'csv'
+        user (AccountSchema, optional): jwt access token on the header
+
+    Returns:
+        StreamingResponse: the products, one per line
+    """
+    if is_user(user):
+        media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(export_rows(export_format), media_type=media_type)
@@ -0,0 +1,228 @@
+"""Production server, a supervisor process and N uvicorn workers
+
+The supervisor imports the app once, checks the schema version, opens the
+listening socket and forks the workers. A forked worker starts with every
+module already imported, so it only opens its pool connections before
+serving: scaling out brings workers online in milliseconds.
+
+    python -m core.migrations upgrade       # once per deploy
+    python serve.py --workers 4 --port 8000
+
+SIGTERM or SIGINT stops gracefully: the workers stop accepting connections,
+finish the requests in flight for up to --graceful-timeout seconds and run
+the lifespan shutdown, the ones still running after that are killed. A
+worker that dies is replaced, a worker that fails to start stops the server.
+
+Each worker runs its own bcrypt processes (see core/passwords.py), so the
+CPUs of the host are divided between them: unless PASSWORD_HASH_WORKERS is
+set, each worker gets max(1, cpus // workers) bcrypt processes. The host
+then runs about one bcrypt process per CPU, and answers HTTP 503 after
+about 5 hashes per CPU running or waiting (each worker admits its bcrypt
+processes plus PASSWORD_HASH_QUEUE, 4 per process by default).
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+# Default number of workers
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+# Exit code of a worker whose lifespan startup failed
+WORKER_BOOT_ERROR = 3
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def bind_socket(host: str, port: int, backlog: int):
+    """Method to open the listening socket shared by every worker
+
+    Args:
+        host (str): address to bind
+        port (int): port to bind
+        backlog (int): connections waiting to be accepted
+
+    Returns:
+        socket.socket: listening socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that die and stops them on a signal"""
+
+    def __init__(
+        self, config: uvicorn.Config, sock: socket.socket, workers: int, graceful_timeout: int
+    ):
+        self.config = config
+        self.sock = sock
+        self.size = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}
+        self.stopping = False
+        self.exit_code = 0
+
+    def spawn(self):
+        """Method to fork a new worker"""
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = self.run_worker()
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def run_worker(self):
+        """Method executed inside the forked worker
+
+        Returns:
+            int: exit code of the worker
+        """
+        from core.startup import startup
+
+        # Counting the startup from the fork, the imports were paid by the supervisor
+        startup.restart()
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+            signal.signal(signum, signal.SIG_DFL)
+
+        server = uvicorn.Server(self.config)
+        server.run(sockets=[self.sock])
+        return 0 if server.started else WORKER_BOOT_ERROR
+
+    def stop(self, signum=None, frame=None):
+        """Method to stop every worker gracefully, a second signal kills them"""
+        if self.stopping:
+            return self.kill()
+        self.stopping = True
+        logger.info("stopping %d workers", len(self.workers))
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        # Killing the workers still running after the graceful timeout
+        signal.alarm(self.graceful_timeout + 5)
+
+    def kill(self, signum=None, frame=None):
+        """Method to kill every worker still running"""
+        for pid in self.workers:
+            logger.warning("killing worker %d", pid)
+            os.kill(pid, signal.SIGKILL)
+
+    def run(self):
+        """Method to start the workers and supervise them until they stop
+
+        Returns:
+            int: exit code of the server
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.kill)
+
+        for _ in range(self.size):
+            self.spawn()
+
+        while self.workers:
+            pid, status = os.wait()
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == WORKER_BOOT_ERROR:
+                # Starting again would fail the same way
+                logger.error("worker %d failed to start, stopping", pid)
+                self.exit_code = WORKER_BOOT_ERROR
+                self.stop()
+                continue
+            logger.warning(
+                "worker %d exited with %d after %.0fs, starting a new one",
+                pid, code, time.monotonic() - started,
+            )
+            self.spawn()
+        return self.exit_code
+
+
+def share_password_workers(workers: int):
+    """Method to divide the bcrypt processes of the host between the workers,
+    must run before the app is imported
+
+    Args:
+        workers (int): number of uvicorn workers
+
+    Returns:
+        int: bcrypt processes of each worker
+    """
+    if "PASSWORD_HASH_WORKERS" not in os.environ:
+        per_worker = max(1, (os.cpu_count() or 1) // max(workers, 1))
+        os.environ["PASSWORD_HASH_WORKERS"] = str(per_worker)
+    return int(os.environ["PASSWORD_HASH_WORKERS"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=30,
+        help="seconds to finish the requests in flight on shutdown",
+    )
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+    password_workers = share_password_workers(args.workers)
+
+    if not hasattr(os, "fork"):
+        # No fork (Windows), every uvicorn worker imports the app on its own
+        from core.migrations import check_version
+
+        check_version()
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+        return 0
+
+    # Preloading the app, the workers inherit every imported module
+    import main as app
+    from core.database import engine
+    from core.migrations import check_version
+    from core.startup import startup
+
+    config = uvicorn.Config(
+        app.app,
+        lifespan="on",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        access_log=not args.no_access_log,
+    )
+    # Importing the protocol implementations of uvicorn once, for every worker
+    config.load()
+    logger.info("app imported in %.0fms", startup.phases["import"] * 1000)
+
+    try:
+        check_version()
+    except RuntimeError as error:
+        logger.error("%s", error)
+        return 1
+    # The workers open their own connections, never the ones of the supervisor
+    engine.dispose()
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    logger.info(
+        "listening on %s:%d with %d workers, %d bcrypt processes each (pid %d)",
+        args.host, args.port, args.workers, password_workers, os.getpid(),
+    )
+    return Supervisor(config, sock, args.workers, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Fixtures of the tests: the app runs in-process on a temporary database,
+built by the migrations, with bcrypt on the request threadpool and
+without rate limits or background job workers"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORY = tempfile.mkdtemp(prefix="delivery-tests-")
+atexit.register(shutil.rmtree, DIRECTORY, ignore_errors=True)
+
+# Read when the app modules are imported, so set before any of them
+os.environ["DATABASE_PATH"] = os.path.join(DIRECTORY, "tests.db")
+os.environ["RATE_LIMIT_DATABASE_PATH"] = os.path.join(DIRECTORY, "ratelimit.db")
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+os.environ["JOBS_WORKERS"] = "0"
+sys.path.insert(0, ROOT)
+
+ADDRESS = dict(
+    complement="", street="s", house_number="1", neighborhood="Centro",
+    city="SP", state="SP", CEP="01001-000",
+)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from core.migrations import migrate
+    import main
+
+    migrate()
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def account(client):
+    """Factory of accounts, returning the authorization header and the id,
+    an email already created returns the same account"""
+    accounts = {}
+
+    def create(kind: str, email: str):
+        if email not in accounts:
+            body = dict(name=kind, email=email, password="secret1", **ADDRESS)
+            assert client.post(f"/api/v1/account/{kind}", json=body).status_code == 201
+            response = client.post(
+                "/api/v1/login", json=dict(email=email, password="secret1")
+            )
+            assert response.status_code == 200, response.text
+            headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+            accounts[email] = (
+                headers, client.get("/api/v1/account", headers=headers).json()["id"]
+            )
+        return accounts[email]
+
+    return create
+
+
+@pytest.fixture
+def count_queries():
+    """Function counting the SQL statements sent while running a callable"""
+    from sqlalchemy import event
+    from core.database import engine, read_engine
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    for bind in (engine, read_engine):
+        event.listen(bind, "before_cursor_execute", before_cursor_execute)
+
+    def count(function):
+        statements.clear()
+        result = function()
+        return result, len(statements)
+
+    yield count
+    for bind in (engine, read_engine):
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
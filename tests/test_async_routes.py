@@ -0,0 +1,36 @@
+"""With DATABASE_MODE=async the aio routers are mounted before v1, so a
+static v1 route must never be caught by a different aio route, like
+/order/{id} catching /order/summary"""
+
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+SHADOWED_ROUTES = """
+from starlette.routing import Match
+import main
+
+routes = [route for route in main.app.routes if hasattr(route, "methods")]
+for route in routes:
+    if "GET" not in route.methods or "{" in route.path:
+        continue
+    scope = {"type": "http", "path": route.path, "method": "GET", "root_path": ""}
+    first = next(other for other in routes if other.matches(scope)[0] == Match.FULL)
+    if first.path != route.path:
+        print(route.path, first.path)
+"""
+
+
+def test_aio_routes_do_not_shadow_v1():
+    result = subprocess.run(
+        [sys.executable, "-c", SHADOWED_ROUTES],
+        cwd=ROOT,
+        env={**os.environ, "DATABASE_MODE": "async"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "", result.stdout
+
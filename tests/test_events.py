@@ -0,0 +1,33 @@
+"""Events of the memory bus (the default of the tests), see core/events.py"""
+
+from core.events import bus, publish_after_commit
+
+EVENT = ([1], {"type": "order.status", "id": 1})
+
+
+def test_events_are_published_after_commit(client):
+    from core.database import SessionLocal
+
+    before = bus.published
+    db = SessionLocal()
+    try:
+        publish_after_commit(db, [EVENT, EVENT])
+        assert bus.published == before
+        db.commit()
+    finally:
+        db.close()
+    assert bus.published == before + 2
+
+
+def test_events_are_dropped_on_rollback(client):
+    from core.database import SessionLocal
+
+    before = bus.published
+    db = SessionLocal()
+    try:
+        publish_after_commit(db, [EVENT])
+        db.rollback()
+        db.commit()
+    finally:
+        db.close()
+    assert bus.published == before
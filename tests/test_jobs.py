@@ -0,0 +1,127 @@
+"""Durable job queue, see core/jobs.py: the workers of the tests never start
+(JOBS_WORKERS=0), the jobs are run by calling run_once"""
+
+import time
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from core import jobs
+from core.jobs import FAILED, JobWorkers, enqueue, job
+from core.models import Job
+
+calls = []
+
+
+@job("test_record")
+def record(payload: dict):
+    calls.append(payload)
+
+
+@job("test_fail", max_attempts=3)
+def fail(payload: dict):
+    calls.append(payload)
+    raise ValueError("boom")
+
+
+@pytest.fixture
+def workers(client):
+    from core.database import engine
+
+    with engine.begin() as connection:
+        connection.execute(delete(Job))
+    calls.clear()
+    return JobWorkers(0, 50, 1, 60)
+
+
+def add_job(name: str, payload: dict):
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        enqueue(db, name, payload)
+        db.commit()
+    finally:
+        db.close()
+
+
+def jobs_table():
+    from core.database import engine
+
+    with engine.connect() as connection:
+        return connection.execute(select(Job)).all()
+
+
+def expire(**values):
+    # Moving the jobs to the past, as if their time had come
+    from core.database import engine
+
+    with engine.begin() as connection:
+        connection.execute(update(Job).values(run_at=time.time() - 1, **values))
+
+
+def test_job_runs_once_and_is_deleted(workers):
+    add_job("test_record", {"n": 1})
+    assert workers.run_once() == 1
+    assert calls == [{"n": 1}]
+    assert jobs_table() == []
+    assert workers.run_once() == 0
+
+
+def test_rolled_back_job_never_runs(workers):
+    from core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        enqueue(db, "test_record", {"n": 2})
+        db.rollback()
+    finally:
+        db.close()
+    assert jobs_table() == []
+    assert workers.run_once() == 0
+    assert calls == []
+
+
+def test_failing_job_backs_off_and_fails(workers):
+    add_job("test_fail", {"n": 3})
+    delays = []
+    for attempt in range(1, 4):
+        started = time.time()
+        assert workers.run_once() == 1
+        [row] = jobs_table()
+        assert row.attempts == attempt
+        assert row.last_error == "ValueError: boom"
+        if attempt < 3:
+            # Not due again before the backoff
+            assert row.status == jobs.PENDING
+            assert workers.run_once() == 0
+            delays.append(row.run_at - started)
+            expire()
+    assert row.status == FAILED
+    assert len(calls) == 3
+    # Exponential, with a jitter of 10%
+    assert 0.9 * jobs.JOBS_BACKOFF_SECONDS <= delays[0] <= 1.2 * jobs.JOBS_BACKOFF_SECONDS
+    assert 1.8 * delays[0] / 1.1 <= delays[1] <= 2.2 * delays[0] / 0.9
+    # A failed job is kept, and never claimed again
+    expire()
+    assert workers.run_once() == 0
+
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_MAX_BACKOFF_SECONDS", 5)
+    assert all(backoff <= 5 * 1.1 for backoff in map(jobs.backoff, range(1, 20)))
+
+
+def test_expired_lease_is_claimed_again(workers):
+    add_job("test_record", {"n": 4})
+    # A worker claims the job and dies before finishing it
+    [claimed] = workers.claim()
+    assert claimed.attempts == 1
+    assert workers.claim() == []
+    assert calls == []
+
+    # After the lease, another worker takes it
+    expire()
+    assert workers.run_once() == 1
+    assert calls == [{"n": 4}]
+    assert jobs_table() == []
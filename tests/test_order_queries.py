@@ -0,0 +1,40 @@
+"""The order endpoints read the orders, their items and their accounts with
+a fixed number of queries, whatever the number of orders and of items"""
+
+# (orders added, items of each order) of each round
+ROUNDS = [(1, 1), (5, 3), (20, 6)]
+
+
+def test_order_queries_do_not_grow(client, account, count_queries):
+    user, _ = account("user", "orders-user@example.com")
+    transport, transport_id = account("transport", "orders-transport@example.com")
+    products = max(items for _, items in ROUNDS)
+    for number in range(products):
+        product = dict(name=f"p{number}", description="-", price=number + 1)
+        assert client.post("/api/v1/product", json=product, headers=user).status_code == 201
+
+    list_counts, detail_counts = [], []
+    total = 0
+    for orders, items in ROUNDS:
+        for _ in range(orders):
+            order = dict(items=list(range(1, items + 1)), transport_id=transport_id)
+            assert client.post("/api/v1/order", json=order, headers=user).status_code == 200
+        total += orders
+
+        for headers in (user, transport):
+            response, queries = count_queries(
+                lambda: client.get("/api/v1/order?limit=200", headers=headers)
+            )
+            assert response.status_code == 200
+            assert len(response.json()) == total
+            list_counts.append(queries)
+
+        response, queries = count_queries(
+            lambda: client.get(f"/api/v1/order/{total}", headers=user)
+        )
+        assert response.status_code == 200
+        assert len(response.json()["products"]) == items
+        detail_counts.append(queries)
+
+    assert len(set(list_counts)) == 1, list_counts
+    assert len(set(detail_counts)) == 1, detail_counts
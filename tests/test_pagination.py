@@ -0,0 +1,98 @@
+"""Cursor pagination of the list endpoints, see core/pagination.py"""
+
+import pytest
+
+from core.pagination import encode_cursor
+
+MALFORMED_CURSORS = [
+    encode_cursor([{"a": 1}]),
+    encode_cursor([[1, 2]]),
+    encode_cursor([1, 2, 3]),
+    encode_cursor({"id": 1}),
+    "not-a-cursor!",
+    "bm90IGpzb24",  # base64 of 'not json'
+]
+
+
+@pytest.mark.parametrize("cursor", MALFORMED_CURSORS)
+@pytest.mark.parametrize(
+    "path", ["/api/v1/product", "/api/v1/product?sort=price", "/api/v1/order"]
+)
+def test_malformed_cursor(client, account, path, cursor):
+    user, _ = account("user", "cursor-user@example.com")
+    separator = "&" if "?" in path else "?"
+    response = client.get(f"{path}{separator}after={cursor}", headers=user)
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def walk(client, path: str, headers: dict, limit: int):
+    """Method to read every page of a list, following the next cursors
+
+    Returns:
+        list: rows of every page, in order
+    """
+    separator = "&" if "?" in path else "?"
+    rows, cursor = [], None
+    while True:
+        after = f"&after={cursor}" if cursor else ""
+        response = client.get(f"{path}{separator}limit={limit}{after}", headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page) <= limit
+        rows += page
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+        assert len(page) == limit
+
+
+@pytest.fixture(scope="module")
+def orders(client, account):
+    user, _ = account("user", "pages-user@example.com")
+    transport, transport_id = account("transport", "pages-transport@example.com")
+    # Repeated prices, so the id breaks the ties of the price sort
+    for number in range(12):
+        product = dict(name=f"page {number}", description="-", price=number % 4 + 1)
+        assert client.post("/api/v1/product", json=product, headers=user).status_code == 201
+    ids = []
+    for _ in range(11):
+        order = dict(items=[1], transport_id=transport_id)
+        assert client.post("/api/v1/order", json=order, headers=user).status_code == 200
+        ids.append(client.get("/api/v1/order?sort=recent&limit=1", headers=user).json()[0]["id"])
+    # Orders on different statuses, for the status sort
+    for id in ids[:4]:
+        assert client.patch(f"/api/v1/order/{id}/advance", headers=transport).status_code == 200
+    for id in ids[4:6]:
+        assert client.patch(f"/api/v1/order/{id}/cancel", headers=transport).status_code == 200
+    return user, transport, ids
+
+
+# The product list has no ids on the response, only the price order is checked
+PRODUCT_LISTS = [
+    ("/api/v1/product", None),
+    ("/api/v1/product?sort=price", lambda product: product["price"]),
+    ("/api/v1/product?sort=price&min_price=2&max_price=3", lambda product: product["price"]),
+    ("/api/v1/product/search?q=page", None),
+]
+ORDER_LISTS = [
+    ("/api/v1/order", lambda order: (order["status"], order["id"])),
+    ("/api/v1/order?sort=recent", lambda order: -order["id"]),
+    ("/api/v1/order?status=0", lambda order: order["id"]),
+    ("/api/v1/order?include_archived=true", lambda order: (order["status"], order["id"])),
+]
+
+
+@pytest.mark.parametrize("limit", [1, 3, 5])
+@pytest.mark.parametrize("path, key", PRODUCT_LISTS + ORDER_LISTS)
+def test_pages_round_trip(client, orders, path, key, limit):
+    user, transport, _ = orders
+    for headers in (user, transport) if "/order" in path else (user,):
+        rows = walk(client, path, headers, limit)
+        separator = "&" if "?" in path else "?"
+        whole = client.get(f"{path}{separator}limit=200", headers=headers).json()
+        # Every row once, in the order of a single page
+        assert rows == whole
+        assert len({repr(sorted(row.items())) for row in rows}) == len(rows)
+        if key is not None:
+            assert rows == sorted(rows, key=key)
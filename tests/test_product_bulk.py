@@ -0,0 +1,46 @@
+"""Invalid rows of the bulk product import are reported per line"""
+
+
+def test_invalid_utf8_line_is_reported(client, account):
+    user, _ = account("user", "bulk-user@example.com")
+    body = (
+        b'{"name": "first", "description": "-", "price": 1}\n'
+        b'{"name": "caf\xe9", "description": "-", "price": 2}\n'
+        b'{"name": "third", "description": "-", "price": "x"}\n'
+        b'{"name": "fourth", "description": "-", "price": 4}\n'
+    )
+    response = client.post(
+        "/api/v1/product/bulk",
+        content=body,
+        headers={**user, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["inserted"], result["updated"], result["failed"]) == (2, 0, 2)
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+    assert result["errors"][0]["error"].startswith("invalid UTF-8")
+
+
+def test_duplicate_ids_are_reported(client, account):
+    user, _ = account("user", "bulk-user@example.com")
+    lines = [
+        '{"id": 9001, "name": "new", "description": "-", "price": 1}',
+        '{"id": 9001, "name": "new again", "description": "-", "price": 2}',
+        '{"name": "other", "description": "-", "price": 3}',
+        '{"id": 9001, "name": "new last", "description": "-", "price": 4}',
+    ]
+    response = client.post(
+        "/api/v1/product/bulk",
+        content="\n".join(lines),
+        headers={**user, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()
+    # Every line is counted once
+    assert result["inserted"] + result["updated"] + result["failed"] == len(lines)
+    assert (result["inserted"], result["failed"]) == (2, 2)
+    assert sorted(error["line"] for error in result["errors"]) == [1, 2]
+    assert {error["error"] for error in result["errors"]} == {
+        "duplicate id in batch, last row kept"
+    }
+    assert client.get("/api/v1/product/9001", headers=user).json()["name"] == "new last"
@@ -0,0 +1,19 @@
+"""Query plans of every endpoint, see benchmarks/query_plans.py: runs on its
+own interpreter, as it builds the app on its own temporary database"""
+
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_query_plans_have_no_regressions():
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "query_plans.py")],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout[-4000:] + result.stderr[-4000:]
+    assert "0 regressions" in result.stdout
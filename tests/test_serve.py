@@ -0,0 +1,20 @@
+"""The bcrypt processes of the host are divided between the workers of serve.py"""
+
+import os
+
+import serve
+
+
+def test_password_workers_divided(monkeypatch):
+    monkeypatch.delenv("PASSWORD_HASH_WORKERS", raising=False)
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    assert serve.share_password_workers(4) == 2
+    assert os.environ["PASSWORD_HASH_WORKERS"] == "2"
+
+    monkeypatch.delenv("PASSWORD_HASH_WORKERS")
+    assert serve.share_password_workers(16) == 1
+
+
+def test_password_workers_configured(monkeypatch):
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "3")
+    assert serve.share_password_workers(4) == 3